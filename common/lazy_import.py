@@ -0,0 +1,26 @@
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+  """Placeholder in sys.modules, replaced by the real module on first attribute access."""
+  def __getattr__(self, attr):
+    module = sys.modules.get(self.__name__)
+    if module is self or module is None:
+      sys.modules.pop(self.__name__, None)
+      module = importlib.import_module(self.__name__)
+    return getattr(module, attr)
+
+
+def lazy_import(name):
+  """Defers executing the module name until one of its attributes is first used.
+
+     `import name` elsewhere gets a placeholder without executing the module. importlib.util.LazyLoader
+     can't be used for this, its modules are executed by the next import statement that finds them.
+     Does nothing if the module is already imported or can't be found.
+  """
+  if name in sys.modules or importlib.util.find_spec(name) is None:
+    return
+  sys.modules[name] = _LazyModule(name)
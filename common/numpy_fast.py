@@ -1,3 +1,7 @@
+from bisect import bisect_left
+import numpy as np
+
+
 def int_rnd(x):
   return int(round(x))
 
@@ -8,9 +12,8 @@ def interp(x, xp, fp):
   N = len(xp)
 
   def get_interp(xv):
-    hi = 0
-    while hi < N and xv > xp[hi]:
-      hi += 1
+    # first breakpoint at or above xv, xp must be increasing
+    hi = bisect_left(xp, xv)
     low = hi - 1
     return fp[-1] if hi == N and xv > xp[low] else (
       fp[0] if hi == 0 else
@@ -20,3 +23,33 @@ def interp(x, xp, fp):
 
 def mean(x):
   return sum(x) / len(x)
+
+
+class Interp():
+  """interp() with fixed breakpoints, precomputed once for lookup tables evaluated every frame.
+
+     Same results as interp(x, xp, fp) for scalars and lists, batch() interpolates arrays.
+  """
+  def __init__(self, xp, fp):
+    self.xp = tuple(float(v) for v in xp)
+    self.fp = tuple(float(v) for v in fp)
+    self.dxp = tuple(hi - lo for lo, hi in zip(self.xp, self.xp[1:]))
+    self.dfp = tuple(hi - lo for lo, hi in zip(self.fp, self.fp[1:]))
+    self.xp_array = np.array(self.xp)
+    self.fp_array = np.array(self.fp)
+
+  def _get(self, xv):
+    xp = self.xp
+    hi = bisect_left(xp, xv)
+    if hi == 0:
+      return self.fp[0]
+    if hi == len(xp):
+      return self.fp[-1]
+    low = hi - 1
+    return (xv - xp[low]) * self.dfp[low] / self.dxp[low] + self.fp[low]
+
+  def __call__(self, x):
+    return [self._get(v) for v in x] if hasattr(x, '__iter__') else self._get(x)
+
+  def batch(self, x):
+    return np.interp(x, self.xp_array, self.fp_array)
@@ -1,45 +1,156 @@
+import math
 import time
+from contextlib import contextmanager
+
+# log spaced buckets from 1us to 10s, 20 per decade
+HIST_MIN = 1e-6
+HIST_BUCKETS_PER_DECADE = 20
+HIST_BUCKETS = 7 * HIST_BUCKETS_PER_DECADE + 1
+
+PUBLISH_INTERVAL = 60.  # seconds
+
+
+class Histogram():
+  """Durations in fixed log spaced buckets, percentiles are accurate to a bucket (~12%)."""
+  def __init__(self):
+    self.counts = [0] * HIST_BUCKETS
+    self.count = 0
+    self.total = 0.
+    self.max = 0.
+
+  def add(self, dt):
+    if dt <= HIST_MIN:
+      idx = 0
+    else:
+      idx = min(int(math.log10(dt / HIST_MIN) * HIST_BUCKETS_PER_DECADE) + 1, HIST_BUCKETS - 1)
+    self.counts[idx] += 1
+    self.count += 1
+    self.total += dt
+    if dt > self.max:
+      self.max = dt
+
+  def percentile(self, p):
+    if self.count == 0:
+      return 0.
+    target = p / 100. * self.count
+    seen = 0
+    for idx, cnt in enumerate(self.counts):
+      seen += cnt
+      if seen >= target and cnt > 0:
+        # upper edge of the bucket, never more than the largest sample
+        return min(HIST_MIN * 10 ** (idx / HIST_BUCKETS_PER_DECADE), self.max)
+    return self.max
+
+  def summary(self):
+    return {
+      'count': self.count,
+      'p50_ms': self.percentile(50) * 1e3,
+      'p99_ms': self.percentile(99) * 1e3,
+      'max_ms': self.max * 1e3,
+      'total_ms': self.total * 1e3,
+    }
+
 
 class Profiler():
-  def __init__(self, enabled=False):
-    self.enabled = enabled
-    self.cp = {}
-    self.cp_ignored = []
-    self.iter = 0
-    self.start_time = time.time()
-    self.last_time = self.start_time
-    self.tot = 0.
+  """Named spans of a process loop with their duration distributions.
+
+     checkpoint(name) ends the span `name` that started at the previous checkpoint, span(name)
+     times a block. end_iteration() records the whole loop iteration against the budget, and
+     every publish_interval seconds logs a summary as a "profile" swaglog event.
+  """
+  def __init__(self, enabled=False, name=None, budget=None, publish_interval=PUBLISH_INTERVAL):
+    self.name = name
+    self.budget = budget
+    self.publish_interval = publish_interval
+    self.reset(enabled)
 
   def reset(self, enabled=False):
     self.enabled = enabled
-    self.cp = {}
+    self.spans = {}
     self.cp_ignored = []
+    self.iteration = Histogram()
+    self.over_budget = 0
     self.iter = 0
-    self.start_time = time.time()
+    self.start_time = time.monotonic()
     self.last_time = self.start_time
+    self.iter_start = self.start_time
+    self.last_publish = self.start_time
+    self.tot = 0.
+
+  def _record(self, name, dt):
+    hist = self.spans.get(name)
+    if hist is None:
+      hist = self.spans[name] = Histogram()
+    hist.add(dt)
 
   def checkpoint(self, name, ignore=False):
     # ignore flag needed when benchmarking threads with ratekeeper
     if not self.enabled:
       return
-    tt = time.time()
-    if name not in self.cp:
-      self.cp[name] = 0.
-      if ignore:
+    tt = time.monotonic()
+    if ignore:
+      if name not in self.cp_ignored:
         self.cp_ignored.append(name)
-    self.cp[name] += tt - self.last_time
-    if not ignore:
+      # time waiting for the next iteration isn't part of it
+      self.iter_start = tt
+    else:
       self.tot += tt - self.last_time
+    self._record(name, tt - self.last_time)
     self.last_time = tt
 
-  def display(self):
+  @contextmanager
+  def span(self, name):
     if not self.enabled:
+      yield
       return
+    t = time.monotonic()
+    try:
+      yield
+    finally:
+      self._record(name, time.monotonic() - t)
+
+  def end_iteration(self):
+    if not self.enabled:
+      return
+    tt = time.monotonic()
+    dt = tt - self.iter_start
+    self.iteration.add(dt)
+    if self.budget is not None and dt > self.budget:
+      self.over_budget += 1
     self.iter += 1
+    self.iter_start = tt
+
+    if tt - self.last_publish > self.publish_interval:
+      self.publish()
+
+  def report(self):
+    ret = {
+      'iteration': self.iteration.summary(),
+      'spans': {name: hist.summary() for name, hist in self.spans.items()},
+    }
+    if self.budget is not None:
+      ret['budget_ms'] = self.budget * 1e3
+      ret['over_budget'] = self.over_budget
+    return ret
+
+  def publish(self):
+    """Logs the spans since the last publish and starts over."""
+    from selfdrive.swaglog import cloudlog
+    cloudlog.event("profile", proc=self.name, **self.report())
+
+    enabled = self.enabled
+    self.reset(enabled)
+
+  def display(self):
+    if not self.enabled:
+      return
+    iters = max(self.iter, 1)
     print("******* Profiling %d *******" % self.iter)
-    for n, ms in sorted(self.cp.items(), key=lambda x: -x[1]):
+    for n, hist in sorted(self.spans.items(), key=lambda x: -x[1].total):
+      ms = hist.total
+      line = "%30s: %9.2f  avg: %7.2f  percent: %3.0f  p50: %7.2f  p99: %7.2f" % \
+             (n, ms*1000.0, ms*1000.0/iters, ms/max(self.tot, 1e-9)*100, hist.percentile(50)*1e3, hist.percentile(99)*1e3)
       if n in self.cp_ignored:
-        print("%30s: %9.2f  avg: %7.2f  percent: %3.0f   IGNORED" % (n, ms*1000.0, ms*1000.0/self.iter, ms/self.tot*100))
-      else:
-        print("%30s: %9.2f  avg: %7.2f  percent: %3.0f" % (n, ms*1000.0, ms*1000.0/self.iter, ms/self.tot*100))
-    print("Iter clock: %2.6f   TOTAL: %2.2f" % (self.tot/self.iter, self.tot))
+        line += "   IGNORED"
+      print(line)
+    print("Iter clock: %2.6f   TOTAL: %2.2f" % (self.tot/iters, self.tot))
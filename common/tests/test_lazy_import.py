@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from common.lazy_import import lazy_import
+
+
+class TestLazyImport(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+    with open(os.path.join(self.tmp.name, "lazy_import_test_mod.py"), "w") as f:
+      f.write("import sys\nsys.lazy_import_test_executed = True\nX = 1\n")
+    sys.path.insert(0, self.tmp.name)
+
+  def tearDown(self):
+    sys.path.remove(self.tmp.name)
+    sys.modules.pop("lazy_import_test_mod", None)
+    sys.__dict__.pop("lazy_import_test_executed", None)
+    self.tmp.cleanup()
+
+  def test_deferred_until_used(self):
+    lazy_import("lazy_import_test_mod")
+    import lazy_import_test_mod
+    self.assertFalse(hasattr(sys, "lazy_import_test_executed"))
+
+    self.assertEqual(lazy_import_test_mod.X, 1)
+    self.assertTrue(sys.lazy_import_test_executed)
+    import lazy_import_test_mod as mod
+    self.assertIs(mod, sys.modules["lazy_import_test_mod"])
+    self.assertIsNot(mod, lazy_import_test_mod)
+
+  def test_missing_module(self):
+    lazy_import("not_a_module_anywhere")
+    self.assertNotIn("not_a_module_anywhere", sys.modules)
+
+
+if __name__ == "__main__":
+  unittest.main()
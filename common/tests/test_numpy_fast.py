@@ -1,7 +1,24 @@
+import time
 import numpy as np
 import unittest
 
-from common.numpy_fast import interp
+from common.numpy_fast import interp, Interp
+
+
+def interp_linear(x, xp, fp):
+  """interp() as it was, scanning the breakpoints one by one."""
+  N = len(xp)
+
+  def get_interp(xv):
+    hi = 0
+    while hi < N and xv > xp[hi]:
+      hi += 1
+    low = hi - 1
+    return fp[-1] if hi == N and xv > xp[low] else (
+      fp[0] if hi == 0 else
+      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+
+  return [get_interp(v) for v in x] if hasattr(x, '__iter__') else get_interp(x)
 
 
 class InterpTest(unittest.TestCase):
@@ -21,6 +38,49 @@ class InterpTest(unittest.TestCase):
       actual = interp(v_ego, _A_CRUISE_MIN_BP, _A_CRUISE_MIN_V)
       np.testing.assert_equal(actual, expected)
 
+  def test_equivalence(self):
+    np.random.seed(0)
+    for _ in range(1000):
+      n = np.random.randint(1, 10)
+      xp = np.sort(np.random.uniform(-50., 50., n))
+      if n > 2 and np.random.rand() > 0.8:
+        xp[1] = xp[0]  # repeated breakpoints
+      xp = xp.tolist()
+      fp = np.random.uniform(-5., 5., n).tolist()
+      x = np.random.uniform(-60., 60., 20).tolist() + xp + [float('nan')]
+
+      expected = interp_linear(x, xp, fp)
+      np.testing.assert_equal(interp(x, xp, fp), expected)
+      np.testing.assert_equal(Interp(xp, fp)(x), expected)
+      for xv, exp in zip(x, expected):
+        np.testing.assert_equal(Interp(xp, fp)(xv), exp)
+
+      # np.interp picks a different side of repeated breakpoints
+      finite = np.isfinite(x) & ~np.isin(x, xp[:1] if xp[:1] == xp[1:2] else [])
+      np.testing.assert_allclose(Interp(xp, fp).batch(np.array(x)[finite]), np.array(expected)[finite], rtol=1e-12, atol=1e-12)
+
+  def test_benchmark(self):
+    xp = [0., 5., 10., 20., 40., 60., 80., 100.]
+    fp = [-1.0, -.8, -.67, -.5, -.30, -.2, -.1, 0.]
+    table = Interp(xp, fp)
+    x = np.random.uniform(-10., 110., 10000).tolist()
+
+    t = time.perf_counter()
+    expected = [interp_linear(xv, xp, fp) for xv in x]
+    t_linear = time.perf_counter() - t
+
+    t = time.perf_counter()
+    actual = [table(xv) for xv in x]
+    t_table = time.perf_counter() - t
+
+    t = time.perf_counter()
+    batch = table.batch(np.array(x))
+    t_batch = time.perf_counter() - t
+
+    np.testing.assert_equal(actual, expected)
+    np.testing.assert_allclose(batch, expected, rtol=1e-12, atol=1e-12)
+    print(f"interp of {len(x)} points: {t_linear*1e3:.2f} ms linear scan, {t_table*1e3:.2f} ms Interp, {t_batch*1e3:.2f} ms batch")
+
 
 if __name__ == "__main__":
   unittest.main()
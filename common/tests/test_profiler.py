@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+
+from common.profiler import Histogram, Profiler
+
+
+class TestProfiler(unittest.TestCase):
+  def test_histogram_percentiles(self):
+    hist = Histogram()
+    for i in range(1, 1001):
+      hist.add(i * 1e-5)
+
+    self.assertEqual(hist.count, 1000)
+    self.assertAlmostEqual(hist.max, 1e-2)
+    for p in (1, 50, 90, 99):
+      exact = p * 1e-5 * 10
+      self.assertGreaterEqual(hist.percentile(p), exact)
+      self.assertLess(hist.percentile(p), exact * 1.13)
+    self.assertEqual(hist.percentile(100), hist.max)
+
+  @mock.patch("common.profiler.time.monotonic")
+  def test_budget(self, monotonic):
+    monotonic.return_value = 0.
+    prof = Profiler(True, name="test", budget=0.01, publish_interval=1e9)
+    for i in range(10):
+      monotonic.return_value += 1.  # waiting for the next iteration
+      prof.checkpoint("Wait", ignore=True)
+      monotonic.return_value += 0.02 if i % 5 == 0 else 0.005
+      prof.checkpoint("Work")
+      prof.end_iteration()
+
+    report = prof.report()
+    self.assertEqual(report['over_budget'], 2)
+    self.assertEqual(report['iteration']['count'], 10)
+    self.assertAlmostEqual(report['iteration']['max_ms'], 20.)
+    self.assertAlmostEqual(report['spans']['Work']['total_ms'], 80.)
+    self.assertAlmostEqual(report['spans']['Wait']['total_ms'], 10000.)
+
+  def test_disabled(self):
+    prof = Profiler(False)
+    prof.checkpoint("Work")
+    with prof.span("Block"):
+      pass
+    prof.end_iteration()
+    self.assertEqual(prof.report()['spans'], {})
+    self.assertEqual(prof.iter, 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
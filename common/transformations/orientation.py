@@ -1,46 +1,38 @@
 # pylint: skip-file
 import numpy as np
 
-from common.transformations.transformations import (ecef_euler_from_ned_single,
-                                                    euler2quat_single,
-                                                    euler2rot_single,
-                                                    ned_euler_from_ecef_single,
-                                                    quat2euler_single,
-                                                    quat2rot_single,
-                                                    rot2euler_single,
-                                                    rot2quat_single)
-
-
-def numpy_wrap(function, input_shape, output_shape):
-  """Wrap a function to take either an input or list of inputs and return the correct shape"""
+from common.transformations.transformations import (ecef_euler_from_ned_batch,
+                                                    euler2quat_batch,
+                                                    euler2rot_batch,
+                                                    ned_euler_from_ecef_batch,
+                                                    quat2euler_batch,
+                                                    quat2rot_batch,
+                                                    rot2euler_batch,
+                                                    rot2quat_batch)
+
+
+def batch_wrap(function, input_shape):
+  """Wrap a function of an N x input array to take either an input or list of inputs and return the correct shape"""
   def f(*inps):
     *args, inp = inps
-    inp = np.array(inp)
-    shape = inp.shape
-
-    if len(shape) == len(input_shape):
-      out_shape = output_shape
-    else:
-      out_shape = (shape[0],) + output_shape
-
-    # Add empty dimension if inputs is not a list
-    if len(shape) == len(input_shape):
-      inp.shape = (1, ) + inp.shape
+    inp = np.asarray(inp, dtype=np.float64)
+    if inp.ndim not in (len(input_shape), len(input_shape) + 1) or inp.shape[-len(input_shape):] != input_shape:
+      raise ValueError(f"expected an input of shape {input_shape} or a list of them, got {inp.shape}")
+    batch = np.ascontiguousarray(inp.reshape((-1,) + input_shape))
 
-    result = np.asarray([function(*args, i) for i in inp])
-    result.shape = out_shape
-    return result
+    result = function(*args, batch)
+    return result[0] if inp.ndim == len(input_shape) else result
   return f
 
 
-euler2quat = numpy_wrap(euler2quat_single, (3,), (4,))
-quat2euler = numpy_wrap(quat2euler_single, (4,), (3,))
-quat2rot = numpy_wrap(quat2rot_single, (4,), (3, 3))
-rot2quat = numpy_wrap(rot2quat_single, (3, 3), (4,))
-euler2rot = numpy_wrap(euler2rot_single, (3,), (3, 3))
-rot2euler = numpy_wrap(rot2euler_single, (3, 3), (3,))
-ecef_euler_from_ned = numpy_wrap(ecef_euler_from_ned_single, (3,), (3,))
-ned_euler_from_ecef = numpy_wrap(ned_euler_from_ecef_single, (3,), (3,))
+euler2quat = batch_wrap(euler2quat_batch, (3,))
+quat2euler = batch_wrap(quat2euler_batch, (4,))
+quat2rot = batch_wrap(quat2rot_batch, (4,))
+rot2quat = batch_wrap(rot2quat_batch, (3, 3))
+euler2rot = batch_wrap(euler2rot_batch, (3,))
+rot2euler = batch_wrap(rot2euler_batch, (3, 3))
+ecef_euler_from_ned = batch_wrap(ecef_euler_from_ned_batch, (3,))
+ned_euler_from_ecef = batch_wrap(ned_euler_from_ecef_batch, (3,))
 
 quats_from_rotations = rot2quat
 quat_from_rot = rot2quat
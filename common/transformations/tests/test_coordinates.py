@@ -4,6 +4,7 @@ import numpy as np
 import unittest
 
 import common.transformations.coordinates as coord
+from common.transformations.transformations import ecef2geodetic_single
 
 geodetic_positions = np.array([[37.7610403, -122.4778699, 115],
                                  [27.4840915, -68.5867592, 2380],
@@ -105,5 +106,36 @@ class TestNED(unittest.TestCase):
     np.testing.assert_allclose(converter.ned2ecef(ned_offsets_batch),
                                                            ecef_positions_offset_batch,
                                                            rtol=1e-9, atol=1e-7)
+
+  def test_batch_matches_single(self):
+    np.random.seed(0)
+    ecef = ecef_init_batch + np.random.normal(scale=1000., size=(100, 3))
+    converter = coord.LocalCoord.from_ecef(ecef_init_batch)
+
+    geodetic = coord.ecef2geodetic(ecef)
+    np.testing.assert_equal(geodetic, [ecef2geodetic_single(e) for e in ecef])
+    np.testing.assert_equal(converter.ecef2ned(ecef), [converter.ecef2ned_single(e) for e in ecef])
+    np.testing.assert_equal(coord.geodetic2ecef(geodetic[0]), coord.geodetic2ecef(geodetic[:1])[0])
+    self.assertEqual(coord.ecef2geodetic(np.zeros((0, 3))).shape, (0, 3))
+
+  def test_read_only_input(self):
+    ecef = np.array(ecef_positions)
+    ecef.setflags(write=False)
+    geodetic = np.array(geodetic_positions, dtype=np.float64)
+    geodetic.setflags(write=False)
+    converter = coord.LocalCoord.from_ecef(ecef_init_batch)
+    ned = converter.ecef2ned(ecef_positions)
+    ned.setflags(write=False)
+
+    np.testing.assert_equal(coord.ecef2geodetic(ecef), coord.ecef2geodetic(ecef_positions))
+    np.testing.assert_equal(coord.geodetic2ecef(geodetic), coord.geodetic2ecef(geodetic_positions))
+    np.testing.assert_equal(converter.ecef2ned(ecef), converter.ecef2ned(ecef_positions))
+    np.testing.assert_equal(converter.ned2ecef(ned), converter.ned2ecef(ned.copy()))
+    np.testing.assert_equal(converter.geodetic2ned(geodetic), converter.geodetic2ned(geodetic_positions))
+    np.testing.assert_equal(converter.ned2geodetic(ned), converter.ned2geodetic(ned.copy()))
+    np.testing.assert_equal(coord.ecef2geodetic(np.frombuffer(ecef_positions.tobytes()).reshape(-1, 3)),
+                            coord.ecef2geodetic(ecef_positions))
+
+
 if __name__ == "__main__":
   unittest.main()
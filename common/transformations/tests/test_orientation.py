@@ -5,7 +5,8 @@ import unittest
 
 from common.transformations.orientation import euler2quat, quat2euler, euler2rot, rot2euler, \
                                                rot2quat, quat2rot, \
-                                               ned_euler_from_ecef
+                                               ecef_euler_from_ned, ned_euler_from_ecef
+from common.transformations.transformations import quat2euler_single, quat2rot_single, rot2quat_single
 
 eulers = np.array([[ 1.46520501,  2.78688383,  2.92780854],
        [ 4.86909526,  3.60618161,  4.30648981],
@@ -63,6 +64,44 @@ class TestOrientation(unittest.TestCase):
       #np.testing.assert_allclose(eulers[i], ecef_euler_from_ned(ecef_positions[i], ned_eulers[i]), rtol=1e-7)
     # np.testing.assert_allclose(ned_eulers, ned_euler_from_ecef(ecef_positions, eulers), rtol=1e-7)
 
+  def test_input_shape(self):
+    with self.assertRaises(ValueError):
+      euler2rot(np.zeros(6))
+    with self.assertRaises(ValueError):
+      rot2euler(np.zeros((2, 3)))
+    with self.assertRaises(ValueError):
+      quat2euler(np.zeros((2, 2, 4)))
+
+  def test_batch_matches_single(self):
+    np.random.seed(0)
+    batch_quats = np.random.normal(size=(100, 4))
+    batch_quats /= np.linalg.norm(batch_quats, axis=1, keepdims=True)
+
+    for batched, single in ((quat2euler, quat2euler_single), (quat2rot, quat2rot_single)):
+      np.testing.assert_equal(batched(batch_quats), [single(q) for q in batch_quats])
+
+    rots = quat2rot(batch_quats)
+    np.testing.assert_equal(rot2quat(rots), [rot2quat_single(r) for r in rots])
+
+  def test_read_only_input(self):
+    def read_only(a):
+      a = np.array(a)
+      a.setflags(write=False)
+      return a
+
+    rots = euler2rot(eulers)
+    np.testing.assert_equal(euler2quat(read_only(eulers)), euler2quat(eulers))
+    np.testing.assert_equal(quat2euler(read_only(quats)), quat2euler(quats))
+    np.testing.assert_equal(quat2rot(read_only(quats)), quat2rot(quats))
+    np.testing.assert_equal(euler2rot(read_only(eulers)), rots)
+    np.testing.assert_equal(rot2quat(read_only(rots)), rot2quat(rots))
+    np.testing.assert_equal(rot2euler(read_only(rots)), rot2euler(rots))
+    np.testing.assert_equal(ned_euler_from_ecef(ecef_positions[0], read_only(eulers[0])), ned_euler_from_ecef(ecef_positions[0], eulers[0]))
+    np.testing.assert_equal(ecef_euler_from_ned(ecef_positions[0], read_only(ned_eulers[0])), ecef_euler_from_ned(ecef_positions[0], ned_eulers[0]))
+
+    # like an array backed by a message or file buffer
+    np.testing.assert_equal(quat2euler(np.frombuffer(quats.tobytes()).reshape(-1, 4)), quat2euler(quats))
+
 
 if __name__ == "__main__":
   unittest.main()
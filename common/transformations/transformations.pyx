@@ -112,6 +112,165 @@ def ecef2geodetic_single(ecef):
     return [g.lat, g.lon, g.alt]
 
 
+# Batched versions of the functions above, an N x input array in and an N x output array out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def euler2quat_batch(const double[:, :] euler):
+    cdef Py_ssize_t i, n = euler.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 4))
+    cdef Quaternion q
+    for i in range(n):
+        q = euler2quat_c(Vector3(euler[i, 0], euler[i, 1], euler[i, 2]))
+        out[i, 0] = q.w()
+        out[i, 1] = q.x()
+        out[i, 2] = q.y()
+        out[i, 3] = q.z()
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def quat2euler_batch(const double[:, :] quat):
+    cdef Py_ssize_t i, n = quat.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+    cdef Vector3 e
+    for i in range(n):
+        e = quat2euler_c(Quaternion(quat[i, 0], quat[i, 1], quat[i, 2], quat[i, 3]))
+        out[i, 0] = e(0)
+        out[i, 1] = e(1)
+        out[i, 2] = e(2)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void store_matrix(double[:, :, ::1] out, Py_ssize_t i, Matrix3 m):
+    cdef int j, k
+    for j in range(3):
+        for k in range(3):
+            out[i, j, k] = m(j, k)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Matrix3 load_matrix(const double[:, :, :] rot, Py_ssize_t i):
+    # Eigen matrices are column major
+    cdef double buf[9]
+    cdef int j, k
+    for j in range(3):
+        for k in range(3):
+            buf[k * 3 + j] = rot[i, j, k]
+    return Matrix3(buf)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def quat2rot_batch(const double[:, :] quat):
+    cdef Py_ssize_t i, n = quat.shape[0]
+    out = np.empty((n, 3, 3))
+    cdef double[:, :, ::1] out_v = out
+    for i in range(n):
+        store_matrix(out_v, i, quat2rot_c(Quaternion(quat[i, 0], quat[i, 1], quat[i, 2], quat[i, 3])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rot2quat_batch(const double[:, :, :] rot):
+    cdef Py_ssize_t i, n = rot.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 4))
+    cdef Quaternion q
+    for i in range(n):
+        q = rot2quat_c(load_matrix(rot, i))
+        out[i, 0] = q.w()
+        out[i, 1] = q.x()
+        out[i, 2] = q.y()
+        out[i, 3] = q.z()
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def euler2rot_batch(const double[:, :] euler):
+    cdef Py_ssize_t i, n = euler.shape[0]
+    out = np.empty((n, 3, 3))
+    cdef double[:, :, ::1] out_v = out
+    for i in range(n):
+        store_matrix(out_v, i, euler2rot_c(Vector3(euler[i, 0], euler[i, 1], euler[i, 2])))
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def rot2euler_batch(const double[:, :, :] rot):
+    cdef Py_ssize_t i, n = rot.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+    cdef Vector3 e
+    for i in range(n):
+        e = rot2euler_c(load_matrix(rot, i))
+        out[i, 0] = e(0)
+        out[i, 1] = e(1)
+        out[i, 2] = e(2)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ecef_euler_from_ned_batch(ecef_init, const double[:, :] ned_pose):
+    cdef ECEF init = list2ecef(ecef_init)
+    cdef Py_ssize_t i, n = ned_pose.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+    cdef Vector3 e
+    for i in range(n):
+        e = ecef_euler_from_ned_c(init, Vector3(ned_pose[i, 0], ned_pose[i, 1], ned_pose[i, 2]))
+        out[i, 0] = e(0)
+        out[i, 1] = e(1)
+        out[i, 2] = e(2)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ned_euler_from_ecef_batch(ecef_init, const double[:, :] ecef_pose):
+    cdef ECEF init = list2ecef(ecef_init)
+    cdef Py_ssize_t i, n = ecef_pose.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+    cdef Vector3 e
+    for i in range(n):
+        e = ned_euler_from_ecef_c(init, Vector3(ecef_pose[i, 0], ecef_pose[i, 1], ecef_pose[i, 2]))
+        out[i, 0] = e(0)
+        out[i, 1] = e(1)
+        out[i, 2] = e(2)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def geodetic2ecef_batch(const double[:, :] geodetic):
+    cdef Py_ssize_t i, n = geodetic.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+    cdef Geodetic g
+    cdef ECEF e
+    for i in range(n):
+        g.lat = geodetic[i, 0]
+        g.lon = geodetic[i, 1]
+        g.alt = geodetic[i, 2]
+        g.radians = False
+        e = geodetic2ecef_c(g)
+        out[i, 0] = e.x
+        out[i, 1] = e.y
+        out[i, 2] = e.z
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def ecef2geodetic_batch(const double[:, :] ecef):
+    cdef Py_ssize_t i, n = ecef.shape[0]
+    cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+    cdef ECEF e
+    cdef Geodetic g
+    for i in range(n):
+        e.x = ecef[i, 0]
+        e.y = ecef[i, 1]
+        e.z = ecef[i, 2]
+        g = ecef2geodetic_c(e)
+        out[i, 0] = g.lat
+        out[i, 1] = g.lon
+        out[i, 2] = g.alt
+    return out
+
+
 cdef class LocalCoord:
     cdef LocalCoord_c * lc
 
@@ -170,5 +329,78 @@ cdef class LocalCoord:
         cdef Geodetic g = self.lc.ned2geodetic(n)
         return [g.lat, g.lon, g.alt]
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ecef2ned_batch(self, const double[:, :] ecef):
+        assert self.lc
+        cdef Py_ssize_t i, n = ecef.shape[0]
+        cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+        cdef ECEF e
+        cdef NED r
+        for i in range(n):
+            e.x = ecef[i, 0]
+            e.y = ecef[i, 1]
+            e.z = ecef[i, 2]
+            r = self.lc.ecef2ned(e)
+            out[i, 0] = r.n
+            out[i, 1] = r.e
+            out[i, 2] = r.d
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ned2ecef_batch(self, const double[:, :] ned):
+        assert self.lc
+        cdef Py_ssize_t i, n = ned.shape[0]
+        cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+        cdef NED r
+        cdef ECEF e
+        for i in range(n):
+            r.n = ned[i, 0]
+            r.e = ned[i, 1]
+            r.d = ned[i, 2]
+            e = self.lc.ned2ecef(r)
+            out[i, 0] = e.x
+            out[i, 1] = e.y
+            out[i, 2] = e.z
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def geodetic2ned_batch(self, const double[:, :] geodetic):
+        assert self.lc
+        cdef Py_ssize_t i, n = geodetic.shape[0]
+        cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+        cdef Geodetic g
+        cdef NED r
+        for i in range(n):
+            g.lat = geodetic[i, 0]
+            g.lon = geodetic[i, 1]
+            g.alt = geodetic[i, 2]
+            g.radians = False
+            r = self.lc.geodetic2ned(g)
+            out[i, 0] = r.n
+            out[i, 1] = r.e
+            out[i, 2] = r.d
+        return out
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def ned2geodetic_batch(self, const double[:, :] ned):
+        assert self.lc
+        cdef Py_ssize_t i, n = ned.shape[0]
+        cdef np.ndarray[double, ndim=2] out = np.empty((n, 3))
+        cdef NED r
+        cdef Geodetic g
+        for i in range(n):
+            r.n = ned[i, 0]
+            r.e = ned[i, 1]
+            r.d = ned[i, 2]
+            g = self.lc.ned2geodetic(r)
+            out[i, 0] = g.lat
+            out[i, 1] = g.lon
+            out[i, 2] = g.alt
+        return out
+
     def __dealloc__(self):
         del self.lc
@@ -20,6 +20,7 @@ from selfdrive.controls.lib.latcontrol_lqr import LatControlLQR
 from selfdrive.controls.lib.latcontrol_angle import LatControlAngle
 from selfdrive.controls.lib.events import Events, ET
 from selfdrive.controls.lib.alertmanager import AlertManager
+from selfdrive.controls.lib.message_reuse import ReusedMessage
 from selfdrive.controls.lib.vehicle_model import VehicleModel
 from selfdrive.controls.lib.longitudinal_planner import LON_MPC_STEP
 from selfdrive.locationd.calibrationd import Calibration
@@ -98,6 +99,10 @@ class Controls:
 
     self.CC = car.CarControl.new_message()
     self.AM = AlertManager()
+
+    # controlsState and carControl are written in place every frame
+    self.controls_state_msg = ReusedMessage('controlsState')
+    self.car_control_msg = ReusedMessage('carControl')
     self.events = Events()
 
     self.LoC = LongControl(self.CP, self.CI.compute_gb)
@@ -149,7 +154,7 @@ class Controls:
 
     # controlsd is driven by can recv, expected at 100Hz
     self.rk = Ratekeeper(100, print_delay_threshold=None)
-    self.prof = Profiler(False)  # off by default
+    self.prof = Profiler(True, name="controlsd", budget=DT_CTRL)
 
   def update_events(self, CS):
     """Compute carEvents from carState"""
@@ -431,9 +436,10 @@ class Controls:
   def publish_logs(self, CS, start_time, actuators, v_acc, a_acc, lac_log):
     """Send actuators and hud commands to the car, send controlsstate and MPC logging"""
 
-    CC = car.CarControl.new_message()
+    cc_send = self.car_control_msg.start(CS.canValid)
+    CC = cc_send.carControl
     CC.enabled = self.enabled
-    CC.actuators = actuators
+    self.car_control_msg.copy(CC, 'actuators', actuators)
 
     CC.cruiseControl.override = True
     CC.cruiseControl.cancel = not self.CP.enableCruise or (not self.enabled and CS.cruiseState.enabled)
@@ -459,6 +465,8 @@ class Controls:
     ldw_allowed = self.is_ldw_enabled and CS.vEgo > LDW_MIN_SPEED and not recent_blinker \
                     and not self.active and self.sm['liveCalibration'].calStatus == Calibration.CALIBRATED
 
+    CC.hudControl.leftLaneDepart = False
+    CC.hudControl.rightLaneDepart = False
     meta = self.sm['modelV2'].meta
     if len(meta.desirePrediction) and ldw_allowed:
       l_lane_change_prob = meta.desirePrediction[Desire.laneChangeLeft - 1]
@@ -496,17 +504,16 @@ class Controls:
     angle_steers_des += params.angleOffsetDeg
 
     # controlsState
-    dat = messaging.new_message('controlsState')
-    dat.valid = CS.canValid
+    dat = self.controls_state_msg.start(CS.canValid)
     controlsState = dat.controlsState
-    controlsState.alertText1 = self.AM.alert_text_1
-    controlsState.alertText2 = self.AM.alert_text_2
+    self.controls_state_msg.set_text(controlsState, 'alertText1', self.AM.alert_text_1)
+    self.controls_state_msg.set_text(controlsState, 'alertText2', self.AM.alert_text_2)
     controlsState.alertSize = self.AM.alert_size
     controlsState.alertStatus = self.AM.alert_status
     controlsState.alertBlinkingRate = self.AM.alert_rate
-    controlsState.alertType = self.AM.alert_type
+    self.controls_state_msg.set_text(controlsState, 'alertType', self.AM.alert_type)
     controlsState.alertSound = self.AM.audible_alert
-    controlsState.canMonoTimes = list(CS.canMonoTimes)
+    self.controls_state_msg.set_list(controlsState, 'canMonoTimes', CS.canMonoTimes)
     controlsState.longitudinalPlanMonoTime = self.sm.logMonoTime['longitudinalPlan']
     controlsState.lateralPlanMonoTime = self.sm.logMonoTime['lateralPlan']
     controlsState.enabled = self.enabled
@@ -528,14 +535,15 @@ class Controls:
     controlsState.forceDecel = bool(force_decel)
     controlsState.canErrorCounter = self.can_error_counter
 
+    lateral_control_state = controlsState.lateralControlState
     if self.CP.steerControlType == car.CarParams.SteerControlType.angle:
-      controlsState.lateralControlState.angleState = lac_log
+      self.controls_state_msg.copy(lateral_control_state, 'angleState', lac_log)
     elif self.CP.lateralTuning.which() == 'pid':
-      controlsState.lateralControlState.pidState = lac_log
+      self.controls_state_msg.copy(lateral_control_state, 'pidState', lac_log)
     elif self.CP.lateralTuning.which() == 'lqr':
-      controlsState.lateralControlState.lqrState = lac_log
+      self.controls_state_msg.copy(lateral_control_state, 'lqrState', lac_log)
     elif self.CP.lateralTuning.which() == 'indi':
-      controlsState.lateralControlState.indiState = lac_log
+      self.controls_state_msg.copy(lateral_control_state, 'indiState', lac_log)
     self.pm.send('controlsState', dat)
 
     # carState
@@ -560,13 +568,10 @@ class Controls:
       self.pm.send('carParams', cp_send)
 
     # carControl
-    cc_send = messaging.new_message('carControl')
-    cc_send.valid = CS.canValid
-    cc_send.carControl = CC
     self.pm.send('carControl', cc_send)
 
-    # copy CarControl to pass to CarInterface on the next iteration
-    self.CC = CC
+    # copy CarControl to pass to CarInterface on the next iteration, CC is rewritten next frame
+    self.CC = CC.copy()
 
   def step(self):
     start_time = sec_since_boot()
@@ -595,8 +600,8 @@ class Controls:
   def controlsd_thread(self):
     while True:
       self.step()
+      self.prof.end_iteration()
       self.rk.monitor_time()
-      self.prof.display()
 
 def main(sm=None, pm=None, logcan=None):
   controls = Controls(sm, pm, logcan)
@@ -38,10 +38,22 @@ EVENT_NAME = {v: k for k, v in EventName.schema.enumerants.items()}
 
 
 class Events:
+  """Active events of one frame.
+
+     Kept as a list (in insertion order, for alerts and logging) plus a bitset indexed by
+     EventName, so the per-frame event type checks are integer ANDs instead of scans of EVENTS.
+  """
   def __init__(self):
     self.events = []
     self.static_events = []
-    self.events_prev = dict.fromkeys(EVENTS.keys(), 0)
+    # consecutive frames each active event has been active for, inactive ones are absent
+    self.events_prev = {}
+    self.mask = 0
+    self.static_mask = 0
+    self._msg_events = None
+    self._msg = []
+    # CarEvent builders by event name, owned by this instance
+    self._car_events = {}
 
   @property
   def names(self):
@@ -53,32 +65,36 @@ class Events:
   def add(self, event_name, static=False):
     if static:
       self.static_events.append(event_name)
+      self.static_mask |= 1 << event_name
     self.events.append(event_name)
+    self.mask |= 1 << event_name
 
   def clear(self):
-    self.events_prev = {k: (v+1 if k in self.events else 0) for k, v in self.events_prev.items()}
+    events_prev = self.events_prev
+    self.events_prev = {e: events_prev.get(e, 0) + 1 for e in self.events}
     self.events = self.static_events.copy()
+    self.mask = self.static_mask
 
   def any(self, event_type):
-    for e in self.events:
-      if event_type in EVENTS.get(e, {}).keys():
-        return True
-    return False
+    return (self.mask & EVENT_TYPE_MASKS[event_type]) != 0
 
   def create_alerts(self, event_types, callback_args=None):
     if callback_args is None:
       callback_args = []
 
     ret = []
+    if not any(self.mask & EVENT_TYPE_MASKS[et] for et in event_types):
+      return ret
+
     for e in self.events:
-      types = EVENTS[e].keys()
+      alerts = EVENTS.get(e, {})
       for et in event_types:
-        if et in types:
-          alert = EVENTS[e][et]
+        alert = alerts.get(et)
+        if alert is not None:
           if not isinstance(alert, Alert):
             alert = alert(*callback_args)
 
-          if DT_CTRL * (self.events_prev[e] + 1) >= alert.creation_delay:
+          if DT_CTRL * (self.events_prev.get(e, 0) + 1) >= alert.creation_delay:
             alert.alert_type = f"{EVENT_NAME[e]}/{et}"
             alert.event_type = et
             ret.append(alert)
@@ -86,17 +102,22 @@ class Events:
 
   def add_from_msg(self, events):
     for e in events:
-      self.events.append(e.name.raw)
+      self.add(e.name.raw)
 
   def to_msg(self):
-    ret = []
-    for event_name in self.events:
-      event = car.CarEvent.new_message()
-      event.name = event_name
-      for event_type in EVENTS.get(event_name, {}).keys():
-        setattr(event, event_type , True)
-      ret.append(event)
-    return ret
+    """Returns the events as car.CarEvent builders. The list is reused while the events don't
+       change, so it must not be modified."""
+    if self.events != self._msg_events:
+      self._msg = [self._car_event(e) for e in self.events]
+      self._msg_events = self.events.copy()
+    return self._msg
+
+  def _car_event(self, event_name):
+    event = self._car_events.get(event_name)
+    if event is None:
+      event = car_event(event_name)
+      self._car_events[event_name] = event
+    return event
 
 class Alert:
   def __init__(self,
@@ -752,3 +773,24 @@ EVENTS: Dict[int, Dict[str, Union[Alert, Callable[[Any, messaging.SubMaster, boo
   },
 
 }
+
+
+def _event_type_masks():
+  masks = {et: 0 for name, et in vars(ET).items() if not name.startswith('_')}
+  for e, alerts in EVENTS.items():
+    for et in alerts.keys():
+      masks[et] |= 1 << e
+  return masks
+
+
+# bitset of the events that have each event type
+EVENT_TYPE_MASKS = _event_type_masks()
+
+
+def car_event(event_name):
+  """Returns a new car.CarEvent builder of event_name, with its event types set."""
+  event = car.CarEvent.new_message()
+  event.name = event_name
+  for event_type in EVENTS.get(event_name, {}).keys():
+    setattr(event, event_type, True)
+  return event
@@ -1,5 +1,5 @@
 from cereal import log
-from common.numpy_fast import clip, interp
+from common.numpy_fast import clip, Interp
 from selfdrive.controls.lib.pid import PIController
 
 LongCtrlState = log.ControlsState.LongControlState
@@ -61,6 +61,10 @@ class LongControl():
     self.v_pid = 0.0
     self.last_output_gb = 0.0
 
+    self.gas_max = Interp(CP.gasMaxBP, CP.gasMaxV)
+    self.brake_max = Interp(CP.brakeMaxBP, CP.brakeMaxV)
+    self.deadzone = Interp(CP.longitudinalTuning.deadzoneBP, CP.longitudinalTuning.deadzoneV)
+
   def reset(self, v_pid):
     """Reset PID controller and change setpoint"""
     self.pid.reset()
@@ -69,8 +73,8 @@ class LongControl():
   def update(self, active, CS, v_target, v_target_future, a_target, CP):
     """Update longitudinal control. This updates the state machine and runs a PID loop"""
     # Actuation limits
-    gas_max = interp(CS.vEgo, CP.gasMaxBP, CP.gasMaxV)
-    brake_max = interp(CS.vEgo, CP.brakeMaxBP, CP.brakeMaxV)
+    gas_max = self.gas_max(CS.vEgo)
+    brake_max = self.brake_max(CS.vEgo)
 
     # Update state machine
     output_gb = self.last_output_gb
@@ -93,7 +97,7 @@ class LongControl():
       # Toyota starts braking more when it thinks you want to stop
       # Freeze the integrator so we don't accelerate to compensate, and don't allow positive acceleration
       prevent_overshoot = not CP.stoppingControl and CS.vEgo < 1.5 and v_target_future < 0.7
-      deadzone = interp(v_ego_pid, CP.longitudinalTuning.deadzoneBP, CP.longitudinalTuning.deadzoneV)
+      deadzone = self.deadzone(v_ego_pid)
 
       output_gb = self.pid.update(self.v_pid, v_ego_pid, speed=v_ego_pid, deadzone=deadzone, feedforward=a_target, freeze_integrator=prevent_overshoot)
 
@@ -2,7 +2,7 @@
 import math
 import numpy as np
 from common.params import Params
-from common.numpy_fast import interp
+from common.numpy_fast import Interp
 
 import cereal.messaging as messaging
 from common.realtime import sec_since_boot
@@ -32,14 +32,19 @@ _A_CRUISE_MAX_BP = [0.,  6.4, 22.5, 40.]
 _A_TOTAL_MAX_V = [1.7, 3.2]
 _A_TOTAL_MAX_BP = [20., 40.]
 
+_a_cruise_min = Interp(_A_CRUISE_MIN_BP, _A_CRUISE_MIN_V)
+_a_cruise_max = Interp(_A_CRUISE_MAX_BP, _A_CRUISE_MAX_V)
+_a_cruise_max_following = Interp(_A_CRUISE_MAX_BP, _A_CRUISE_MAX_V_FOLLOWING)
+_a_total_max = Interp(_A_TOTAL_MAX_BP, _A_TOTAL_MAX_V)
+
 
 def calc_cruise_accel_limits(v_ego, following):
-  a_cruise_min = interp(v_ego, _A_CRUISE_MIN_BP, _A_CRUISE_MIN_V)
+  a_cruise_min = _a_cruise_min(v_ego)
 
   if following:
-    a_cruise_max = interp(v_ego, _A_CRUISE_MAX_BP, _A_CRUISE_MAX_V_FOLLOWING)
+    a_cruise_max = _a_cruise_max_following(v_ego)
   else:
-    a_cruise_max = interp(v_ego, _A_CRUISE_MAX_BP, _A_CRUISE_MAX_V)
+    a_cruise_max = _a_cruise_max(v_ego)
   return np.vstack([a_cruise_min, a_cruise_max])
 
 
@@ -49,7 +54,7 @@ def limit_accel_in_turns(v_ego, angle_steers, a_target, CP):
   this should avoid accelerating when losing the target in turns
   """
 
-  a_total_max = interp(v_ego, _A_TOTAL_MAX_BP, _A_TOTAL_MAX_V)
+  a_total_max = _a_total_max(v_ego)
   a_y = v_ego**2 * angle_steers * CV.DEG_TO_RAD / (CP.steerRatio * CP.wheelbase)
   a_x_allowed = math.sqrt(max(a_total_max**2 - a_y**2, 0.))
 
@@ -0,0 +1,151 @@
+import cereal.messaging as messaging
+from common.realtime import sec_since_boot
+
+SCALAR, TEXT, LIST, STRUCT, GROUP, POINTER = range(6)
+_POINTER_KINDS = {'text': TEXT, 'data': TEXT, 'list': LIST, 'struct': STRUCT,
+                  'anyPointer': POINTER, 'interface': POINTER}
+
+_field_kinds = {}
+
+
+def _kind(field):
+  if field.proto.which() == 'group':
+    return GROUP
+  return _POINTER_KINDS.get(field.proto.slot.type.which(), SCALAR)
+
+
+def _struct_fields(schema):
+  """(name, kind, element kind) of the non union fields of a struct schema, and of its union fields by name."""
+  ret = _field_kinds.get(schema.node.id)
+  if ret is None:
+    def kinds(names):
+      out = []
+      for name in names:
+        field = schema.fields[name]
+        kind = _kind(field)
+        elem_kind = None
+        if kind == LIST:
+          elem_kind = _POINTER_KINDS.get(field.proto.slot.type.list.elementType.which(), SCALAR)
+        out.append((name, kind, elem_kind))
+      return out
+    ret = _field_kinds[schema.node.id] = (kinds(schema.non_union_fields), {f[0]: f for f in kinds(schema.union_fields)})
+  return ret
+
+
+def _copy_list(dst, src, elem_kind):
+  if elem_kind == SCALAR:
+    for i in range(len(src)):
+      dst[i] = src[i]
+    return 0
+  elif elem_kind == STRUCT:
+    return sum(copy_in_place(dst[i], src[i]) for i in range(len(src)))
+  return None
+
+
+def _copy_field(dst, src, name, kind, elem_kind):
+  """Copies one field, returns how many times the message needed new space."""
+  if kind == SCALAR:
+    setattr(dst, name, getattr(src, name))
+  elif kind == GROUP:
+    return copy_in_place(getattr(dst, name), getattr(src, name))
+  elif kind == TEXT:
+    value = getattr(src, name)
+    if getattr(dst, name) != value:
+      setattr(dst, name, value)
+      return 1
+  elif kind == STRUCT:
+    if not src._has(name):
+      if dst._has(name):
+        dst.disown(name)
+      return 0
+    if dst._has(name):
+      return copy_in_place(getattr(dst, name), getattr(src, name))
+    setattr(dst, name, getattr(src, name))
+    return 1
+  elif kind == LIST:
+    value = getattr(src, name)
+    if dst._has(name) and len(getattr(dst, name)) == len(value):
+      allocs = _copy_list(getattr(dst, name), value, elem_kind)
+      if allocs is not None:
+        return allocs
+    setattr(dst, name, value)
+    return 1
+  else:
+    setattr(dst, name, getattr(src, name))
+    return 1
+  return 0
+
+
+def copy_in_place(dst, src):
+  """Copies struct src into the builder dst of the same type, overwriting what dst already
+     has where the layout allows it. Returns how many fields needed new space in the message."""
+  fields, union_fields = _struct_fields(src.schema)
+  allocs = 0
+  for name, kind, elem_kind in fields:
+    allocs += _copy_field(dst, src, name, kind, elem_kind)
+
+  if len(union_fields):
+    which = src.which()
+    name, kind, elem_kind = union_fields[which]
+    if kind == GROUP:
+      allocs += copy_in_place(dst.init(which) if dst.which() != which else getattr(dst, which), getattr(src, which))
+    elif kind == SCALAR or dst.which() == which:
+      allocs += _copy_field(dst, src, name, kind, elem_kind)
+    else:
+      setattr(dst, name, getattr(src, name))
+      allocs += 1
+  return allocs
+
+
+class ReusedMessage():
+  """An Event builder for one service that is written and sent again every frame.
+
+     Scalars are overwritten in place. Text, lists and structs are written through the
+     methods below, which only take new space in the message when the layout changed, as capnp
+     never frees the space of a replaced pointer field. The message is started over once
+     max_allocs of those happened, which bounds its size.
+
+     Fields keep their value from the previous frame until they are written again.
+  """
+  def __init__(self, service, max_allocs=100):
+    self.service = service
+    self.max_allocs = max_allocs
+    self.allocs = 0
+    self.msg = None
+    self.rebuilds = 0
+
+  def start(self, valid=True):
+    """Returns the message builder for this frame."""
+    if self.msg is None or self.allocs >= self.max_allocs:
+      self.msg = messaging.new_message(self.service)
+      self.allocs = 0
+      self.rebuilds += 1
+    else:
+      self.msg.clear_write_flag()
+      self.msg.logMonoTime = int(sec_since_boot() * 1e9)
+    self.msg.valid = valid
+    return self.msg
+
+  def set_text(self, struct, name, value):
+    if getattr(struct, name) != value:
+      setattr(struct, name, value)
+      self.allocs += 1
+
+  def set_list(self, struct, name, values):
+    """Sets a list of scalars."""
+    dst = getattr(struct, name)
+    if len(dst) == len(values):
+      for i in range(len(values)):
+        dst[i] = values[i]
+    else:
+      setattr(struct, name, values)
+      self.allocs += 1
+
+  def copy(self, struct, name, src):
+    """Copies the struct src into the struct (or union member) field name."""
+    union_fields = _struct_fields(struct.schema)[1]
+    if (name not in union_fields or struct.which() == name) and struct._has(name):
+      self.allocs += copy_in_place(getattr(struct, name), src)
+    else:
+      setattr(struct, name, src)
+      self.allocs += 1
@@ -1,5 +1,5 @@
-from common.numpy_fast import mean
-from common.kalman.simple_kalman import KF1D
+import numpy as np
+
 from selfdrive.config import RADAR_TO_CAMERA
 
 
@@ -7,151 +7,162 @@ from selfdrive.config import RADAR_TO_CAMERA
 # TODO is this a good default?
 _LEAD_ACCEL_TAU = 1.5
 
-# radar tracks
-SPEED, ACCEL = 0, 1   # Kalman filter states enum
-
 # stationary qualification parameters
 v_ego_stationary = 4.   # no stationary object flag below this speed
 
 
-class Track():
-  def __init__(self, v_lead, kalman_params):
-    self.cnt = 0
-    self.aLeadTau = _LEAD_ACCEL_TAU
-    self.K_A = kalman_params.A
-    self.K_C = kalman_params.C
-    self.K_K = kalman_params.K
-    self.kf = KF1D([[v_lead], [0.0]], self.K_A, self.K_C, self.K_K)
-
-  def update(self, d_rel, y_rel, v_rel, v_lead, measured):
-    # relative values, copy
-    self.dRel = d_rel   # LONG_DIST
-    self.yRel = y_rel   # -LAT_DIST
-    self.vRel = v_rel   # REL_SPEED
-    self.vLead = v_lead
-    self.measured = measured   # measured or estimate
-
-    # computed velocity and accelerations
-    if self.cnt > 0:
-      self.kf.update(self.vLead)
-
-    self.vLeadK = float(self.kf.x[SPEED][0])
-    self.aLeadK = float(self.kf.x[ACCEL][0])
+class RadarTracks():
+  """The radar tracks of one frame, as arrays with one entry per track sorted by track id.
+
+     vLeadK and aLeadK are the state of each track's lead speed Kalman filter, all filters are
+     stepped together.
+  """
+  def __init__(self, kalman_params):
+    A, C, K = kalman_params.A, kalman_params.C, kalman_params.K
+    self.K0 = K[0][0]
+    self.K1 = K[1][0]
+    self.A_K = (A[0][0] - self.K0 * C[0], A[0][1] - self.K0 * C[1],
+                A[1][0] - self.K1 * C[0], A[1][1] - self.K1 * C[1])
+
+    self.ids = np.zeros(0, dtype=np.int64)
+    self.dRel = np.zeros(0)
+    self.yRel = np.zeros(0)
+    self.vRel = np.zeros(0)
+    self.vLead = np.zeros(0)
+    self.measured = np.zeros(0, dtype=bool)
+    self.vLeadK = np.zeros(0)
+    self.aLeadK = np.zeros(0)
+    self.aLeadTau = np.zeros(0)
+    self.cnt = np.zeros(0, dtype=np.int64)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def update(self, ids, d_rel, y_rel, v_rel, v_lead, measured):
+    """Replaces the tracks by the points of a new frame, ids must be sorted and unique.
+       Tracks that continue keep their filter state, the others are dropped."""
+    ids = np.asarray(ids, dtype=np.int64)
+    known = np.zeros(len(ids), dtype=bool)
+    idx = np.zeros(len(ids), dtype=np.int64)
+    if len(self.ids):
+      idx = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+      known = self.ids[idx] == ids
+
+    def carry(x, default):
+      # state of the tracks that continue, default for the new ones
+      return np.where(known, x[idx] if len(x) else 0, default)
+
+    cnt = carry(self.cnt, 0)
+    x0 = carry(self.vLeadK, v_lead)
+    x1 = carry(self.aLeadK, 0.)
+    tau = carry(self.aLeadTau, _LEAD_ACCEL_TAU)
+
+    # computed velocity and accelerations, new tracks start at the measurement
+    A_K_0, A_K_1, A_K_2, A_K_3 = self.A_K
+    step = cnt > 0
+    self.vLeadK = np.where(step, A_K_0 * x0 + A_K_1 * x1 + self.K0 * v_lead, x0)
+    self.aLeadK = np.where(step, A_K_2 * x0 + A_K_3 * x1 + self.K1 * v_lead, x1)
 
     # Learn if constant acceleration
-    if abs(self.aLeadK) < 0.5:
-      self.aLeadTau = _LEAD_ACCEL_TAU
-    else:
-      self.aLeadTau *= 0.9
+    self.aLeadTau = np.where(np.abs(self.aLeadK) < 0.5, _LEAD_ACCEL_TAU, tau * 0.9)
 
-    self.cnt += 1
+    self.ids = ids
+    self.dRel = np.asarray(d_rel, dtype=np.float64)   # LONG_DIST
+    self.yRel = np.asarray(y_rel, dtype=np.float64)   # -LAT_DIST
+    self.vRel = np.asarray(v_rel, dtype=np.float64)   # REL_SPEED
+    self.vLead = np.asarray(v_lead, dtype=np.float64)
+    self.measured = np.asarray(measured, dtype=bool)  # measured or estimate
+    self.cnt = cnt + 1
 
-  def get_key_for_cluster(self):
+  def keys_for_cluster(self):
     # Weigh y higher since radar is inaccurate in this dimension
-    return [self.dRel, self.yRel*2, self.vRel]
-
-  def reset_a_lead(self, aLeadK, aLeadTau):
-    self.kf = KF1D([[self.vLead], [aLeadK]], self.K_A, self.K_C, self.K_K)
-    self.aLeadK = aLeadK
-    self.aLeadTau = aLeadTau
-
+    return np.column_stack([self.dRel, self.yRel*2, self.vRel])
 
-class Cluster():
-  def __init__(self):
-    self.tracks = set()
+  def reset_a_lead(self, mask, aLeadK, aLeadTau):
+    self.vLeadK[mask] = self.vLead[mask]
+    self.aLeadK[mask] = aLeadK
+    self.aLeadTau[mask] = aLeadTau
 
-  def add(self, t):
-    # add the first track
-    self.tracks.add(t)
 
-  # TODO: make generic
-  @property
-  def dRel(self):
-    return mean([t.dRel for t in self.tracks])
+def cluster_tracks(tracks, cluster_idxs):
+  """Returns the Clusters of the tracks grouped by cluster_idxs, and resets the acceleration
+     of new tracks to the rest of their cluster."""
+  n = int(cluster_idxs.max()) + 1 if len(cluster_idxs) else 0
 
-  @property
-  def yRel(self):
-    return mean([t.yRel for t in self.tracks])
+  def total(x):
+    return np.bincount(cluster_idxs, weights=x, minlength=n)
 
-  @property
-  def vRel(self):
-    return mean([t.vRel for t in self.tracks])
+  size = total(None)
 
-  @property
-  def aRel(self):
-    return mean([t.aRel for t in self.tracks])
+  # acceleration only from the tracks that have been filtered for more than one frame
+  old = tracks.cnt > 1
+  num_old = total(old.astype(np.float64))
+  has_old = num_old > 0
+  num_old = np.maximum(num_old, 1)
+  a_lead_k = np.where(has_old, total(np.where(old, tracks.aLeadK, 0.)) / num_old, 0.)
+  a_lead_tau = np.where(has_old, total(np.where(old, tracks.aLeadTau, 0.)) / num_old, _LEAD_ACCEL_TAU)
 
-  @property
-  def vLead(self):
-    return mean([t.vLead for t in self.tracks])
+  # if a new point, reset accel to the rest of the cluster
+  new = ~old
+  tracks.reset_a_lead(new, a_lead_k[cluster_idxs[new]], a_lead_tau[cluster_idxs[new]])
 
-  @property
-  def dPath(self):
-    return mean([t.dPath for t in self.tracks])
+  return RadarClusters(total(tracks.dRel) / size, total(tracks.yRel) / size, total(tracks.vRel) / size,
+                       total(tracks.vLead) / size, total(tracks.vLeadK) / size, a_lead_k, a_lead_tau,
+                       total(tracks.measured.astype(np.float64)) > 0)
 
-  @property
-  def vLat(self):
-    return mean([t.vLat for t in self.tracks])
 
-  @property
-  def vLeadK(self):
-    return mean([t.vLeadK for t in self.tracks])
-
-  @property
-  def aLeadK(self):
-    if all(t.cnt <= 1 for t in self.tracks):
-      return 0.
-    else:
-      return mean([t.aLeadK for t in self.tracks if t.cnt > 1])
-
-  @property
-  def aLeadTau(self):
-    if all(t.cnt <= 1 for t in self.tracks):
-      return _LEAD_ACCEL_TAU
-    else:
-      return mean([t.aLeadTau for t in self.tracks if t.cnt > 1])
+class RadarClusters():
+  """The clusters of one frame, as arrays with one entry per cluster."""
+  def __init__(self, dRel, yRel, vRel, vLead, vLeadK, aLeadK, aLeadTau, measured):
+    self.dRel = dRel
+    self.yRel = yRel
+    self.vRel = vRel
+    self.vLead = vLead
+    self.vLeadK = vLeadK
+    self.aLeadK = aLeadK
+    self.aLeadTau = aLeadTau
+    self.measured = measured
 
-  @property
-  def measured(self):
-    return any(t.measured for t in self.tracks)
+  def __len__(self):
+    return len(self.dRel)
 
-  def get_RadarState(self, model_prob=0.0):
+  def get_RadarState(self, idx, model_prob=0.0):
     return {
-      "dRel": float(self.dRel),
-      "yRel": float(self.yRel),
-      "vRel": float(self.vRel),
-      "vLead": float(self.vLead),
-      "vLeadK": float(self.vLeadK),
-      "aLeadK": float(self.aLeadK),
+      "dRel": float(self.dRel[idx]),
+      "yRel": float(self.yRel[idx]),
+      "vRel": float(self.vRel[idx]),
+      "vLead": float(self.vLead[idx]),
+      "vLeadK": float(self.vLeadK[idx]),
+      "aLeadK": float(self.aLeadK[idx]),
       "status": True,
-      "fcw": self.is_potential_fcw(model_prob),
+      "fcw": is_potential_fcw(model_prob),
       "modelProb": model_prob,
       "radar": True,
-      "aLeadTau": float(self.aLeadTau)
+      "aLeadTau": float(self.aLeadTau[idx])
     }
 
-  def get_RadarState_from_vision(self, lead_msg, v_ego):
-    return {
-      "dRel": float(lead_msg.xyva[0] - RADAR_TO_CAMERA),
-      "yRel": float(-lead_msg.xyva[1]),
-      "vRel": float(lead_msg.xyva[2]),
-      "vLead": float(v_ego + lead_msg.xyva[2]),
-      "vLeadK": float(v_ego + lead_msg.xyva[2]),
-      "aLeadK": float(0),
-      "aLeadTau": _LEAD_ACCEL_TAU,
-      "fcw": False,
-      "modelProb": float(lead_msg.prob),
-      "radar": False,
-      "status": True
-    }
-
-  def __str__(self):
-    ret = "x: %4.1f  y: %4.1f  v: %4.1f  a: %4.1f" % (self.dRel, self.yRel, self.vRel, self.aLeadK)
-    return ret
-
-  def potential_low_speed_lead(self, v_ego):
+  def potential_low_speed_leads(self, v_ego):
     # stop for stuff in front of you and low speed, even without model confirmation
-    return abs(self.yRel) < 1.5 and (v_ego < v_ego_stationary) and self.dRel < 25
-
-  def is_potential_fcw(self, model_prob):
-    return model_prob > .9
+    if v_ego >= v_ego_stationary:
+      return np.zeros(len(self), dtype=bool)
+    return (np.abs(self.yRel) < 1.5) & (self.dRel < 25)
+
+
+def get_RadarState_from_vision(lead_msg, v_ego):
+  return {
+    "dRel": float(lead_msg.xyva[0] - RADAR_TO_CAMERA),
+    "yRel": float(-lead_msg.xyva[1]),
+    "vRel": float(lead_msg.xyva[2]),
+    "vLead": float(v_ego + lead_msg.xyva[2]),
+    "vLeadK": float(v_ego + lead_msg.xyva[2]),
+    "aLeadK": float(0),
+    "aLeadTau": _LEAD_ACCEL_TAU,
+    "fcw": False,
+    "modelProb": float(lead_msg.prob),
+    "radar": False,
+    "status": True
+  }
+
+
+def is_potential_fcw(model_prob):
+  return model_prob > .9
@@ -1,40 +1,55 @@
 #!/usr/bin/env python3
 from cereal import car
 from common.params import Params
-from common.realtime import Priority, config_realtime_process
+from common.profiler import Profiler
+from common.realtime import Priority, config_realtime_process, DT_MDL
 from selfdrive.swaglog import cloudlog
 from selfdrive.controls.lib.longitudinal_planner import Planner
 from selfdrive.controls.lib.lateral_planner import LateralPlanner
 import cereal.messaging as messaging
 
 
-def plannerd_thread(sm=None, pm=None):
+class Plannerd():
+  def __init__(self, sm=None, pm=None):
+    cloudlog.info("plannerd is waiting for CarParams")
+    self.CP = car.CarParams.from_bytes(Params().get("CarParams", block=True))
+    cloudlog.info("plannerd got CarParams: %s", self.CP.carName)
 
-  config_realtime_process(2, Priority.CTRL_LOW)
+    self.longitudinal_planner = Planner(self.CP)
+    self.lateral_planner = LateralPlanner(self.CP)
+
+    self.sm = sm
+    if self.sm is None:
+      self.sm = messaging.SubMaster(['carState', 'controlsState', 'radarState', 'modelV2'],
+                                    poll=['radarState', 'modelV2'])
+
+    self.pm = pm
+    if self.pm is None:
+      self.pm = messaging.PubMaster(['longitudinalPlan', 'liveLongitudinalMpc', 'lateralPlan', 'liveMpc'])
 
-  cloudlog.info("plannerd is waiting for CarParams")
-  CP = car.CarParams.from_bytes(Params().get("CarParams", block=True))
-  cloudlog.info("plannerd got CarParams: %s", CP.carName)
+    self.prof = Profiler(True, name="plannerd", budget=DT_MDL)
 
-  longitudinal_planner = Planner(CP)
-  lateral_planner = LateralPlanner(CP)
+  def step(self):
+    self.sm.update()
+    self.prof.checkpoint("Receive", ignore=True)
 
-  if sm is None:
-    sm = messaging.SubMaster(['carState', 'controlsState', 'radarState', 'modelV2'],
-                             poll=['radarState', 'modelV2'])
+    if self.sm.updated['modelV2']:
+      self.lateral_planner.update(self.sm, self.CP)
+      self.lateral_planner.publish(self.sm, self.pm)
+      self.prof.checkpoint("Lateral planner")
+    if self.sm.updated['radarState']:
+      self.longitudinal_planner.update(self.sm, self.CP)
+      self.longitudinal_planner.publish(self.sm, self.pm)
+      self.prof.checkpoint("Longitudinal planner")
+    self.prof.end_iteration()
 
-  if pm is None:
-    pm = messaging.PubMaster(['longitudinalPlan', 'liveLongitudinalMpc', 'lateralPlan', 'liveMpc'])
 
+def plannerd_thread(sm=None, pm=None):
+  config_realtime_process(2, Priority.CTRL_LOW)
+
+  plannerd = Plannerd(sm, pm)
   while True:
-    sm.update()
-
-    if sm.updated['modelV2']:
-      lateral_planner.update(sm, CP)
-      lateral_planner.publish(sm, pm)
-    if sm.updated['radarState']:
-      longitudinal_planner.update(sm, CP)
-      longitudinal_planner.publish(sm, pm)
+    plannerd.step()
 
 
 def main(sm=None, pm=None):
@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 import importlib
-import math
-from collections import defaultdict, deque
+from collections import deque
+import numpy as np
 
 import cereal.messaging as messaging
 from cereal import car
 from common.numpy_fast import interp
 from common.params import Params
+from common.profiler import Profiler
 from common.realtime import Ratekeeper, Priority, config_realtime_process
 from selfdrive.config import RADAR_TO_CAMERA
 from selfdrive.controls.lib.cluster.fastcluster_py import cluster_points_centroid
-from selfdrive.controls.lib.radar_helpers import Cluster, Track
+from selfdrive.controls.lib.radar_helpers import RadarTracks, cluster_tracks, get_RadarState_from_vision
 from selfdrive.swaglog import cloudlog
 
 
@@ -30,66 +31,63 @@ class KalmanParams():
     self.K = [[interp(dt, dts, K0)], [interp(dt, dts, K1)]]
 
 
-def laplacian_cdf(x, mu, b):
-  b = max(b, 1e-4)
-  return math.exp(-abs(x-mu)/b)
+def match_vision_to_clusters(v_ego, lead_msgs, clusters):
+  """Returns the index of the cluster matching each model lead, or None if there is no sane match."""
+  xyva = np.array([list(lead.xyva)[:3] for lead in lead_msgs])
+  xyva_std = np.maximum(np.array([list(lead.xyvaStd)[:3] for lead in lead_msgs]), 1e-4)
+  offset_vision_dist = xyva[:, 0] - RADAR_TO_CAMERA
 
+  # laplacian probability of every cluster for every lead, on distance, lateral position and speed
+  # This is isn't exactly right, but good heuristic
+  mu = np.column_stack([offset_vision_dist, -xyva[:, 1], xyva[:, 2]])
+  pts = np.stack([clusters.dRel, clusters.yRel, clusters.vRel])
+  prob = np.exp(-np.abs(pts[None] - mu[:, :, None]) / xyva_std[:, :, None])
+  best = np.argmax(prob[:, 0] * prob[:, 1] * prob[:, 2], axis=1)
 
-def match_vision_to_cluster(v_ego, lead, clusters):
-  # match vision point to best statistical cluster match
-  offset_vision_dist = lead.xyva[0] - RADAR_TO_CAMERA
-
-  def prob(c):
-    prob_d = laplacian_cdf(c.dRel, offset_vision_dist, lead.xyvaStd[0])
-    prob_y = laplacian_cdf(c.yRel, -lead.xyva[1], lead.xyvaStd[1])
-    prob_v = laplacian_cdf(c.vRel, lead.xyva[2], lead.xyvaStd[2])
-
-    # This is isn't exactly right, but good heuristic
-    return prob_d * prob_y * prob_v
-
-  cluster = max(clusters, key=prob)
-
-  # if no 'sane' match is found return -1
+  # if no 'sane' match is found return None
   # stationary radar points can be false positives
-  dist_sane = abs(cluster.dRel - offset_vision_dist) < max([(offset_vision_dist)*.25, 5.0])
-  vel_sane = (abs(cluster.vRel - lead.xyva[2]) < 10) or (v_ego + cluster.vRel > 3)
-  if dist_sane and vel_sane:
-    return cluster
-  else:
-    return None
-
-
-def get_lead(v_ego, ready, clusters, lead_msg, low_speed_override=True):
-  # Determine leads, this is where the essential logic happens
-  if len(clusters) > 0 and ready and lead_msg.prob > .5:
-    cluster = match_vision_to_cluster(v_ego, lead_msg, clusters)
+  d_rel, v_rel = clusters.dRel[best], clusters.vRel[best]
+  dist_sane = np.abs(d_rel - offset_vision_dist) < np.maximum(offset_vision_dist * .25, 5.0)
+  vel_sane = (np.abs(v_rel - xyva[:, 2]) < 10) | (v_ego + v_rel > 3)
+  return [int(b) if sane else None for b, sane in zip(best, dist_sane & vel_sane)]
+
+
+def get_leads(v_ego, ready, clusters, lead_msgs):
+  """Determines leadOne and leadTwo from the two most likely model leads, this is where the
+     essential logic happens. leadOne can be overridden by a close cluster at low speed."""
+  lead_msgs = [lead_msgs[0], lead_msgs[1]]
+  probs = [lead.prob for lead in lead_msgs]
+  if len(clusters) > 0 and ready and max(probs) > .5:
+    matches = match_vision_to_clusters(v_ego, lead_msgs, clusters)
   else:
-    cluster = None
-
-  lead_dict = {'status': False}
-  if cluster is not None:
-    lead_dict = cluster.get_RadarState(lead_msg.prob)
-  elif (cluster is None) and ready and (lead_msg.prob > .5):
-    lead_dict = Cluster().get_RadarState_from_vision(lead_msg, v_ego)
+    matches = [None] * len(lead_msgs)
+
+  leads = []
+  for lead_msg, prob, match in zip(lead_msgs, probs, matches):
+    if not (ready and prob > .5):
+      leads.append({'status': False})
+    elif len(clusters) > 0 and match is not None:
+      leads.append(clusters.get_RadarState(match, prob))
+    else:
+      leads.append(get_RadarState_from_vision(lead_msg, v_ego))
 
-  if low_speed_override:
-    low_speed_clusters = [c for c in clusters if c.potential_low_speed_lead(v_ego)]
-    if len(low_speed_clusters) > 0:
-      closest_cluster = min(low_speed_clusters, key=lambda c: c.dRel)
+  low_speed = np.flatnonzero(clusters.potential_low_speed_leads(v_ego))
+  if len(low_speed) > 0:
+    closest = low_speed[np.argmin(clusters.dRel[low_speed])]
 
-      # Only choose new cluster if it is actually closer than the previous one
-      if (not lead_dict['status']) or (closest_cluster.dRel < lead_dict['dRel']):
-        lead_dict = closest_cluster.get_RadarState()
+    # Only choose new cluster if it is actually closer than the previous one
+    if (not leads[0]['status']) or (clusters.dRel[closest] < leads[0]['dRel']):
+      leads[0] = clusters.get_RadarState(closest)
 
-  return lead_dict
+  return leads
 
 
 class RadarD():
   def __init__(self, radar_ts, delay=0):
     self.current_time = 0
 
-    self.tracks = defaultdict(dict)
     self.kalman_params = KalmanParams(radar_ts)
+    self.tracks = RadarTracks(self.kalman_params)
 
     # v_ego
     self.v_ego = 0.
@@ -108,52 +106,23 @@ class RadarD():
 
     ar_pts = {}
     for pt in rr.points:
-      ar_pts[pt.trackId] = [pt.dRel, pt.yRel, pt.vRel, pt.measured]
-
-    # *** remove missing points from meta data ***
-    for ids in list(self.tracks.keys()):
-      if ids not in ar_pts:
-        self.tracks.pop(ids, None)
+      ar_pts[pt.trackId] = (pt.dRel, pt.yRel, pt.vRel, pt.measured)
 
-    # *** compute the tracks ***
-    for ids in ar_pts:
-      rpt = ar_pts[ids]
+    # *** compute the tracks, missing points are dropped ***
+    ids = sorted(ar_pts.keys())
+    pts = np.array([ar_pts[iden] for iden in ids], dtype=np.float64).reshape(-1, 4)
 
-      # align v_ego by a fixed time to align it with the radar measurement
-      v_lead = rpt[2] + self.v_ego_hist[0]
-
-      # create the track if it doesn't exist or it's a new track
-      if ids not in self.tracks:
-        self.tracks[ids] = Track(v_lead, self.kalman_params)
-      self.tracks[ids].update(rpt[0], rpt[1], rpt[2], v_lead, rpt[3])
-
-    idens = list(sorted(self.tracks.keys()))
-    track_pts = list([self.tracks[iden].get_key_for_cluster() for iden in idens])
+    # align v_ego by a fixed time to align it with the radar measurement
+    v_lead = pts[:, 2] + self.v_ego_hist[0]
+    self.tracks.update(ids, pts[:, 0], pts[:, 1], pts[:, 2], v_lead, pts[:, 3] != 0)
 
     # If we have multiple points, cluster them
-    if len(track_pts) > 1:
-      cluster_idxs = cluster_points_centroid(track_pts, 2.5)
-      clusters = [None] * (max(cluster_idxs) + 1)
-
-      for idx in range(len(track_pts)):
-        cluster_i = cluster_idxs[idx]
-        if clusters[cluster_i] is None:
-          clusters[cluster_i] = Cluster()
-        clusters[cluster_i].add(self.tracks[idens[idx]])
-    elif len(track_pts) == 1:
-      # FIXME: cluster_point_centroid hangs forever if len(track_pts) == 1
-      cluster_idxs = [0]
-      clusters = [Cluster()]
-      clusters[0].add(self.tracks[idens[0]])
+    if len(self.tracks) > 1:
+      cluster_idxs = np.array(cluster_points_centroid(self.tracks.keys_for_cluster(), 2.5))
     else:
-      clusters = []
-
-    # if a new point, reset accel to the rest of the cluster
-    for idx in range(len(track_pts)):
-      if self.tracks[idens[idx]].cnt <= 1:
-        aLeadK = clusters[cluster_idxs[idx]].aLeadK
-        aLeadTau = clusters[cluster_idxs[idx]].aLeadTau
-        self.tracks[idens[idx]].reset_a_lead(aLeadK, aLeadTau)
+      # FIXME: cluster_point_centroid hangs forever if len(track_pts) == 1
+      cluster_idxs = np.zeros(len(self.tracks), dtype=int)
+    clusters = cluster_tracks(self.tracks, cluster_idxs)
 
     # *** publish radarState ***
     dat = messaging.new_message('radarState')
@@ -166,68 +135,86 @@ class RadarD():
 
     if enable_lead:
       if len(sm['modelV2'].leads) > 1:
-        radarState.leadOne = get_lead(self.v_ego, self.ready, clusters, sm['modelV2'].leads[0], low_speed_override=True)
-        radarState.leadTwo = get_lead(self.v_ego, self.ready, clusters, sm['modelV2'].leads[1], low_speed_override=False)
+        radarState.leadOne, radarState.leadTwo = get_leads(self.v_ego, self.ready, clusters, sm['modelV2'].leads)
     return dat
 
 
-# fuses camera and radar data for best lead detection
-def radard_thread(sm=None, pm=None, can_sock=None):
-  config_realtime_process(2, Priority.CTRL_LOW)
+class Radard():
+  def __init__(self, sm=None, pm=None, can_sock=None):
+    # wait for stats about the car to come in from controls
+    cloudlog.info("radard is waiting for CarParams")
+    self.CP = car.CarParams.from_bytes(Params().get("CarParams", block=True))
+    cloudlog.info("radard got CarParams")
 
-  # wait for stats about the car to come in from controls
-  cloudlog.info("radard is waiting for CarParams")
-  CP = car.CarParams.from_bytes(Params().get("CarParams", block=True))
-  cloudlog.info("radard got CarParams")
+    # import the radar from the fingerprint
+    cloudlog.info("radard is importing %s", self.CP.carName)
+    RadarInterface = importlib.import_module('selfdrive.car.%s.radar_interface' % self.CP.carName).RadarInterface
 
-  # import the radar from the fingerprint
-  cloudlog.info("radard is importing %s", CP.carName)
-  RadarInterface = importlib.import_module('selfdrive.car.%s.radar_interface' % CP.carName).RadarInterface
+    # *** setup messaging
+    self.can_sock = can_sock
+    if self.can_sock is None:
+      self.can_sock = messaging.sub_sock('can')
+    self.sm = sm
+    if self.sm is None:
+      self.sm = messaging.SubMaster(['modelV2', 'carState'])
+    self.pm = pm
+    if self.pm is None:
+      self.pm = messaging.PubMaster(['radarState', 'liveTracks'])
 
-  # *** setup messaging
-  if can_sock is None:
-    can_sock = messaging.sub_sock('can')
-  if sm is None:
-    sm = messaging.SubMaster(['modelV2', 'carState'])
-  if pm is None:
-    pm = messaging.PubMaster(['radarState', 'liveTracks'])
+    self.RI = RadarInterface(self.CP)
 
-  RI = RadarInterface(CP)
+    self.rk = Ratekeeper(1.0 / self.CP.radarTimeStep, print_delay_threshold=None)
+    self.RD = RadarD(self.CP.radarTimeStep, self.RI.delay)
 
-  rk = Ratekeeper(1.0 / CP.radarTimeStep, print_delay_threshold=None)
-  RD = RadarD(CP.radarTimeStep, RI.delay)
+    # TODO: always log leads once we can hide them conditionally
+    self.enable_lead = self.CP.openpilotLongitudinalControl or not self.CP.radarOffCan
 
-  # TODO: always log leads once we can hide them conditionally
-  enable_lead = CP.openpilotLongitudinalControl or not CP.radarOffCan
+    self.prof = Profiler(True, name="radard", budget=self.CP.radarTimeStep)
 
-  while 1:
-    can_strings = messaging.drain_sock_raw(can_sock, wait_for_one=True)
-    rr = RI.update(can_strings)
+  def step(self):
+    """Reads the CAN received since the last step, publishes if it completed a radar frame."""
+    can_strings = messaging.drain_sock_raw(self.can_sock, wait_for_one=True)
+    self.prof.checkpoint("Receive", ignore=True)
+    rr = self.RI.update(can_strings)
+    self.prof.checkpoint("Radar interface")
 
     if rr is None:
-      continue
+      return False
 
-    sm.update(0)
+    self.sm.update(0)
 
-    dat = RD.update(sm, rr, enable_lead)
-    dat.radarState.cumLagMs = -rk.remaining*1000.
+    dat = self.RD.update(self.sm, rr, self.enable_lead)
+    dat.radarState.cumLagMs = -self.rk.remaining*1000.
+    self.prof.checkpoint("Update")
 
-    pm.send('radarState', dat)
+    self.pm.send('radarState', dat)
 
     # *** publish tracks for UI debugging (keep last) ***
-    tracks = RD.tracks
+    tracks = self.RD.tracks
     dat = messaging.new_message('liveTracks', len(tracks))
 
-    for cnt, ids in enumerate(sorted(tracks.keys())):
+    for cnt, (ids, d_rel, y_rel, v_rel) in enumerate(zip(tracks.ids.tolist(), tracks.dRel.tolist(),
+                                                         tracks.yRel.tolist(), tracks.vRel.tolist())):
       dat.liveTracks[cnt] = {
         "trackId": ids,
-        "dRel": float(tracks[ids].dRel),
-        "yRel": float(tracks[ids].yRel),
-        "vRel": float(tracks[ids].vRel),
+        "dRel": d_rel,
+        "yRel": y_rel,
+        "vRel": v_rel,
       }
-    pm.send('liveTracks', dat)
+    self.pm.send('liveTracks', dat)
+    self.prof.checkpoint("Sent")
+    self.prof.end_iteration()
+    return True
 
-    rk.monitor_time()
+
+# fuses camera and radar data for best lead detection
+def radard_thread(sm=None, pm=None, can_sock=None):
+  config_realtime_process(2, Priority.CTRL_LOW)
+
+  radard = Radard(sm, pm, can_sock)
+  while 1:
+    if radard.step():
+      radard.rk.monitor_time()
 
 
 def main(sm=None, pm=None, can_sock=None):
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+from cereal import car
+from common.realtime import DT_CTRL
+from selfdrive.controls.lib.events import Alert, ET, EVENT_NAME, EVENTS, Events
+
+EVENT_TYPES = [et for name, et in vars(ET).items() if not name.startswith('_')]
+
+# events whose alerts don't need callback arguments
+STATIC_EVENTS = [e for e, alerts in EVENTS.items() if all(isinstance(a, Alert) for a in alerts.values())]
+
+NUM_FRAMES = 1000
+
+
+class ReferenceEvents:
+  """Events as it was before the bitset, to compare against."""
+  def __init__(self):
+    self.events = []
+    self.static_events = []
+    self.events_prev = dict.fromkeys(EVENTS.keys(), 0)
+
+  def add(self, event_name, static=False):
+    if static:
+      self.static_events.append(event_name)
+    self.events.append(event_name)
+
+  def clear(self):
+    self.events_prev = {k: (v+1 if k in self.events else 0) for k, v in self.events_prev.items()}
+    self.events = self.static_events.copy()
+
+  def any(self, event_type):
+    for e in self.events:
+      if event_type in EVENTS.get(e, {}).keys():
+        return True
+    return False
+
+  def create_alerts(self, event_types):
+    ret = []
+    for e in self.events:
+      for et in event_types:
+        alert = EVENTS[e].get(et)
+        if alert is not None and DT_CTRL * (self.events_prev[e] + 1) >= alert.creation_delay:
+          ret.append(f"{EVENT_NAME[e]}/{et}")
+    return ret
+
+  def to_msg(self):
+    return [(e, sorted(EVENTS.get(e, {}).keys())) for e in self.events]
+
+
+def msg_summary(msg):
+  return [(m.name.raw, sorted(et for et in EVENT_TYPES if getattr(m, et))) for m in msg]
+
+
+class TestEvents(unittest.TestCase):
+  def test_matches_reference(self):
+    random.seed(0)
+    # two instances alive at once must not see each other's events or messages
+    events, other, ref, other_ref = Events(), Events(), ReferenceEvents(), ReferenceEvents()
+    for e in random.sample(STATIC_EVENTS, 2):
+      events.add(e, static=True)
+      ref.add(e, static=True)
+
+    held = None
+    for frame in range(NUM_FRAMES):
+      for evs, r in ((events, ref), (other, other_ref)):
+        evs.clear()
+        r.clear()
+        # mostly the same events from frame to frame, so the counters and creation delays get exercised
+        for e in STATIC_EVENTS[:20]:
+          if random.random() < 0.8:
+            evs.add(e)
+            r.add(e)
+        for e in random.sample(STATIC_EVENTS, random.randint(0, 3)):
+          evs.add(e)
+          r.add(e)
+
+      for evs, r in ((events, ref), (other, other_ref)):
+        self.assertEqual(evs.names, r.events)
+        for e in EVENTS:
+          self.assertEqual(evs.events_prev.get(e, 0), r.events_prev[e])
+        for et in EVENT_TYPES:
+          self.assertEqual(evs.any(et), r.any(et), et)
+        for ets in ([et] for et in EVENT_TYPES):
+          self.assertEqual([a.alert_type for a in evs.create_alerts(ets)], r.create_alerts(ets))
+        self.assertEqual([a.alert_type for a in evs.create_alerts(EVENT_TYPES)], r.create_alerts(EVENT_TYPES))
+        self.assertEqual(msg_summary(evs.to_msg()), r.to_msg())
+
+      # a list returned earlier is not changed by later frames
+      if frame % 100 == 0:
+        held, held_summary = events.to_msg(), msg_summary(events.to_msg())
+      self.assertEqual(msg_summary(held), held_summary)
+
+  def test_to_msg(self):
+    events, other = Events(), Events()
+    e = STATIC_EVENTS[0]
+    events.add(e)
+    other.add(e)
+    msg = events.to_msg()
+    self.assertIs(events.to_msg(), msg)
+    self.assertIsNot(other.to_msg()[0], msg[0])
+
+    # the builders can be put in a CarState
+    CS = car.CarState.new_message()
+    CS.events = msg
+    self.assertEqual(CS.events[0].name.raw, e)
+
+    events.clear()
+    self.assertEqual(len(events.to_msg()), 0)
+    self.assertEqual(len(msg), 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
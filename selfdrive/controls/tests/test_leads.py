@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import math
+import unittest
+from types import SimpleNamespace
+import numpy as np
+
+from selfdrive.config import RADAR_TO_CAMERA
+from selfdrive.controls.lib.radar_helpers import RadarClusters, get_RadarState_from_vision, v_ego_stationary
+from selfdrive.controls.radard import get_leads
+
+NUM_FRAMES = 500
+MAX_CLUSTERS = 64
+
+
+def laplacian_cdf(x, mu, b):
+  b = max(b, 1e-4)
+  return math.exp(-abs(x-mu)/b)
+
+
+def get_lead(v_ego, ready, clusters, lead_msg, low_speed_override=True):
+  """Lead selection one cluster at a time, as radard did it before get_leads."""
+  idxs = range(len(clusters))
+  cluster = None
+  if len(clusters) > 0 and ready and lead_msg.prob > .5:
+    offset_vision_dist = lead_msg.xyva[0] - RADAR_TO_CAMERA
+
+    def prob(i):
+      prob_d = laplacian_cdf(clusters.dRel[i], offset_vision_dist, lead_msg.xyvaStd[0])
+      prob_y = laplacian_cdf(clusters.yRel[i], -lead_msg.xyva[1], lead_msg.xyvaStd[1])
+      prob_v = laplacian_cdf(clusters.vRel[i], lead_msg.xyva[2], lead_msg.xyvaStd[2])
+      return prob_d * prob_y * prob_v
+
+    cluster = max(idxs, key=prob)
+    dist_sane = abs(clusters.dRel[cluster] - offset_vision_dist) < max([(offset_vision_dist)*.25, 5.0])
+    vel_sane = (abs(clusters.vRel[cluster] - lead_msg.xyva[2]) < 10) or (v_ego + clusters.vRel[cluster] > 3)
+    if not (dist_sane and vel_sane):
+      cluster = None
+
+  lead_dict = {'status': False}
+  if cluster is not None:
+    lead_dict = clusters.get_RadarState(cluster, lead_msg.prob)
+  elif ready and (lead_msg.prob > .5):
+    lead_dict = get_RadarState_from_vision(lead_msg, v_ego)
+
+  if low_speed_override:
+    low_speed = [i for i in idxs if abs(clusters.yRel[i]) < 1.5 and (v_ego < v_ego_stationary) and clusters.dRel[i] < 25]
+    if len(low_speed) > 0:
+      closest = min(low_speed, key=lambda i: clusters.dRel[i])
+      if (not lead_dict['status']) or (clusters.dRel[closest] < lead_dict['dRel']):
+        lead_dict = clusters.get_RadarState(closest)
+
+  return lead_dict
+
+
+def random_frame():
+  """A dense traffic radar frame, with model leads near some of the clusters."""
+  n = np.random.randint(0, MAX_CLUSTERS)
+  d_rel = np.random.uniform(0., 150., n)
+  clusters = RadarClusters(d_rel, np.random.uniform(-10., 10., n), np.random.uniform(-15., 5., n),
+                           np.random.uniform(0., 30., n), np.random.uniform(0., 30., n),
+                           np.random.uniform(-2., 2., n), np.full(n, 1.5), np.ones(n, dtype=bool))
+
+  leads = []
+  for _ in range(2):
+    if n > 0 and np.random.rand() > 0.3:
+      i = np.random.randint(n)
+      xyva = [clusters.dRel[i] + RADAR_TO_CAMERA + np.random.normal(0., 2.), -clusters.yRel[i], clusters.vRel[i], 0.]
+    else:
+      xyva = [np.random.uniform(0., 100.), np.random.uniform(-3., 3.), np.random.uniform(-10., 2.), 0.]
+    leads.append(SimpleNamespace(xyva=xyva, xyvaStd=list(np.random.uniform(0., 3., 4)), prob=np.random.rand()))
+
+  v_ego = np.random.choice([np.random.uniform(0., v_ego_stationary), np.random.uniform(0., 35.)])
+  return v_ego, bool(np.random.rand() > 0.05), clusters, leads
+
+
+class TestLeads(unittest.TestCase):
+  def test_dense_traffic(self):
+    np.random.seed(1337)
+    frames = [random_frame() for _ in range(NUM_FRAMES)]
+
+    expected = [(get_lead(v_ego, ready, clusters, leads[0], low_speed_override=True),
+                 get_lead(v_ego, ready, clusters, leads[1], low_speed_override=False))
+                for v_ego, ready, clusters, leads in frames]
+    actual = [get_leads(v_ego, ready, clusters, leads) for v_ego, ready, clusters, leads in frames]
+
+    for exp, act in zip(expected, actual):
+      for exp_lead, act_lead in zip(exp, act):
+        self.assertEqual(exp_lead.keys(), act_lead.keys())
+        for k, v in exp_lead.items():
+          self.assertAlmostEqual(v, act_lead[k], places=6, msg=k)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import gc
+import sys
+import unittest
+
+from cereal import car, log
+from selfdrive.controls.lib.message_reuse import ReusedMessage, copy_in_place
+
+FRAMES = 1000
+
+
+def fill_controls_state(msg, frame):
+  """Writes a controlsState like controlsd does."""
+  dat = msg.start(valid=True)
+  controls_state = dat.controlsState
+  msg.set_text(controls_state, 'alertText1', "TAKE CONTROL" if (frame // 300) % 2 else "")
+  msg.set_text(controls_state, 'alertText2', "")
+  msg.set_list(controls_state, 'canMonoTimes', [frame, frame + 1])
+  controls_state.vPid = frame * 0.1
+  controls_state.enabled = frame % 2 == 0
+
+  pid_log = log.ControlsState.LateralPIDState.new_message()
+  pid_log.active = True
+  pid_log.steeringAngleDeg = frame * 0.01
+  pid_log.output = -frame * 0.001
+  msg.copy(controls_state.lateralControlState, 'pidState', pid_log)
+  return dat
+
+
+class TestMessageReuse(unittest.TestCase):
+  def test_matches_new_message(self):
+    msg = ReusedMessage('controlsState')
+    for frame in range(FRAMES):
+      dat = fill_controls_state(msg, frame)
+      cs = dat.as_reader().controlsState
+      self.assertEqual(list(cs.canMonoTimes), [frame, frame + 1])
+      self.assertAlmostEqual(cs.lateralControlState.pidState.steeringAngleDeg, frame * 0.01, places=3)
+      self.assertEqual(cs.alertText1, "TAKE CONTROL" if (frame // 300) % 2 else "")
+
+  def test_message_size_bounded(self):
+    msg = ReusedMessage('controlsState', max_allocs=10)
+    sizes = set()
+    for frame in range(FRAMES):
+      sizes.add(len(fill_controls_state(msg, frame).to_bytes()))
+    # only the alert text changes need new space, the message doesn't grow with the frames
+    self.assertLessEqual(len(sizes), 4)
+    self.assertEqual(msg.rebuilds, 1)
+
+  def test_copy_in_place(self):
+    src = car.CarControl.new_message()
+    src.enabled = True
+    src.actuators.steer = 0.5
+    src.hudControl.visualAlert = 'steerRequired'
+
+    dst = car.CarControl.new_message()
+    copy_in_place(dst, src)
+    self.assertEqual(copy_in_place(dst, src), 0)
+    self.assertEqual(dst.to_dict(), src.to_dict())
+
+  def test_frame_allocations(self):
+    # gc is disabled in controlsd, so nothing may be left behind per frame
+    msg = ReusedMessage('controlsState')
+    for frame in range(10):
+      fill_controls_state(msg, frame)
+
+    gc.collect()
+    gc.disable()
+    try:
+      blocks = sys.getallocatedblocks()
+      for frame in range(10, FRAMES):
+        fill_controls_state(msg, frame)
+      leaked = sys.getallocatedblocks() - blocks
+      self.assertEqual(gc.collect(), 0)
+    finally:
+      gc.enable()
+    self.assertLess(leaked, 50)
+
+
+if __name__ == "__main__":
+  unittest.main()
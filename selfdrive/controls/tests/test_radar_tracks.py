@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+
+from common.kalman.simple_kalman_old import KF1D
+from selfdrive.controls.lib.radar_helpers import _LEAD_ACCEL_TAU, RadarTracks, cluster_tracks
+from selfdrive.controls.radard import KalmanParams
+
+NUM_FRAMES = 200
+MAX_TRACKS = 64
+
+
+class Track():
+  """A single track, as radard kept them before RadarTracks."""
+  def __init__(self, v_lead, kalman_params):
+    self.cnt = 0
+    self.aLeadTau = _LEAD_ACCEL_TAU
+    self.kalman_params = kalman_params
+    self.kf = KF1D(np.array([[v_lead], [0.0]]), kalman_params.A, kalman_params.C, kalman_params.K)
+
+  def update(self, d_rel, y_rel, v_rel, v_lead, measured):
+    self.dRel, self.yRel, self.vRel, self.vLead, self.measured = d_rel, y_rel, v_rel, v_lead, measured
+    if self.cnt > 0:
+      self.kf.update(self.vLead)
+    self.vLeadK = float(self.kf.x[0][0])
+    self.aLeadK = float(self.kf.x[1][0])
+    if abs(self.aLeadK) < 0.5:
+      self.aLeadTau = _LEAD_ACCEL_TAU
+    else:
+      self.aLeadTau *= 0.9
+    self.cnt += 1
+
+  def reset_a_lead(self, aLeadK, aLeadTau):
+    kp = self.kalman_params
+    self.kf = KF1D(np.array([[self.vLead], [aLeadK]]), kp.A, kp.C, kp.K)
+    self.aLeadK = aLeadK
+    self.aLeadTau = aLeadTau
+
+
+def cluster_stats(tracks):
+  old = [t for t in tracks if t.cnt > 1]
+  a_lead_k = np.mean([t.aLeadK for t in old]) if len(old) else 0.
+  a_lead_tau = np.mean([t.aLeadTau for t in old]) if len(old) else _LEAD_ACCEL_TAU
+  return a_lead_k, a_lead_tau
+
+
+class TestRadarTracks(unittest.TestCase):
+  def test_matches_per_track_filters(self):
+    np.random.seed(0)
+    kalman_params = KalmanParams(0.05)
+    tracks = RadarTracks(kalman_params)
+    ref = {}
+
+    for _ in range(NUM_FRAMES):
+      ids = np.sort(np.random.choice(MAX_TRACKS * 2, np.random.randint(0, MAX_TRACKS), replace=False))
+      d_rel = np.random.uniform(0, 150, len(ids))
+      y_rel = np.random.uniform(-10, 10, len(ids))
+      v_rel = np.random.uniform(-20, 5, len(ids))
+      v_lead = v_rel + 25.
+      measured = np.random.rand(len(ids)) > 0.5
+      tracks.update(ids, d_rel, y_rel, v_rel, v_lead, measured)
+
+      ref = {i: ref[i] if i in ref else Track(v, kalman_params) for i, v in zip(ids, v_lead)}
+      for i, d, y, v, vl, m in zip(ids, d_rel, y_rel, v_rel, v_lead, measured):
+        ref[i].update(d, y, v, vl, m)
+
+      cluster_idxs = np.unique((d_rel // 30).astype(int), return_inverse=True)[1].ravel()
+      clusters = cluster_tracks(tracks, cluster_idxs)
+
+      members = [[ref[i] for i, c in zip(ids, cluster_idxs) if c == cluster] for cluster in range(len(clusters))]
+      stats = [cluster_stats(m) for m in members]
+      for i, c in zip(ids, cluster_idxs):
+        if ref[i].cnt <= 1:
+          ref[i].reset_a_lead(*stats[c])
+
+      np.testing.assert_equal(tracks.ids, ids)
+      np.testing.assert_allclose(tracks.vLeadK, [ref[i].vLeadK for i in ids], rtol=1e-12)
+      np.testing.assert_allclose(tracks.aLeadK, [ref[i].aLeadK for i in ids], rtol=1e-12, atol=1e-12)
+      np.testing.assert_allclose(tracks.aLeadTau, [ref[i].aLeadTau for i in ids], rtol=1e-12)
+      for c, (m, (a_lead_k, a_lead_tau)) in enumerate(zip(members, stats)):
+        self.assertAlmostEqual(clusters.dRel[c], np.mean([t.dRel for t in m]), places=9)
+        self.assertAlmostEqual(clusters.yRel[c], np.mean([t.yRel for t in m]), places=9)
+        self.assertAlmostEqual(clusters.vLeadK[c], np.mean([t.vLeadK for t in m]), places=9)
+        self.assertAlmostEqual(clusters.aLeadK[c], a_lead_k, places=9)
+        self.assertAlmostEqual(clusters.aLeadTau[c], a_lead_tau, places=9)
+        self.assertEqual(clusters.measured[c], any(t.measured for t in m))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -4,38 +4,41 @@
 # type: ignore
 
 import math
-import multiprocessing
+import sys
 
 import numpy as np
-from tqdm import tqdm
 
-from selfdrive.locationd.paramsd import ParamsLearner, States
-from tools.lib.logreader import LogReader
+from selfdrive.locationd.offline import paramsd_inputs, run_routes
+from selfdrive.locationd.paramsd import ParamsLearner
 from tools.lib.route import Route
+from tools.lib.logreader import LogReader
 
-ROUTE = "b2f1615665781088|2021-03-14--17-27-47"
+ROUTES = ["b2f1615665781088|2021-03-14--17-27-47"]
 PLOT = True
 
 
+SERVICES = ['carParams', 'liveParameters', 'liveLocationKalman', 'carState']
+
+
 def load_segment(segment_name):
   print(f"Loading {segment_name}")
   if segment_name is None:
     return []
 
   try:
-    return list(LogReader(segment_name))
+    return list(LogReader(segment_name, services=SERVICES))
   except ValueError as e:
     print(f"Error parsing {segment_name}: {e}")
     return []
 
 
-if __name__ == "__main__":
-  route = Route(ROUTE)
+def process_route(route_name):
+  route = Route(route_name)
 
+  # run_routes workers are daemonic and can't start a pool of their own, read the segments in-process
   msgs = []
-  with multiprocessing.Pool(24) as pool:
-    for d in pool.map(load_segment, route.log_paths()):
-      msgs += d
+  for log_path in route.log_paths():
+    msgs += load_segment(log_path)
 
   for m in msgs:
     if m.which() == 'carParams':
@@ -55,44 +58,20 @@ if __name__ == "__main__":
       params['angleOffsetAverageDeg'] = m.liveParameters.angleOffsetAverageDeg
       break
 
-  for m in msgs:
-    if m.which() == 'carState':
-      last_carstate = m
-      break
-
-  print(params)
+  print(route_name, params)
   learner = ParamsLearner(CP, params['steerRatio'], params['stiffnessFactor'], math.radians(params['angleOffsetAverageDeg']))
-  msgs = [m for m in tqdm(msgs) if m.which() in ('liveLocationKalman', 'carState', 'liveParameters')]
   msgs = sorted(msgs, key=lambda m: m.logMonoTime)
+  out = learner.handle_columns(paramsd_inputs(msgs))
+
+  ts = out['t']
+  results = np.column_stack([out['steer_ratio'], out['stiffness_factor'], out['angle_offset_average_deg'], out['angle_offset_deg']])
+  if np.any(np.isnan(results)):
+    print("NaN", ts[np.isnan(results).any(axis=1)][0])
 
-  ts = []
   ts_log = []
-  results = []
   results_log = []
-  for m in tqdm(msgs):
-    if m.which() == 'carState':
-      last_carstate = m
-
-    elif m.which() == 'liveLocationKalman':
-      t = last_carstate.logMonoTime / 1e9
-      learner.handle_log(t, 'carState', last_carstate.carState)
-
-      t = m.logMonoTime / 1e9
-      learner.handle_log(t, 'liveLocationKalman', m.liveLocationKalman)
-
-      x = learner.kf.x
-      sr = float(x[States.STEER_RATIO])
-      st = float(x[States.STIFFNESS])
-      ao_avg = math.degrees(x[States.ANGLE_OFFSET])
-      ao = ao_avg + math.degrees(x[States.ANGLE_OFFSET_FAST])
-      r = [sr, st, ao_avg, ao]
-      if any(math.isnan(v) for v in r):
-        print("NaN", t)
-
-      ts.append(t)
-      results.append(r)
-
-    elif m.which() == 'liveParameters':
+  for m in msgs:
+    if m.which() == 'liveParameters':
       t = m.logMonoTime / 1e9
       mm = m.liveParameters
 
@@ -102,8 +81,17 @@ if __name__ == "__main__":
       ts_log.append(t)
       results_log.append(r)
 
-  results = np.asarray(results)
-  results_log = np.asarray(results_log)
+  return ts, results, np.asarray(ts_log), np.asarray(results_log)
+
+
+if __name__ == "__main__":
+  routes = sys.argv[1:] if len(sys.argv) > 1 else ROUTES
+  processed = run_routes(process_route, routes)
+
+  for route_name, (ts, results, ts_log, results_log) in zip(routes, processed):
+    print(route_name, "steer ratio %.2f stiffness %.2f angle offset %.2f" % tuple(results[-1, :3]))
+
+  ts, results, ts_log, results_log = processed[0]
 
   if PLOT:
     import matplotlib.pyplot as plt
@@ -56,6 +56,14 @@ def sanity_clip(rpy):
                    np.clip(rpy[2], YAW_LIMITS[0] - .005, YAW_LIMITS[1] + .005)])
 
 
+def observed_rpys(trans):
+  """Road frame rpy the camera odometry translations are seen at, one row per sample."""
+  trans = np.atleast_2d(trans)
+  return np.column_stack([np.zeros(len(trans)),
+                          -np.arctan2(trans[:, 2], trans[:, 0]),
+                          np.arctan2(trans[:, 1], trans[:, 0])])
+
+
 class Calibrator():
   def __init__(self, param_put=False):
     self.param_put = param_put
@@ -104,6 +112,7 @@ class Calibrator():
     self.idx = 0
     self.block_idx = 0
     self.v_ego = 0
+    self.update_block_stats()
 
     if smooth_from is None:
       self.old_rpy = RPY_INIT
@@ -112,10 +121,21 @@ class Calibrator():
       self.old_rpy = smooth_from
       self.old_rpy_weight = 1.0
 
+  def update_block_stats(self):
+    """Sum of the valid blocks, and the min and max of the valid blocks other than the one being filled.
+       Only the block being filled changes between block boundaries, so these are recomputed at the boundaries."""
+    valid = self.rpys[:self.valid_blocks]
+    self.rpys_sum = valid.sum(axis=0)
+    others = np.delete(valid, self.block_idx, axis=0) if self.block_idx < self.valid_blocks else valid
+    self.others_max = others.max(axis=0) if len(others) else np.full(3, -np.inf)
+    self.others_min = others.min(axis=0) if len(others) else np.full(3, np.inf)
+
   def update_status(self):
     if self.valid_blocks > 0:
-      max_rpy_calib = np.array(np.max(self.rpys[:self.valid_blocks], axis=0))
-      min_rpy_calib = np.array(np.min(self.rpys[:self.valid_blocks], axis=0))
+      max_rpy_calib, min_rpy_calib = self.others_max, self.others_min
+      if self.block_idx < self.valid_blocks:
+        max_rpy_calib = np.maximum(max_rpy_calib, self.rpys[self.block_idx])
+        min_rpy_calib = np.minimum(min_rpy_calib, self.rpys[self.block_idx])
       self.calib_spread = np.abs(max_rpy_calib - min_rpy_calib)
     else:
       self.calib_spread = np.zeros(3)
@@ -158,20 +178,52 @@ class Calibrator():
     if not (straight_and_fast and certain_if_calib):
       return None
 
-    observed_rpy = np.array([0,
-                             -np.arctan2(trans[2], trans[0]),
-                             np.arctan2(trans[1], trans[0])])
-    new_rpy = euler_from_rot(rot_from_euler(self.get_smooth_rpy()).dot(rot_from_euler(observed_rpy)))
+    return self.add_observation(rot_from_euler(observed_rpys(trans)[0]))
+
+  def handle_cam_odom_batch(self, v_ego, trans, rot, trans_std, rot_std):
+    """Ingests N cameraOdometry samples at once, with the vEgo of each. The samples are taken in order
+       exactly as handle_cam_odom would, returns the new rpy of every sample, nan where it was rejected."""
+    v_ego = np.asarray(v_ego)
+    trans, rot, trans_std = np.atleast_2d(trans), np.atleast_2d(rot), np.atleast_2d(trans_std)
+    straight_and_fast = (v_ego > MIN_SPEED_FILTER) & (trans[:, 0] > MIN_SPEED_FILTER) & \
+                        (np.abs(rot[:, 2]) < MAX_YAW_RATE_FILTER)
+    certain = (np.arctan2(trans_std[:, 1], trans[:, 0]) < MAX_VEL_ANGLE_STD).tolist()
+
+    candidates = np.flatnonzero(straight_and_fast)
+    observed_rots = np.zeros((len(trans), 3, 3))
+    if len(candidates):
+      observed_rots[candidates] = rot_from_euler(observed_rpys(trans[candidates]))
+
+    new_rpys = np.full((len(trans), 3), np.nan)
+    straight_and_fast = straight_and_fast.tolist()
+    for i in range(len(trans)):
+      self.old_rpy_weight = min(0.0, self.old_rpy_weight - 1/SMOOTH_CYCLES)
+      if straight_and_fast[i] and (certain[i] or self.valid_blocks < INPUTS_NEEDED):
+        new_rpys[i] = self.add_observation(observed_rots[i])
+    if len(trans):
+      self.v_ego = float(v_ego[-1])
+    return new_rpys
+
+  def add_observation(self, observed_rot):
+    new_rpy = euler_from_rot(rot_from_euler(self.get_smooth_rpy()).dot(observed_rot))
     new_rpy = sanity_clip(new_rpy)
 
-    self.rpys[self.block_idx] = (self.idx*self.rpys[self.block_idx] + (BLOCK_SIZE - self.idx) * new_rpy) / float(BLOCK_SIZE)
+    # only the block being filled changes, the running sum is updated by the difference
+    block = self.rpys[self.block_idx]
+    if self.block_idx < self.valid_blocks:
+      self.rpys_sum -= block
+    block[:] = (self.idx*block + (BLOCK_SIZE - self.idx) * new_rpy) / float(BLOCK_SIZE)
+    if self.block_idx < self.valid_blocks:
+      self.rpys_sum += block
+
     self.idx = (self.idx + 1) % BLOCK_SIZE
     if self.idx == 0:
       self.block_idx += 1
       self.valid_blocks = max(self.block_idx, self.valid_blocks)
       self.block_idx = self.block_idx % INPUTS_WANTED
+      self.update_block_stats()
     if self.valid_blocks > 0:
-      self.rpy = np.mean(self.rpys[:self.valid_blocks], axis=0)
+      self.rpy = self.rpys_sum / self.valid_blocks
 
     self.update_status()
 
@@ -0,0 +1,32 @@
+"""Row layout of the columnar locationd and paramsd inputs, shared by the daemons and offline.py."""
+import numpy as np
+
+# the service a row came from
+CAR_STATE, LIVE_LOCATION_KALMAN, GYRO, ACCELEROMETER, CAMERA_ODOMETRY, LIVE_CALIBRATION, GPS = range(7)
+
+PARAMSD_INPUT = np.dtype([
+  ('t', np.float64),
+  ('which', np.uint8),
+  # carState
+  ('steering_angle_deg', np.float64),
+  ('steering_pressed', np.bool_),
+  ('v_ego', np.float64),
+  # liveLocationKalman
+  ('yaw_rate', np.float64),
+  ('yaw_rate_std', np.float64),
+  ('yaw_rate_ok', np.bool_),  # inputsOK, posenetOK and a valid calibrated yaw rate
+])
+
+# values of a locationd row, by service:
+#   GYRO, ACCELEROMETER: v[0:3] the sensor reading
+#   CAR_STATE: v[0] vEgo
+#   CAMERA_ODOMETRY: v[0:3] rot, v[3:6] rotStd, v[6:9] trans, v[9:12] transStd
+#   LIVE_CALIBRATION: v[0:3] rpyCalib, v[3] calStatus
+#   GPS: v[0:3] latitude, longitude, altitude, v[3:6] vNED, v[6] verticalAccuracy, v[7] speedAccuracy,
+#        v[8] bearingDeg, v[9] timestamp
+LOCATIOND_INPUT = np.dtype([
+  ('t', np.float64),
+  ('which', np.uint8),
+  ('v', np.float64, (12,)),
+])
+
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import json
+import math
 import numpy as np
-import sympy as sp
 import cereal.messaging as messaging
 from cereal import log
 from common.params import Params
@@ -11,17 +11,15 @@ from common.transformations.orientation import ecef_euler_from_ned, \
                                                ned_euler_from_ecef, \
                                                quat_from_euler, euler_from_rot, \
                                                rot_from_quat, rot_from_euler
-from rednose.helpers import KalmanError
 from selfdrive.locationd.models.live_kf import LiveKalman, States, ObservationKind
+from rednose.helpers import KalmanError
 from selfdrive.locationd.models.constants import GENERATED_DIR
+from selfdrive.locationd.columns import ACCELEROMETER, CAMERA_ODOMETRY, CAR_STATE, GPS, GYRO, LIVE_CALIBRATION
 from selfdrive.swaglog import cloudlog
 
 #from datetime import datetime
 #from laika.gps_time import GPSTime
 
-from sympy.utilities.lambdify import lambdify
-from rednose.helpers.sympy_helpers import euler_rotate
-
 SensorSource = log.SensorEventData.SensorSource
 
 
@@ -30,24 +28,108 @@ SENSOR_DECIMATION = 10
 POSENET_STD_HIST = 40
 
 
-def to_float(arr):
-  return [float(arr[0]), float(arr[1]), float(arr[2])]
-
-
-def get_H():
-  # this returns a function to eval the jacobian
-  # of the observation function of the local vel
-  roll = sp.Symbol('roll')
-  pitch = sp.Symbol('pitch')
-  yaw = sp.Symbol('yaw')
-  vx = sp.Symbol('vx')
-  vy = sp.Symbol('vy')
-  vz = sp.Symbol('vz')
-
-  h = euler_rotate(roll, pitch, yaw).T*(sp.Matrix([vx, vy, vz]))
-  H = h.jacobian(sp.Matrix([roll, pitch, yaw, vx, vy, vz]))
-  H_f = lambdify([roll, pitch, yaw, vx, vy, vz], H)
-  return H_f
+# liveLocationKalman measurements, in the order of the rows of the output arrays
+MEASUREMENTS = ['positionGeodetic', 'positionECEF', 'velocityECEF', 'velocityNED', 'velocityDevice',
+                'accelerationDevice', 'orientationECEF', 'calibratedOrientationECEF', 'orientationNED',
+                'angularVelocityDevice', 'velocityCalibrated', 'angularVelocityCalibrated', 'accelerationCalibrated']
+# measurements only valid when calibrated
+CALIBRATED_MEASUREMENTS = ['calibratedOrientationECEF', 'velocityCalibrated', 'angularVelocityCalibrated', 'accelerationCalibrated']
+# measurements without a std, these rows stay nan
+NO_STD_MEASUREMENTS = ['positionGeodetic', 'velocityNED', 'calibratedOrientationECEF', 'orientationNED']
+
+(POSITION_GEODETIC, POSITION_ECEF, VELOCITY_ECEF, VELOCITY_NED, VELOCITY_DEVICE, ACCELERATION_DEVICE,
+ ORIENTATION_ECEF, CALIBRATED_ORIENTATION_ECEF, ORIENTATION_NED, ANGULAR_VELOCITY_DEVICE,
+ VELOCITY_CALIBRATED, ANGULAR_VELOCITY_CALIBRATED, ACCELERATION_CALIBRATED) = range(len(MEASUREMENTS))
+
+# liveLocationKalman after every cameraOdometry of an offline run
+LOCATIOND_OUTPUT = np.dtype([
+  ('t', np.float64),
+  ('values', np.float64, (len(MEASUREMENTS), 3)),
+  ('stds', np.float64, (len(MEASUREMENTS), 3)),
+  ('calibrated', np.bool_),
+  ('posenet_ok', np.bool_),
+  ('device_stable', np.bool_),
+])
+
+
+def std_of_transformed(A, cov):
+  # sqrt(diag(A cov A^T)) without the second matrix product
+  return np.sqrt(np.einsum('ij,ij->i', A.dot(cov), A))
+
+
+def vel_device_jacobian(euler, vel_ecef, device_from_ecef, out):
+  """Jacobian of the device frame velocity rot_from_euler(euler).T * vel_ecef w.r.t.
+     (roll, pitch, yaw, vx, vy, vz), written into the 3x6 out."""
+  cr, sr = math.cos(euler[0]), math.sin(euler[0])
+  cp, sp = math.cos(euler[1]), math.sin(euler[1])
+  cy, sy = math.cos(euler[2]), math.sin(euler[2])
+  vx, vy, vz = vel_ecef
+
+  # rotated back through yaw and pitch
+  a0, a1 = cy*vx + sy*vy, -sy*vx + cy*vy
+  b1, b2 = a1, sp*a0 + cp*vz
+  out[0, 0], out[1, 0], out[2, 0] = 0., -sr*b1 + cr*b2, -cr*b1 - sr*b2
+
+  c0, c2 = -sp*a0 - cp*vz, cp*a0 - sp*vz
+  out[0, 1], out[1, 1], out[2, 1] = c0, sr*c2, cr*c2
+
+  d0, d1 = -sy*vx + cy*vy, -cy*vx - sy*vy
+  e0, e2 = cp*d0, sp*d0
+  out[0, 2], out[1, 2], out[2, 2] = e0, cr*d1 + sr*e2, -sr*d1 + cr*e2
+
+  out[:, 3:] = device_from_ecef
+
+
+class LiveOutputs():
+  """Preallocated output arrays of Localizer.msg_from_state, one row per measurement."""
+  def __init__(self):
+    self.values = np.zeros((len(MEASUREMENTS), 3))
+    self.stds = np.zeros((len(MEASUREMENTS), 3))
+    self.stds[[MEASUREMENTS.index(m) for m in NO_STD_MEASUREMENTS]] = np.nan
+    self.H = np.zeros((3, 6))
+
+  def update(self, ned_from_ecef, calib_from_device, state, cov):
+    """Computes all measurements and their stds from the filter state in one pass."""
+    values, stds = self.values, self.stds
+    predicted_std = np.sqrt(np.diagonal(cov))
+
+    fix_ecef = state[States.ECEF_POS]
+    vel_ecef = state[States.ECEF_VELOCITY]
+    quat = state[States.ECEF_ORIENTATION]
+    ecef_from_device = rot_from_quat(quat)
+    device_from_ecef = ecef_from_device.T
+
+    values[POSITION_GEODETIC] = coord.ecef2geodetic(fix_ecef)
+    values[POSITION_ECEF] = fix_ecef
+    stds[POSITION_ECEF] = predicted_std[States.ECEF_POS_ERR]
+    values[VELOCITY_ECEF] = vel_ecef
+    stds[VELOCITY_ECEF] = predicted_std[States.ECEF_VELOCITY_ERR]
+    values[VELOCITY_NED] = ned_from_ecef.dot(vel_ecef)
+
+    values[ORIENTATION_ECEF] = euler_from_quat(quat)
+    stds[ORIENTATION_ECEF] = predicted_std[States.ECEF_ORIENTATION_ERR]
+    values[CALIBRATED_ORIENTATION_ECEF] = euler_from_rot(calib_from_device.dot(device_from_ecef))
+    values[ORIENTATION_NED] = ned_euler_from_ecef(fix_ecef, values[ORIENTATION_ECEF])
+
+    values[ACCELERATION_DEVICE] = state[States.ACCELERATION]
+    stds[ACCELERATION_DEVICE] = predicted_std[States.ACCELERATION_ERR]
+    values[ACCELERATION_CALIBRATED] = calib_from_device.dot(state[States.ACCELERATION])
+    stds[ACCELERATION_CALIBRATED] = std_of_transformed(calib_from_device, cov[States.ACCELERATION_ERR, States.ACCELERATION_ERR])
+
+    values[ANGULAR_VELOCITY_DEVICE] = state[States.ANGULAR_VELOCITY]
+    stds[ANGULAR_VELOCITY_DEVICE] = predicted_std[States.ANGULAR_VELOCITY_ERR]
+    values[ANGULAR_VELOCITY_CALIBRATED] = calib_from_device.dot(state[States.ANGULAR_VELOCITY])
+    stds[ANGULAR_VELOCITY_CALIBRATED] = std_of_transformed(calib_from_device, cov[States.ANGULAR_VELOCITY_ERR, States.ANGULAR_VELOCITY_ERR])
+
+    # orientation and velocity errors are next to each other in the error state
+    vel_device_jacobian(values[ORIENTATION_ECEF], vel_ecef, device_from_ecef, self.H)
+    condensed_cov = cov[States.ECEF_ORIENTATION_ERR.start:States.ECEF_VELOCITY_ERR.stop,
+                        States.ECEF_ORIENTATION_ERR.start:States.ECEF_VELOCITY_ERR.stop]
+    vel_device_cov = self.H.dot(condensed_cov).dot(self.H.T)
+    values[VELOCITY_DEVICE] = device_from_ecef.dot(vel_ecef)
+    stds[VELOCITY_DEVICE] = np.sqrt(np.diagonal(vel_device_cov))
+    values[VELOCITY_CALIBRATED] = calib_from_device.dot(values[VELOCITY_DEVICE])
+    stds[VELOCITY_CALIBRATED] = std_of_transformed(calib_from_device, vel_device_cov)
 
 
 class Localizer():
@@ -63,7 +145,7 @@ class Localizer():
     self.device_from_calib = np.eye(3)
     self.calib_from_device = np.eye(3)
     self.calibrated = False
-    self.H = get_H()
+    self.outputs = LiveOutputs()
 
     self.posenet_invalid_count = 0
     self.posenet_speed = 0
@@ -77,82 +159,22 @@ class Localizer():
     self.device_fell = False
 
   @staticmethod
-  def msg_from_state(converter, calib_from_device, H, predicted_state, predicted_cov, calibrated):
-    predicted_std = np.sqrt(np.diagonal(predicted_cov))
-
-    fix_ecef = predicted_state[States.ECEF_POS]
-    fix_ecef_std = predicted_std[States.ECEF_POS_ERR]
-    vel_ecef = predicted_state[States.ECEF_VELOCITY]
-    vel_ecef_std = predicted_std[States.ECEF_VELOCITY_ERR]
-    fix_pos_geo = coord.ecef2geodetic(fix_ecef)
-    #fix_pos_geo_std = np.abs(coord.ecef2geodetic(fix_ecef + fix_ecef_std) - fix_pos_geo)
-    orientation_ecef = euler_from_quat(predicted_state[States.ECEF_ORIENTATION])
-    orientation_ecef_std = predicted_std[States.ECEF_ORIENTATION_ERR]
-    device_from_ecef = rot_from_quat(predicted_state[States.ECEF_ORIENTATION]).T
-    calibrated_orientation_ecef = euler_from_rot(calib_from_device.dot(device_from_ecef))
-
-    acc_calib = calib_from_device.dot(predicted_state[States.ACCELERATION])
-    acc_calib_std = np.sqrt(np.diagonal(calib_from_device.dot(
-      predicted_cov[States.ACCELERATION_ERR, States.ACCELERATION_ERR]).dot(
-        calib_from_device.T)))
-    ang_vel_calib = calib_from_device.dot(predicted_state[States.ANGULAR_VELOCITY])
-    ang_vel_calib_std = np.sqrt(np.diagonal(calib_from_device.dot(
-      predicted_cov[States.ANGULAR_VELOCITY_ERR, States.ANGULAR_VELOCITY_ERR]).dot(
-        calib_from_device.T)))
-
-    vel_device = device_from_ecef.dot(vel_ecef)
-    device_from_ecef_eul = euler_from_quat(predicted_state[States.ECEF_ORIENTATION]).T
-    idxs = list(range(States.ECEF_ORIENTATION_ERR.start, States.ECEF_ORIENTATION_ERR.stop)) + \
-           list(range(States.ECEF_VELOCITY_ERR.start, States.ECEF_VELOCITY_ERR.stop))
-    condensed_cov = predicted_cov[idxs][:, idxs]
-    HH = H(*list(np.concatenate([device_from_ecef_eul, vel_ecef])))
-    vel_device_cov = HH.dot(condensed_cov).dot(HH.T)
-    vel_device_std = np.sqrt(np.diagonal(vel_device_cov))
-
-    vel_calib = calib_from_device.dot(vel_device)
-    vel_calib_std = np.sqrt(np.diagonal(calib_from_device.dot(
-      vel_device_cov).dot(calib_from_device.T)))
-
-    orientation_ned = ned_euler_from_ecef(fix_ecef, orientation_ecef)
-    #orientation_ned_std = ned_euler_from_ecef(fix_ecef, orientation_ecef + orientation_ecef_std) - orientation_ned
-    ned_vel = converter.ecef2ned(fix_ecef + vel_ecef) - converter.ecef2ned(fix_ecef)
-    #ned_vel_std = self.converter.ecef2ned(fix_ecef + vel_ecef + vel_ecef_std) - self.converter.ecef2ned(fix_ecef + vel_ecef)
+  def msg_from_state(converter, calib_from_device, outputs, predicted_state, predicted_cov, calibrated):
+    outputs.update(converter.ned_from_ecef_matrix, calib_from_device, predicted_state, predicted_cov)
+    values, stds = outputs.values.tolist(), outputs.stds.tolist()
 
     fix = messaging.log.LiveLocationKalman.new_message()
-
-    # write measurements to msg
-    measurements = [
-      # measurement field, value, std, valid
-      (fix.positionGeodetic, fix_pos_geo, np.nan*np.zeros(3), True),
-      (fix.positionECEF, fix_ecef, fix_ecef_std, True),
-      (fix.velocityECEF, vel_ecef, vel_ecef_std, True),
-      (fix.velocityNED, ned_vel, np.nan*np.zeros(3), True),
-      (fix.velocityDevice, vel_device, vel_device_std, True),
-      (fix.accelerationDevice, predicted_state[States.ACCELERATION], predicted_std[States.ACCELERATION_ERR], True),
-      (fix.orientationECEF, orientation_ecef, orientation_ecef_std, True),
-      (fix.calibratedOrientationECEF, calibrated_orientation_ecef, np.nan*np.zeros(3), calibrated),
-      (fix.orientationNED, orientation_ned, np.nan*np.zeros(3), True),
-      (fix.angularVelocityDevice, predicted_state[States.ANGULAR_VELOCITY], predicted_std[States.ANGULAR_VELOCITY_ERR], True),
-      (fix.velocityCalibrated, vel_calib, vel_calib_std, calibrated),
-      (fix.angularVelocityCalibrated, ang_vel_calib, ang_vel_calib_std, calibrated),
-      (fix.accelerationCalibrated, acc_calib, acc_calib_std, calibrated),
-    ]
-
-    for field, value, std, valid in measurements:
-      # TODO: can we write the lists faster?
-      field.value = to_float(value)
-      field.std = to_float(std)
-      field.valid = valid
+    for i, name in enumerate(MEASUREMENTS):
+      field = getattr(fix, name)
+      field.value = values[i]
+      field.std = stds[i]
+      field.valid = calibrated if name in CALIBRATED_MEASUREMENTS else True
 
     return fix
 
   def liveLocationMsg(self):
-    fix = self.msg_from_state(self.converter, self.calib_from_device, self.H, self.kf.x, self.kf.P, self.calibrated)
-    # experimentally found these values, no false positives in 20k minutes of driving
-    old_mean, new_mean = np.mean(self.posenet_stds[:POSENET_STD_HIST//2]), np.mean(self.posenet_stds[POSENET_STD_HIST//2:])
-    std_spike = new_mean/old_mean > 4 and new_mean > 7
-
-    fix.posenetOK = not (std_spike and self.car_speed > 5)
+    fix = self.msg_from_state(self.converter, self.calib_from_device, self.outputs, self.kf.x, self.kf.P, self.calibrated)
+    fix.posenetOK = self.posenet_ok()
     fix.deviceStable = not self.device_fell
     self.device_fell = False
 
@@ -168,6 +190,12 @@ class Localizer():
       fix.status = 'uninitialized'
     return fix
 
+  def posenet_ok(self):
+    # experimentally found these values, no false positives in 20k minutes of driving
+    old_mean, new_mean = np.mean(self.posenet_stds[:POSENET_STD_HIST//2]), np.mean(self.posenet_stds[POSENET_STD_HIST//2:])
+    std_spike = new_mean/old_mean > 4 and new_mean > 7
+    return not (std_spike and self.car_speed > 5)
+
   def update_kalman(self, time, kind, meas, R=None):
     try:
       self.kf.predict_and_observe(time, kind, meas, R)
@@ -180,23 +208,27 @@ class Localizer():
     if log.flags % 2 == 0:
       return
 
+    self.update_gps(current_time, [log.latitude, log.longitude, log.altitude], np.array(log.vNED),
+                    log.verticalAccuracy, log.speedAccuracy, log.bearingDeg, log.timestamp)
+
+  def update_gps(self, current_time, geodetic, v_ned, vertical_accuracy, speed_accuracy, bearing_deg, timestamp):
     self.last_gps_fix = current_time
 
-    self.converter = coord.LocalCoord.from_geodetic([log.latitude, log.longitude, log.altitude])
+    self.converter = coord.LocalCoord.from_geodetic(geodetic)
     ecef_pos = self.converter.ned2ecef([0, 0, 0])
-    ecef_vel = self.converter.ned2ecef(np.array(log.vNED)) - ecef_pos
-    ecef_pos_R = np.diag([(3*log.verticalAccuracy)**2]*3)
-    ecef_vel_R = np.diag([(log.speedAccuracy)**2]*3)
+    ecef_vel = self.converter.ned2ecef(v_ned) - ecef_pos
+    ecef_pos_R = np.diag([(3*vertical_accuracy)**2]*3)
+    ecef_vel_R = np.diag([(speed_accuracy)**2]*3)
 
-    #self.time = GPSTime.from_datetime(datetime.utcfromtimestamp(log.timestamp*1e-3))
-    self.unix_timestamp_millis = log.timestamp
+    #self.time = GPSTime.from_datetime(datetime.utcfromtimestamp(timestamp*1e-3))
+    self.unix_timestamp_millis = timestamp
     gps_est_error = np.sqrt((self.kf.x[0] - ecef_pos[0])**2 +
                             (self.kf.x[1] - ecef_pos[1])**2 +
                             (self.kf.x[2] - ecef_pos[2])**2)
 
     orientation_ecef = euler_from_quat(self.kf.x[States.ECEF_ORIENTATION])
     orientation_ned = ned_euler_from_ecef(ecef_pos, orientation_ecef)
-    orientation_ned_gps = np.array([0, 0, np.radians(log.bearingDeg)])
+    orientation_ned_gps = np.array([0, 0, np.radians(bearing_deg)])
     orientation_error = np.mod(orientation_ned - orientation_ned_gps - np.pi, 2*np.pi) - np.pi
     initial_pose_ecef_quat = quat_from_euler(ecef_euler_from_ned(ecef_pos, orientation_ned_gps))
     if np.linalg.norm(ecef_vel) > 5 and np.linalg.norm(orientation_error) > 1:
@@ -270,6 +302,85 @@ class Localizer():
       self.calib_from_device = self.device_from_calib.T
       self.calibrated = log.calStatus == 1
 
+  def handle_columns(self, inputs):
+    """Runs the filter over a whole route of LOCATIOND_INPUT rows, like the handle_* methods would one message
+       at a time. Returns a LOCATIOND_OUTPUT row for every cameraOdometry, the liveLocationKalman sent after it."""
+    n = len(inputs)
+    which = inputs['which'].tolist()
+    ts = inputs['t'].tolist()
+    v = np.ascontiguousarray(inputs['v'])
+    is_calib = inputs['which'] == LIVE_CALIBRATION
+
+    # all observations are made up front, the filter keeps the ones it may rewind to so these are never written
+    imu = np.ascontiguousarray(-v[:, 2::-1])
+    fell = (np.linalg.norm(v[:, :3] - [10, 0, 0], axis=1) > 40).tolist()
+    speed = np.ascontiguousarray(v[:, :1])
+    speeds = v[:, 0].tolist()
+    no_rot = np.zeros((1, 3))
+    R = {kind: noise[None] for kind, noise in self.kf.obs_noise.items()}
+
+    # camera odometry in the device frame, with the calibration of the time of each row
+    device_from_calib = np.concatenate([self.device_from_calib[None], rot_from_euler(v[is_calib, :3]).reshape(-1, 3, 3)])
+    device_from_calib = device_from_calib[np.cumsum(is_calib)]
+    cam = np.einsum('nij,nkj->nki', device_from_calib, v.reshape(n, 4, 3))
+    cam_rot = np.concatenate([cam[:, 0], 10*cam[:, 1]], axis=1)
+    cam_trans = np.concatenate([cam[:, 2], 10*cam[:, 3]], axis=1)
+    posenet_speeds = np.linalg.norm(cam[:, 2], axis=1).tolist()
+    posenet_stds = cam[:, 3, 0].tolist()
+
+    outputs = np.zeros(which.count(CAMERA_ODOMETRY), dtype=LOCATIOND_OUTPUT)
+    j = 0
+    for i in range(n):
+      t, kind = ts[i], which[i]
+      if kind == GYRO:
+        self.gyro_counter += 1
+        if self.gyro_counter % SENSOR_DECIMATION == 0:
+          self.update_kalman(t, ObservationKind.PHONE_GYRO, imu[i:i+1], R[ObservationKind.PHONE_GYRO])
+
+      elif kind == ACCELEROMETER:
+        self.device_fell = self.device_fell or fell[i]
+        self.acc_counter += 1
+        if self.acc_counter % SENSOR_DECIMATION == 0:
+          self.update_kalman(t, ObservationKind.PHONE_ACCEL, imu[i:i+1], R[ObservationKind.PHONE_ACCEL])
+
+      elif kind == CAR_STATE:
+        self.speed_counter += 1
+        if self.speed_counter % SENSOR_DECIMATION == 0:
+          self.update_kalman(t, ObservationKind.ODOMETRIC_SPEED, speed[i:i+1])
+          self.car_speed = abs(speeds[i])
+          if speeds[i] == 0:
+            self.update_kalman(t, ObservationKind.NO_ROT, no_rot, R[ObservationKind.NO_ROT])
+
+      elif kind == CAMERA_ODOMETRY:
+        self.cam_counter += 1
+        if self.cam_counter % VISION_DECIMATION == 0:
+          self.update_kalman(t, ObservationKind.CAMERA_ODO_ROTATION, cam_rot[i:i+1])
+          self.posenet_speed = posenet_speeds[i]
+          self.posenet_stds[:-1] = self.posenet_stds[1:]
+          self.posenet_stds[-1] = posenet_stds[i]
+          self.update_kalman(t, ObservationKind.CAMERA_ODO_TRANSLATION, cam_trans[i:i+1])
+
+        self.outputs.update(self.converter.ned_from_ecef_matrix, self.calib_from_device, self.kf.x, self.kf.P)
+        outputs['t'][j] = t
+        outputs['values'][j] = self.outputs.values
+        outputs['stds'][j] = self.outputs.stds
+        outputs['calibrated'][j] = self.calibrated
+        outputs['posenet_ok'][j] = self.posenet_ok()
+        outputs['device_stable'][j] = not self.device_fell
+        self.device_fell = False
+        j += 1
+
+      elif kind == LIVE_CALIBRATION:
+        self.calib = v[i, :3]
+        self.device_from_calib = device_from_calib[i]
+        self.calib_from_device = self.device_from_calib.T
+        self.calibrated = bool(v[i, 3] == 1)
+
+      elif kind == GPS:
+        self.update_gps(t, v[i, :3], v[i, 3:6], v[i, 6], v[i, 7], v[i, 8], int(v[i, 9]))
+
+    return outputs
+
   def reset_kalman(self, current_time=None, init_orient=None, init_pos=None):
     self.filter_time = current_time
     init_x = LiveKalman.initial_x.copy()
@@ -0,0 +1,5 @@
+from common.lazy_import import lazy_import
+
+# rednose's EKF_sym imports sympy at module level, but the filters only need it to generate
+# their code at build time. Deferred, sympy is not loaded by the daemons.
+lazy_import('sympy')
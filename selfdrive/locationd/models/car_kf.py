@@ -4,10 +4,9 @@ import sys
 from typing import Any, Dict
 
 import numpy as np
-import sympy as sp
 
 from rednose import KalmanFilter
-from rednose.helpers.ekf_sym import EKF_sym, gen_code
+from rednose.helpers.ekf_sym import EKF_sym
 from selfdrive.locationd.models.constants import ObservationKind
 from selfdrive.swaglog import cloudlog
 
@@ -22,6 +21,13 @@ def _slice(n):
   return s
 
 
+class GlobalVar(str):
+  """Name of a global of the generated code, stands in for its sympy Symbol at runtime."""
+  @property
+  def name(self):
+    return str(self)
+
+
 class States():
   # Vehicle model params
   STIFFNESS = _slice(1)  # [-]
@@ -70,21 +76,26 @@ class CarKalman(KalmanFilter):
   }
 
   global_vars = [
-    sp.Symbol('mass'),
-    sp.Symbol('rotational_inertia'),
-    sp.Symbol('center_to_front'),
-    sp.Symbol('center_to_rear'),
-    sp.Symbol('stiffness_front'),
-    sp.Symbol('stiffness_rear'),
+    GlobalVar('mass'),
+    GlobalVar('rotational_inertia'),
+    GlobalVar('center_to_front'),
+    GlobalVar('center_to_rear'),
+    GlobalVar('stiffness_front'),
+    GlobalVar('stiffness_rear'),
   ]
 
   @staticmethod
   def generate_code(generated_dir):
+    # sympy is only needed at build time, paramsd loads the generated code
+    import sympy as sp
+    from rednose.helpers.ekf_sym import gen_code
+
     dim_state = CarKalman.initial_x.shape[0]
     name = CarKalman.name
 
     # globals
-    m, j, aF, aR, cF_orig, cR_orig = CarKalman.global_vars
+    global_vars = [sp.Symbol(var.name) for var in CarKalman.global_vars]
+    m, j, aF, aR, cF_orig, cR_orig = global_vars
 
     # make functions and jacobians with sympy
     # state variables
@@ -138,7 +149,7 @@ class CarKalman(KalmanFilter):
       [sp.Matrix([x]), ObservationKind.STIFFNESS, None],
     ]
 
-    gen_code(generated_dir, name, f_sym, dt, state_sym, obs_eqs, dim_state, dim_state, global_vars=CarKalman.global_vars)
+    gen_code(generated_dir, name, f_sym, dt, state_sym, obs_eqs, dim_state, dim_state, global_vars=global_vars)
 
   def __init__(self, generated_dir, steer_ratio=15, stiffness_factor=1, angle_offset=0):  # pylint: disable=super-init-not-called
     dim_state = self.initial_x.shape[0]
@@ -3,12 +3,10 @@
 import sys
 
 import numpy as np
-import sympy as sp
 
 from selfdrive.swaglog import cloudlog
 from selfdrive.locationd.models.constants import ObservationKind
-from rednose.helpers.ekf_sym import EKF_sym, gen_code
-from rednose.helpers.sympy_helpers import euler_rotate, quat_matrix_r, quat_rotate
+from rednose.helpers.ekf_sym import EKF_sym
 
 EARTH_GM = 3.986005e14  # m^3/s^2 (gravitational constant * mass of earth)
 
@@ -68,6 +66,11 @@ class LiveKalman():
 
   @staticmethod
   def generate_code(generated_dir):
+    # sympy is only needed at build time, locationd loads the generated code
+    import sympy as sp
+    from rednose.helpers.ekf_sym import gen_code
+    from rednose.helpers.sympy_helpers import euler_rotate, quat_matrix_r, quat_rotate
+
     name = LiveKalman.name
     dim_state = LiveKalman.initial_x.shape[0]
     dim_state_err = LiveKalman.initial_P_diag.shape[0]
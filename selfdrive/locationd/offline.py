@@ -0,0 +1,80 @@
+"""Columnar inputs to run locationd and paramsd over whole routes offline.
+
+The messages of a route are converted once into a structured array (layout in columns.py) with one row per
+observation, in the order they were received. Localizer.handle_columns and
+ParamsLearner.handle_columns then run the filter over it without touching capnp.
+"""
+from multiprocessing import Pool
+
+import numpy as np
+
+from cereal import log
+from selfdrive.locationd.columns import ACCELEROMETER, CAMERA_ODOMETRY, CAR_STATE, GPS, GYRO, LIVE_CALIBRATION, \
+                                       LIVE_LOCATION_KALMAN, LOCATIOND_INPUT, PARAMSD_INPUT
+
+SensorSource = log.SensorEventData.SensorSource
+
+
+def paramsd_inputs(msgs):
+  """PARAMSD_INPUT rows of the carState and liveLocationKalman messages, which are sorted by logMonoTime.
+
+     The rows are in the order paramsd's main() handles them. Its SubMaster polls on liveLocationKalman,
+     so every liveLocationKalman is followed by only the latest carState received since the previous one.
+  """
+  rows = []
+  last_cs = None
+  for m in msgs:
+    which = m.which()
+    if which == 'carState':
+      last_cs = m
+    elif which == 'liveLocationKalman':
+      llk = m.liveLocationKalman
+      yaw_rate = llk.angularVelocityCalibrated
+      yaw_rate_ok = llk.inputsOK and llk.posenetOK and yaw_rate.valid
+      rows.append((m.logMonoTime * 1e-9, LIVE_LOCATION_KALMAN, 0., False, 0., yaw_rate.value[2], yaw_rate.std[2], yaw_rate_ok))
+      if last_cs is not None:
+        cs = last_cs.carState
+        rows.append((last_cs.logMonoTime * 1e-9, CAR_STATE, cs.steeringAngleDeg, cs.steeringPressed, cs.vEgo, 0., 0., False))
+        last_cs = None
+  return np.array(rows, dtype=PARAMSD_INPUT)
+
+
+def locationd_inputs(msgs):
+  """LOCATIOND_INPUT rows of the valid messages locationd subscribes to, sorted by logMonoTime."""
+  rows = []
+  for m in msgs:
+    if not m.valid:
+      continue
+    t = m.logMonoTime * 1e-9
+    which = m.which()
+    if which == 'sensorEvents':
+      for reading in m.sensorEvents:
+        if reading.source == SensorSource.lsm6ds3:
+          continue
+        if reading.sensor == 5 and reading.type == 16:
+          rows.append((reading.timestamp * 1e-9, GYRO, list(reading.gyroUncalibrated.v) + [0.] * 9))
+        if reading.sensor == 1 and reading.type == 1:
+          rows.append((reading.timestamp * 1e-9, ACCELEROMETER, list(reading.acceleration.v) + [0.] * 9))
+    elif which == 'carState':
+      rows.append((t, CAR_STATE, [m.carState.vEgo] + [0.] * 11))
+    elif which == 'cameraOdometry':
+      co = m.cameraOdometry
+      rows.append((t, CAMERA_ODOMETRY, list(co.rot) + list(co.rotStd) + list(co.trans) + list(co.transStd)))
+    elif which == 'liveCalibration':
+      if len(m.liveCalibration.rpyCalib):
+        rows.append((t, LIVE_CALIBRATION, list(m.liveCalibration.rpyCalib) + [m.liveCalibration.calStatus] + [0.] * 8))
+    elif which == 'gpsLocationExternal':
+      gps = m.gpsLocationExternal
+      # ignore the message if the fix is invalid
+      if gps.flags % 2 == 0:
+        continue
+      rows.append((t, GPS, [gps.latitude, gps.longitude, gps.altitude] + list(gps.vNED) +
+                   [gps.verticalAccuracy, gps.speedAccuracy, gps.bearingDeg, gps.timestamp, 0., 0.]))
+  return np.array(rows, dtype=LOCATIOND_INPUT)
+
+
+def run_routes(fn, routes, workers=None):
+  """Runs fn(route) for every route in parallel processes, returns the results in order.
+     fn has to be importable, each worker builds its own filters."""
+  with Pool(workers) as pool:
+    return pool.map(fn, routes, chunksize=1)
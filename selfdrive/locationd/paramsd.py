@@ -9,8 +9,18 @@ from cereal import car
 from common.params import Params, put_nonblocking
 from selfdrive.locationd.models.car_kf import CarKalman, ObservationKind, States
 from selfdrive.locationd.models.constants import GENERATED_DIR
+from selfdrive.locationd.columns import CAR_STATE, LIVE_LOCATION_KALMAN
 from selfdrive.swaglog import cloudlog
 
+# learned parameters, after every liveLocationKalman of an offline run
+PARAMSD_OUTPUT = np.dtype([
+  ('t', np.float64),
+  ('steer_ratio', np.float64),
+  ('stiffness_factor', np.float64),
+  ('angle_offset_average_deg', np.float64),
+  ('angle_offset_deg', np.float64),
+])
+
 
 class ParamsLearner:
   def __init__(self, CP, steer_ratio, stiffness_factor, angle_offset):
@@ -31,6 +41,14 @@ class ParamsLearner:
 
     self.valid = True
 
+  def update_active(self, steering_angle, steering_pressed, speed):
+    self.steering_angle = steering_angle
+    self.steering_pressed = steering_pressed
+    self.speed = speed
+
+    in_linear_region = abs(self.steering_angle) < 45 or not self.steering_pressed
+    self.active = self.speed > 5 and in_linear_region
+
   def handle_log(self, t, which, msg):
     if which == 'liveLocationKalman':
 
@@ -47,12 +65,7 @@ class ParamsLearner:
         self.kf.predict_and_observe(t, ObservationKind.ANGLE_OFFSET_FAST, np.array([[[0]]]))
 
     elif which == 'carState':
-      self.steering_angle = msg.steeringAngleDeg
-      self.steering_pressed = msg.steeringPressed
-      self.speed = msg.vEgo
-
-      in_linear_region = abs(self.steering_angle) < 45 or not self.steering_pressed
-      self.active = self.speed > 5 and in_linear_region
+      self.update_active(msg.steeringAngleDeg, msg.steeringPressed, msg.vEgo)
 
       if self.active:
         self.kf.predict_and_observe(t, ObservationKind.STEER_ANGLE, np.array([[[math.radians(msg.steeringAngleDeg)]]]))
@@ -63,6 +76,64 @@ class ParamsLearner:
       self.kf.filter.filter_time = t
       self.kf.filter.reset_rewind()
 
+  def handle_columns(self, inputs):
+    """Runs the learner over a whole route of PARAMSD_INPUT rows, like handle_log would one message at a time.
+       Returns the learned parameters after every liveLocationKalman and the carState rows that follow it,
+       as main() publishes them, as PARAMSD_OUTPUT rows."""
+    n = len(inputs)
+    which = inputs['which'].tolist()
+    ts = inputs['t'].tolist()
+    steering_angles = inputs['steering_angle_deg'].tolist()
+    steering_pressed = inputs['steering_pressed'].tolist()
+    speeds = inputs['v_ego'].tolist()
+    yaw_rate_ok = inputs['yaw_rate_ok'].tolist()
+
+    # all observations are made up front, the filter keeps the ones it may rewind to so these are never written
+    z_steer = np.radians(inputs['steering_angle_deg']).reshape(n, 1, 1)
+    z_speed = np.ascontiguousarray(inputs['v_ego']).reshape(n, 1, 1)
+    z_yaw_rate = -np.ascontiguousarray(inputs['yaw_rate']).reshape(n, 1, 1)
+    R_yaw_rate = (inputs['yaw_rate_std']**2).reshape(n, 1, 1)
+    z_zero = np.zeros((1, 1, 1))
+    R = {kind: noise[None] for kind, noise in self.kf.obs_noise.items()}
+
+    outputs = np.zeros(which.count(LIVE_LOCATION_KALMAN), dtype=PARAMSD_OUTPUT)
+    x_out = np.zeros((len(outputs), 4))
+    x_idxs = [States.STEER_RATIO.start, States.STIFFNESS.start, States.ANGLE_OFFSET.start, States.ANGLE_OFFSET_FAST.start]
+    j = 0
+    in_update = False
+    for i in range(n):
+      t = ts[i]
+      if which[i] == LIVE_LOCATION_KALMAN:
+        in_update = True
+        if self.active:
+          if yaw_rate_ok[i]:
+            self.kf.predict_and_observe(t, ObservationKind.ROAD_FRAME_YAW_RATE, z_yaw_rate[i:i+1], R_yaw_rate[i:i+1])
+          self.kf.predict_and_observe(t, ObservationKind.ANGLE_OFFSET_FAST, z_zero, R[ObservationKind.ANGLE_OFFSET_FAST])
+
+      elif which[i] == CAR_STATE:
+        self.update_active(steering_angles[i], steering_pressed[i], speeds[i])
+
+        if self.active:
+          self.kf.predict_and_observe(t, ObservationKind.STEER_ANGLE, z_steer[i:i+1], R[ObservationKind.STEER_ANGLE])
+          self.kf.predict_and_observe(t, ObservationKind.ROAD_FRAME_X_SPEED, z_speed[i:i+1], R[ObservationKind.ROAD_FRAME_X_SPEED])
+
+      if not self.active:
+        # Reset time when stopped so uncertainty doesn't grow
+        self.kf.filter.filter_time = t
+        self.kf.filter.reset_rewind()
+
+      if in_update and (i + 1 == n or which[i + 1] == LIVE_LOCATION_KALMAN):
+        x_out[j] = self.kf.x[x_idxs]
+        j += 1
+        in_update = False
+
+    outputs['t'] = inputs['t'][inputs['which'] == LIVE_LOCATION_KALMAN]
+    outputs['steer_ratio'] = x_out[:, 0]
+    outputs['stiffness_factor'] = x_out[:, 1]
+    outputs['angle_offset_average_deg'] = np.degrees(x_out[:, 2])
+    outputs['angle_offset_deg'] = np.degrees(x_out[:, 2]) + np.degrees(x_out[:, 3])
+    return outputs
+
 
 def main(sm=None, pm=None):
   if sm is None:
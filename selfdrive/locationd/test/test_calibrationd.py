@@ -2,11 +2,79 @@
 import json
 import random
 import unittest
+import numpy as np
 
 import cereal.messaging as messaging
 from common.params import Params
+from common.transformations.orientation import euler_from_rot, rot_from_euler
+import selfdrive.locationd.calibrationd as calibrationd
 from selfdrive.locationd.calibrationd import Calibrator
 
+NUM_SAMPLES = 10000
+
+
+class ReferenceCalibrator(Calibrator):
+  """Calibrator as it was before the running block statistics."""
+  def update_status(self):
+    if self.valid_blocks > 0:
+      max_rpy_calib = np.array(np.max(self.rpys[:self.valid_blocks], axis=0))
+      min_rpy_calib = np.array(np.min(self.rpys[:self.valid_blocks], axis=0))
+      self.calib_spread = np.abs(max_rpy_calib - min_rpy_calib)
+    else:
+      self.calib_spread = np.zeros(3)
+
+    if self.valid_blocks < calibrationd.INPUTS_NEEDED:
+      self.cal_status = calibrationd.Calibration.UNCALIBRATED
+    elif calibrationd.is_calibration_valid(self.rpy):
+      self.cal_status = calibrationd.Calibration.CALIBRATED
+    else:
+      self.cal_status = calibrationd.Calibration.INVALID
+
+    if max(self.calib_spread) > calibrationd.MAX_ALLOWED_SPREAD and self.cal_status == calibrationd.Calibration.CALIBRATED:
+      self.reset(self.rpys[self.block_idx - 1], valid_blocks=calibrationd.INPUTS_NEEDED, smooth_from=self.rpy)
+
+  def handle_cam_odom(self, trans, rot, trans_std, rot_std):
+    self.old_rpy_weight = min(0.0, self.old_rpy_weight - 1/calibrationd.SMOOTH_CYCLES)
+
+    straight_and_fast = ((self.v_ego > calibrationd.MIN_SPEED_FILTER) and (trans[0] > calibrationd.MIN_SPEED_FILTER) and
+                         (abs(rot[2]) < calibrationd.MAX_YAW_RATE_FILTER))
+    certain_if_calib = ((np.arctan2(trans_std[1], trans[0]) < calibrationd.MAX_VEL_ANGLE_STD) or
+                        (self.valid_blocks < calibrationd.INPUTS_NEEDED))
+
+    if not (straight_and_fast and certain_if_calib):
+      return None
+
+    observed_rpy = np.array([0,
+                             -np.arctan2(trans[2], trans[0]),
+                             np.arctan2(trans[1], trans[0])])
+    new_rpy = euler_from_rot(rot_from_euler(self.get_smooth_rpy()).dot(rot_from_euler(observed_rpy)))
+    new_rpy = calibrationd.sanity_clip(new_rpy)
+
+    block_size = calibrationd.BLOCK_SIZE
+    self.rpys[self.block_idx] = (self.idx*self.rpys[self.block_idx] + (block_size - self.idx) * new_rpy) / float(block_size)
+    self.idx = (self.idx + 1) % block_size
+    if self.idx == 0:
+      self.block_idx += 1
+      self.valid_blocks = max(self.block_idx, self.valid_blocks)
+      self.block_idx = self.block_idx % calibrationd.INPUTS_WANTED
+    if self.valid_blocks > 0:
+      self.rpy = np.mean(self.rpys[:self.valid_blocks], axis=0)
+
+    self.update_status()
+
+    return new_rpy
+
+
+def random_drive():
+  """cameraOdometry of a drive where the device is remounted halfway, and the vEgo at each sample."""
+  v_ego = np.random.uniform(0., 35., NUM_SAMPLES)
+  pitch = np.where(np.arange(NUM_SAMPLES) < NUM_SAMPLES // 2, 0.02, -0.03) + np.random.normal(0., 0.01, NUM_SAMPLES)
+  yaw = np.where(np.arange(NUM_SAMPLES) < NUM_SAMPLES // 2, -0.01, 0.04) + np.random.normal(0., 0.01, NUM_SAMPLES)
+  trans = np.column_stack([v_ego, v_ego * np.tan(yaw), -v_ego * np.tan(pitch)])
+  rot = np.random.normal(0., 0.02, (NUM_SAMPLES, 3))
+  trans_std = np.random.uniform(0., 0.15, (NUM_SAMPLES, 3))
+  return v_ego, trans, rot, trans_std, np.abs(rot)
+
 
 class TestCalibrationd(unittest.TestCase):
 
@@ -31,6 +99,42 @@ class TestCalibrationd(unittest.TestCase):
     self.assertEqual(list(msg.liveCalibration.rpyCalib), c.rpy)
     self.assertEqual(msg.liveCalibration.validBlocks, c.valid_blocks)
 
+  def test_block_statistics(self):
+    np.random.seed(0)
+    v_ego, trans, rot, trans_std, rot_std = random_drive()
+    ref, c = ReferenceCalibrator(), Calibrator()
+    resets = 0
+    for i in range(NUM_SAMPLES):
+      ref.handle_v_ego(v_ego[i])
+      c.handle_v_ego(v_ego[i])
+      ref_rpy = ref.handle_cam_odom(trans[i], rot[i], trans_std[i], rot_std[i])
+      new_rpy = c.handle_cam_odom(trans[i], rot[i], trans_std[i], rot_std[i])
+
+      self.assertEqual(ref_rpy is None, new_rpy is None)
+      if new_rpy is not None:
+        np.testing.assert_allclose(new_rpy, ref_rpy, atol=1e-9)
+      np.testing.assert_allclose(c.rpy, ref.rpy, atol=1e-9)
+      np.testing.assert_allclose(c.calib_spread, ref.calib_spread, atol=1e-9)
+      self.assertEqual((c.valid_blocks, c.block_idx, c.idx, c.cal_status), (ref.valid_blocks, ref.block_idx, ref.idx, ref.cal_status))
+      resets += ref.old_rpy_weight == 1.0
+    self.assertGreater(resets, 0)
+    self.assertEqual(c.cal_status, calibrationd.Calibration.CALIBRATED)
+
+  def test_batch(self):
+    np.random.seed(1)
+    v_ego, trans, rot, trans_std, rot_std = random_drive()
+    c, batch = Calibrator(), Calibrator()
+    expected = []
+    for i in range(NUM_SAMPLES):
+      c.handle_v_ego(v_ego[i])
+      new_rpy = c.handle_cam_odom(trans[i], rot[i], trans_std[i], rot_std[i])
+      expected.append(np.full(3, np.nan) if new_rpy is None else new_rpy)
+
+    new_rpys = batch.handle_cam_odom_batch(v_ego, trans, rot, trans_std, rot_std)
+    np.testing.assert_allclose(new_rpys, expected, atol=1e-12)
+    np.testing.assert_allclose(batch.get_smooth_rpy(), c.get_smooth_rpy(), atol=1e-12)
+    self.assertEqual((batch.valid_blocks, batch.cal_status), (c.valid_blocks, c.cal_status))
+
 
 if __name__ == "__main__":
   unittest.main()
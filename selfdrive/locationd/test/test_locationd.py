@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+
+import common.transformations.coordinates as coord
+from common.transformations.orientation import euler_from_quat, euler_from_rot, ned_euler_from_ecef, \
+                                               rot_from_euler, rot_from_quat
+from selfdrive.locationd.locationd import CALIBRATED_MEASUREMENTS, MEASUREMENTS, NO_STD_MEASUREMENTS, \
+                                          LiveOutputs, vel_device_jacobian
+from selfdrive.locationd.models.live_kf import States
+
+NUM_STATES = 100
+
+
+def numerical_H(euler, vel_ecef, eps=1e-6):
+  def h(x):
+    return rot_from_euler(x[:3]).T.dot(x[3:])
+  x = np.concatenate([euler, vel_ecef])
+  H = np.zeros((3, 6))
+  for i in range(6):
+    dx = np.zeros(6)
+    dx[i] = eps
+    H[:, i] = (h(x + dx) - h(x - dx)) / (2 * eps)
+  return H
+
+
+def reference_outputs(converter, calib_from_device, predicted_state, predicted_cov):
+  """The output stage as msg_from_state computed it before LiveOutputs, with a numerical jacobian."""
+  predicted_std = np.sqrt(np.diagonal(predicted_cov))
+
+  fix_ecef = predicted_state[States.ECEF_POS]
+  vel_ecef = predicted_state[States.ECEF_VELOCITY]
+  orientation_ecef = euler_from_quat(predicted_state[States.ECEF_ORIENTATION])
+  device_from_ecef = rot_from_quat(predicted_state[States.ECEF_ORIENTATION]).T
+
+  idxs = list(range(States.ECEF_ORIENTATION_ERR.start, States.ECEF_ORIENTATION_ERR.stop)) + \
+         list(range(States.ECEF_VELOCITY_ERR.start, States.ECEF_VELOCITY_ERR.stop))
+  HH = numerical_H(orientation_ecef, vel_ecef)
+  vel_device_cov = HH.dot(predicted_cov[idxs][:, idxs]).dot(HH.T)
+  vel_device = device_from_ecef.dot(vel_ecef)
+
+  def std(A, cov):
+    return np.sqrt(np.diagonal(A.dot(cov).dot(A.T)))
+
+  acc_err, ang_err = States.ACCELERATION_ERR, States.ANGULAR_VELOCITY_ERR
+  return {
+    'positionGeodetic': (coord.ecef2geodetic(fix_ecef), None),
+    'positionECEF': (fix_ecef, predicted_std[States.ECEF_POS_ERR]),
+    'velocityECEF': (vel_ecef, predicted_std[States.ECEF_VELOCITY_ERR]),
+    'velocityNED': (converter.ecef2ned(fix_ecef + vel_ecef) - converter.ecef2ned(fix_ecef), None),
+    'velocityDevice': (vel_device, np.sqrt(np.diagonal(vel_device_cov))),
+    'accelerationDevice': (predicted_state[States.ACCELERATION], predicted_std[acc_err]),
+    'orientationECEF': (orientation_ecef, predicted_std[States.ECEF_ORIENTATION_ERR]),
+    'calibratedOrientationECEF': (euler_from_rot(calib_from_device.dot(device_from_ecef)), None),
+    'orientationNED': (ned_euler_from_ecef(fix_ecef, orientation_ecef), None),
+    'angularVelocityDevice': (predicted_state[States.ANGULAR_VELOCITY], predicted_std[ang_err]),
+    'velocityCalibrated': (calib_from_device.dot(vel_device), std(calib_from_device, vel_device_cov)),
+    'angularVelocityCalibrated': (calib_from_device.dot(predicted_state[States.ANGULAR_VELOCITY]),
+                                  std(calib_from_device, predicted_cov[ang_err, ang_err])),
+    'accelerationCalibrated': (calib_from_device.dot(predicted_state[States.ACCELERATION]),
+                               std(calib_from_device, predicted_cov[acc_err, acc_err])),
+  }
+
+
+def random_state():
+  geodetic = [np.random.uniform(-60, 60), np.random.uniform(-180, 180), np.random.uniform(-10, 1000)]
+  converter = coord.LocalCoord.from_geodetic(geodetic)
+  state = np.zeros(23)
+  state[States.ECEF_POS] = converter.ned2ecef(np.random.uniform(-1000, 1000, 3))
+  quat = np.random.normal(size=4)
+  state[States.ECEF_ORIENTATION] = quat / np.linalg.norm(quat)
+  state[States.ECEF_VELOCITY] = np.random.uniform(-40, 40, 3)
+  state[States.ANGULAR_VELOCITY] = np.random.uniform(-1, 1, 3)
+  state[States.ACCELERATION] = np.random.uniform(-5, 5, 3)
+  A = np.random.normal(size=(22, 22))
+  cov = A.dot(A.T) + 1e-3 * np.eye(22)
+  calib_from_device = rot_from_euler(np.random.uniform(-0.1, 0.1, 3)).T
+  return converter, calib_from_device, state, cov
+
+
+class TestLocationdOutputs(unittest.TestCase):
+  def test_vel_device_jacobian(self):
+    np.random.seed(0)
+    H = np.zeros((3, 6))
+    for _ in range(NUM_STATES):
+      euler = np.random.uniform(-np.pi, np.pi, 3) * [1, 0.45, 1]
+      vel = np.random.uniform(-40, 40, 3)
+      vel_device_jacobian(euler, vel, rot_from_euler(euler).T, H)
+      np.testing.assert_allclose(H, numerical_H(euler, vel), rtol=1e-6, atol=1e-6)
+
+  def test_matches_reference(self):
+    np.random.seed(0)
+    outputs = LiveOutputs()
+    states = [random_state() for _ in range(NUM_STATES)]
+
+    expected = [reference_outputs(*s) for s in states]
+
+    for (converter, calib_from_device, state, cov), exp in zip(states, expected):
+      outputs.update(converter.ned_from_ecef_matrix, calib_from_device, state, cov)
+
+      for i, name in enumerate(MEASUREMENTS):
+        value, std = exp[name]
+        np.testing.assert_allclose(outputs.values[i], value, rtol=1e-7, atol=1e-7, err_msg=name)
+        if std is None:
+          self.assertIn(name, NO_STD_MEASUREMENTS)
+          self.assertTrue(np.all(np.isnan(outputs.stds[i])))
+        else:
+          np.testing.assert_allclose(outputs.stds[i], std, rtol=1e-6, err_msg=name)
+
+    self.assertTrue(set(CALIBRATED_MEASUREMENTS) <= set(MEASUREMENTS))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+import unittest
+import numpy as np
+
+import cereal.messaging as messaging
+from cereal import car
+from common.params import Params
+from selfdrive.locationd import paramsd
+from selfdrive.locationd.locationd import Localizer
+from selfdrive.locationd.columns import CAR_STATE
+from selfdrive.locationd.offline import locationd_inputs, paramsd_inputs, run_routes
+from selfdrive.locationd.paramsd import ParamsLearner
+
+DURATION = 30.  # s
+
+
+def new_message(service, t):
+  msg = messaging.new_message(service)
+  msg.logMonoTime = int(t * 1e9)
+  msg.valid = True
+  return msg
+
+
+def get_CP():
+  CP = car.CarParams.new_message()
+  CP.mass = 1500.
+  CP.rotationalInertia = 2500.
+  CP.wheelbase = 2.7
+  CP.centerToFront = 1.2
+  CP.steerRatio = 15.
+  CP.tireStiffnessFront = 200000.
+  CP.tireStiffnessRear = 250000.
+  return CP
+
+
+def drive(seed):
+  """Messages of a synthetic drive, sorted by logMonoTime."""
+  np.random.seed(seed)
+  msgs = []
+  for t in np.arange(0., DURATION, 0.01):
+    cs = new_message('carState', t)
+    cs.carState.vEgo = max(0., 20. * np.sin(t / 10.) + np.random.normal(0., 0.1))
+    cs.carState.steeringAngleDeg = 10. * np.sin(t) + np.random.normal(0., 0.5)
+    cs.carState.steeringPressed = bool(np.random.rand() < 0.05)
+    msgs.append(cs)
+
+    sensors = new_message('sensorEvents', t + 0.002)
+    sensors.init('sensorEvents', 2)
+    gyro, accel = sensors.sensorEvents
+    gyro.sensor, gyro.type, gyro.timestamp = 5, 16, int((t + 0.001) * 1e9)
+    gyro.init('gyroUncalibrated').v = list(np.random.normal(0., 0.01, 3))
+    accel.sensor, accel.type, accel.timestamp = 1, 1, int((t + 0.001) * 1e9)
+    accel.init('acceleration').v = list(np.array([9.81, 0., 0.]) + np.random.normal(0., 0.1, 3))
+    msgs.append(sensors)
+
+    if round(t * 100) % 5 == 0:
+      odo = new_message('cameraOdometry', t + 0.005)
+      odo.cameraOdometry.trans = [cs.carState.vEgo, 0., 0.]
+      odo.cameraOdometry.transStd = list(np.random.uniform(0.1, 1., 3))
+      odo.cameraOdometry.rot = list(np.random.normal(0., 0.01, 3))
+      odo.cameraOdometry.rotStd = list(np.random.uniform(0.01, 0.1, 3))
+      msgs.append(odo)
+
+      llk = new_message('liveLocationKalman', t + 0.006)
+      llk.liveLocationKalman.inputsOK = True
+      llk.liveLocationKalman.posenetOK = bool(np.random.rand() > 0.05)
+      yaw_rate = llk.liveLocationKalman.angularVelocityCalibrated
+      yaw_rate.value = [0., 0., cs.carState.vEgo * np.radians(cs.carState.steeringAngleDeg) / (15. * 2.7)]
+      yaw_rate.std = [0.01, 0.01, 0.01]
+      yaw_rate.valid = True
+      msgs.append(llk)
+
+    if round(t * 100) % 400 == 0:
+      calib = new_message('liveCalibration', t + 0.007)
+      calib.liveCalibration.rpyCalib = list(np.random.normal(0., 0.02, 3))
+      calib.liveCalibration.calStatus = 1
+      msgs.append(calib)
+  return msgs
+
+
+class ReplayDone(Exception):
+  pass
+
+
+class LogSubMaster():
+  """Hands logged messages to paramsd's main() as its SubMaster, which polls on liveLocationKalman, would."""
+  def __init__(self, msgs):
+    self.msgs = iter(msgs)
+    self.frame = -1
+    self.updated = {'liveLocationKalman': False, 'carState': False}
+    self.logMonoTime = dict.fromkeys(self.updated, 0)
+    self.data = {}
+
+  def update(self):
+    self.updated = dict.fromkeys(self.updated, False)
+    for m in self.msgs:
+      which = m.which()
+      if which in self.updated:
+        self.updated[which] = True
+        self.logMonoTime[which] = m.logMonoTime
+        self.data[which] = getattr(m, which)
+        if which == 'liveLocationKalman':
+          self.frame += 1
+          return
+    raise ReplayDone
+
+  def __getitem__(self, s):
+    return self.data[s]
+
+
+class LivePM():
+  def __init__(self):
+    self.sent = []
+
+  def send(self, s, msg):
+    self.sent.append([msg.liveParameters.steerRatio, msg.liveParameters.stiffnessFactor])
+
+
+def learn_params(seed):
+  learner = ParamsLearner(get_CP(), 15., 1., 0.)
+  return learner.handle_columns(paramsd_inputs(drive(seed)))
+
+
+class TestOffline(unittest.TestCase):
+  def test_paramsd_columns(self):
+    msgs = drive(0)
+    CP = get_CP()
+    params = Params()
+    params.put("CarParams", CP.to_bytes())
+    params.delete("LiveParameters")
+
+    pm = LivePM()
+    with self.assertRaises(ReplayDone):
+      paramsd.main(LogSubMaster(msgs), pm)
+
+    inputs = paramsd_inputs(msgs)
+    llk_count = sum(m.which() == 'liveLocationKalman' for m in msgs)
+    self.assertEqual(np.count_nonzero(inputs['which'] == CAR_STATE), llk_count)
+
+    out = ParamsLearner(CP, CP.steerRatio, 1., 0.).handle_columns(inputs)
+    self.assertEqual(len(out), len(pm.sent))
+    # liveParameters are float32
+    np.testing.assert_allclose(np.column_stack([out['steer_ratio'], out['stiffness_factor']]), pm.sent, rtol=1e-6)
+
+  def test_locationd_columns(self):
+    msgs = drive(1)
+    localizer = Localizer()
+    expected = []
+    for m in msgs:
+      t = m.logMonoTime * 1e-9
+      which = m.which()
+      if which == 'sensorEvents':
+        localizer.handle_sensors(t, m.sensorEvents)
+      elif which == 'carState':
+        localizer.handle_car_state(t, m.carState)
+      elif which == 'liveCalibration':
+        localizer.handle_live_calib(t, m.liveCalibration)
+      elif which == 'cameraOdometry':
+        localizer.handle_cam_odo(t, m.cameraOdometry)
+        fix = localizer.liveLocationMsg()
+        expected.append((list(fix.velocityDevice.value), list(fix.angularVelocityCalibrated.std), fix.posenetOK))
+
+    out = Localizer().handle_columns(locationd_inputs(msgs))
+    self.assertEqual(len(out), len(expected))
+    np.testing.assert_allclose(out['values'][:, 4], [e[0] for e in expected], rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(out['stds'][:, 11], [e[1] for e in expected], rtol=1e-6, atol=1e-9)
+    np.testing.assert_equal(out['posenet_ok'], [e[2] for e in expected])
+
+  def test_run_routes(self):
+    seeds = [2, 3]
+    for out, seed in zip(run_routes(learn_params, seeds, workers=2), seeds):
+      np.testing.assert_equal(out, learn_params(seed))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import ast
+import os
+import subprocess
+import sys
+import unittest
+
+from common.basedir import BASEDIR
+
+# modules loaded by locationd and paramsd on the device
+RUNTIME_MODULES = [
+  'selfdrive.locationd.locationd',
+  'selfdrive.locationd.paramsd',
+  'selfdrive.locationd.models.live_kf',
+  'selfdrive.locationd.models.car_kf',
+]
+CODEGEN_MODULES = ['sympy', 'rednose.helpers.sympy_helpers']
+
+# sympy itself always imports sympy.core, the placeholder of common.lazy_import doesn't
+SYMPY_LOADED_SCRIPT = """
+import sys
+import {module}
+print('sympy.core' in sys.modules)
+"""
+
+
+def module_level_imports(module):
+  with open(os.path.join(BASEDIR, *module.split('.')) + '.py') as f:
+    tree = ast.parse(f.read())
+  for node in tree.body:
+    if isinstance(node, ast.Import):
+      yield from (alias.name for alias in node.names)
+    elif isinstance(node, ast.ImportFrom):
+      yield node.module
+
+
+class TestStartup(unittest.TestCase):
+  def test_no_sympy_at_runtime(self):
+    # the sympy models are turned into code at build time, only generate_code may use sympy
+    for module in RUNTIME_MODULES:
+      for imported in module_level_imports(module):
+        for codegen in CODEGEN_MODULES:
+          self.assertFalse(imported == codegen or imported.startswith(codegen + '.'), f"{module} imports {imported}")
+
+  def test_sympy_not_loaded(self):
+    # also catches sympy pulled in indirectly, e.g. through rednose.helpers.ekf_sym
+    for module in RUNTIME_MODULES[:2]:
+      out = subprocess.check_output([sys.executable, '-c', SYMPY_LOADED_SCRIPT.format(module=module)],
+                                    cwd=BASEDIR, encoding='utf8')
+      self.assertEqual(out.split()[-1], 'False', f"{module} loads sympy")
+
+
+if __name__ == "__main__":
+  unittest.main()
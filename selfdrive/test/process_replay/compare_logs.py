@@ -3,7 +3,7 @@ import bz2
 import os
 import sys
 import numbers
-import dictdiffer
+import numpy as np
 
 if "CI" in os.environ:
   def tqdm(x):
@@ -26,8 +26,18 @@ def save_log(dest, log_msgs, compress=True):
    f.write(dat)
 
 
-def remove_ignored_fields(msg, ignore):
-  msg = msg.as_builder()
+def _has_field(struct, name):
+  # union members that aren't set can't be read
+  schema = getattr(struct, 'schema', None)
+  if not hasattr(schema, 'fields') or name not in schema.fields:
+    return False
+  return name not in schema.union_fields or struct.which() == name
+
+
+def zero_ignored_fields(msg, ignore, strict=True):
+  """Zeroes the ignored numeric fields of a message builder in place. Other ignored fields
+     raise NotImplementedError, or are left as they are without strict.
+  """
   for key in ignore:
     attr = msg
     keys = key.split(".")
@@ -35,20 +45,170 @@ def remove_ignored_fields(msg, ignore):
       continue
 
     for k in keys[:-1]:
-      try:
-        attr = getattr(msg, k)
-      except AttributeError:
+      if not _has_field(attr, k):
         break
+      attr = getattr(attr, k)
     else:
+      if not _has_field(attr, keys[-1]):
+        continue
       v = getattr(attr, keys[-1])
       if isinstance(v, bool):
         val = False
       elif isinstance(v, numbers.Number):
         val = 0
-      else:
+      elif strict:
         raise NotImplementedError
+      else:
+        continue
       setattr(attr, keys[-1], val)
-  return msg.as_reader()
+  return msg
+
+
+def remove_ignored_fields(msg, ignore):
+  return zero_ignored_fields(msg.as_builder(), ignore).as_reader()
+
+
+FLOAT_TYPES = {'float32', 'float64'}
+INTEGER_TYPES = {'bool', 'int8', 'int16', 'int32', 'int64', 'uint8', 'uint16', 'uint32', 'uint64'}
+
+# ([(field name, kind, element kind for lists)], {union member name: (kind, element kind)}) per struct schema id
+_struct_plans = {}
+
+
+def _type_kind(typ):
+  kind = typ.which()
+  if kind == 'list':
+    return 'list', _type_kind(typ.list.elementType)[0]
+  elif kind in FLOAT_TYPES:
+    return 'float', None
+  elif kind in INTEGER_TYPES:
+    return 'integer', None
+  elif kind in ('text', 'data', 'enum'):
+    return 'value', None
+  elif kind == 'struct':
+    return 'struct', None
+  return 'skip', None  # void, anyPointer, interface
+
+
+def _struct_plan(schema):
+  node = schema.node
+  plan = _struct_plans.get(node.id)
+  if plan is None:
+    fields, union = [], {}
+    for field in node.struct.fields:
+      if field.which() == 'group':
+        kind, elem_kind = 'struct', None
+      else:
+        kind, elem_kind = _type_kind(field.slot.type)
+      if field.discriminantValue != 0xFFFF:
+        union[field.name] = (kind, elem_kind)
+      elif kind != 'skip':
+        fields.append((field.name, kind, elem_kind))
+    plan = _struct_plans[node.id] = (fields, union)
+  return plan
+
+
+def _to_py(v):
+  if hasattr(v, 'to_dict'):
+    return v.to_dict(verbose=True)
+  elif isinstance(v, (str, bytes, numbers.Number)):
+    return v
+  elif hasattr(v, '__len__'):
+    return [_to_py(x) for x in v]
+  return str(v)  # enums
+
+
+def _diff_path(path):
+  # same convention as dictdiffer: dotted if it's only field names, else a list of keys
+  keys = path.split(".")
+  if not any(k.isdigit() for k in keys):
+    return path
+  return [int(k) if k.isdigit() else k for k in keys]
+
+
+def _join(path, key):
+  return key if not path else path + "." + key
+
+
+class LogComparer:
+  """Compares two messages by walking their schema, reporting differences like dictdiffer.diff would
+     on their dicts. Numeric lists are compared as arrays and only differing fields are converted
+     to python values.
+  """
+  def __init__(self, ignore_fields=None, tolerance=None):
+    self.ignore = set(ignore_fields or [])
+    self.tolerance = EPSILON if tolerance is None else tolerance
+
+  def numbers_differ(self, a, b):
+    if a == b or (a != a and b != b):
+      return False
+    # absolute and relative tolerance
+    return not abs(a - b) <= max(self.tolerance, self.tolerance * max(abs(a), abs(b)))
+
+  def compare(self, msg1, msg2):
+    diff = []
+    self._compare_struct(msg1, msg2, "", diff)
+    return diff
+
+  def _compare_struct(self, s1, s2, path, diff):
+    # same order as dictdiffer: the fields, then the union member, which is added and removed if it changed
+    fields, union = _struct_plan(s1.schema)
+    for name, kind, elem_kind in fields:
+      field_path = _join(path, name)
+      if field_path not in self.ignore:
+        self._compare_value(getattr(s1, name), getattr(s2, name), kind, elem_kind, field_path, diff)
+
+    if union:
+      which1, which2 = s1.which(), s2.which()
+      path1, path2 = _join(path, which1), _join(path, which2)
+      if which1 == which2:
+        kind, elem_kind = union[which1]
+        if path1 not in self.ignore:
+          self._compare_value(getattr(s1, which1), getattr(s2, which2), kind, elem_kind, path1, diff)
+      else:
+        if path2 not in self.ignore:
+          diff.append(('add', _diff_path(path), [(which2, _to_py(getattr(s2, which2)))]))
+        if path1 not in self.ignore:
+          diff.append(('remove', _diff_path(path), [(which1, _to_py(getattr(s1, which1)))]))
+
+  def _compare_value(self, v1, v2, kind, elem_kind, path, diff):
+    if kind in ('float', 'integer'):
+      if self.numbers_differ(v1, v2):
+        diff.append(('change', _diff_path(path), (v1, v2)))
+    elif kind == 'value':
+      if v1 != v2:
+        diff.append(('change', _diff_path(path), (_to_py(v1), _to_py(v2))))
+    elif kind == 'struct':
+      self._compare_struct(v1, v2, path, diff)
+    elif kind == 'list':
+      self._compare_list(v1, v2, elem_kind, path, diff)
+
+  def _compare_list(self, l1, l2, elem_kind, path, diff):
+    n = min(len(l1), len(l2))
+    if elem_kind == 'float':
+      l1, l2 = list(l1), list(l2)
+      a1, a2 = np.array(l1[:n], dtype=np.float64), np.array(l2[:n], dtype=np.float64)
+      with np.errstate(invalid='ignore'):
+        tol = np.maximum(self.tolerance, self.tolerance * np.maximum(np.abs(a1), np.abs(a2)))
+        differ = ~(np.abs(a1 - a2) <= tol) & ~(np.isnan(a1) & np.isnan(a2))
+      for i in np.flatnonzero(differ).tolist():
+        diff.append(('change', _diff_path(_join(path, str(i))), (l1[i], l2[i])))
+    elif elem_kind == 'integer':
+      # exact first, floats can't hold every uint64
+      l1, l2 = list(l1), list(l2)
+      for i in np.flatnonzero(np.array(l1[:n]) != np.array(l2[:n])).tolist():
+        if self.numbers_differ(l1[i], l2[i]):
+          diff.append(('change', _diff_path(_join(path, str(i))), (l1[i], l2[i])))
+    elif elem_kind != 'skip':
+      for i in range(n):
+        elem_path = _join(path, str(i))
+        if elem_path not in self.ignore:
+          self._compare_value(l1[i], l2[i], elem_kind, None, elem_path, diff)
+
+    if len(l1) > n:
+      diff.append(('remove', _diff_path(path), [(i, _to_py(l1[i])) for i in range(len(l1) - 1, n - 1, -1)]))
+    elif len(l2) > n:
+      diff.append(('add', _diff_path(path), [(i, _to_py(l2[i])) for i in range(n, len(l2))]))
 
 
 def compare_logs(log1, log2, ignore_fields=None, ignore_msgs=None, tolerance=None):
@@ -62,33 +222,18 @@ def compare_logs(log1, log2, ignore_fields=None, ignore_msgs=None, tolerance=Non
   if len(log1) != len(log2):
     raise Exception(f"logs are not same length: {len(log1)} VS {len(log2)}")
 
+  comparer = LogComparer(ignore_fields, tolerance)
   diff = []
   for msg1, msg2 in tqdm(zip(log1, log2)):
     if msg1.which() != msg2.which():
       print(msg1, msg2)
       raise Exception("msgs not aligned between logs")
 
-    msg1_bytes = remove_ignored_fields(msg1, ignore_fields).as_builder().to_bytes()
-    msg2_bytes = remove_ignored_fields(msg2, ignore_fields).as_builder().to_bytes()
-
+    # identical messages are the common case, and a byte comparison is the cheapest check
+    msg1_bytes = zero_ignored_fields(msg1.as_builder(), ignore_fields, strict=False).to_bytes()
+    msg2_bytes = zero_ignored_fields(msg2.as_builder(), ignore_fields, strict=False).to_bytes()
     if msg1_bytes != msg2_bytes:
-      msg1_dict = msg1.to_dict(verbose=True)
-      msg2_dict = msg2.to_dict(verbose=True)
-
-      tolerance = EPSILON if tolerance is None else tolerance
-      dd = dictdiffer.diff(msg1_dict, msg2_dict, ignore=ignore_fields)
-
-      # Dictdiffer only supports relative tolerance, we also want to check for absolute
-      def outside_tolerance(diff):
-        if diff[0] == "change":
-          a, b = diff[2]
-          if isinstance(a, numbers.Number) and isinstance(b, numbers.Number):
-            return abs(a - b) > max(tolerance, tolerance * max(abs(a), abs(b)))
-        return True
-
-      dd = list(filter(outside_tolerance, dd))
-
-      diff.extend(dd)
+      diff.extend(comparer.compare(msg1, msg2))
   return diff
 
 
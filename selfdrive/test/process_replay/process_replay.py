@@ -132,10 +132,10 @@ class FakePubMaster(messaging.PubMaster):
 
   def send(self, s, dat):
     self.last_updated = s
-    if isinstance(dat, bytes):
-      self.data[s] = log.Event.from_bytes(dat)
-    else:
-      self.data[s] = dat.as_reader()
+    # snapshot, processes like controlsd write the same builder again the next frame
+    if not isinstance(dat, bytes):
+      dat = dat.to_bytes()
+    self.data[s] = log.Event.from_bytes(dat)
     self.send_called.set()
     wait_for_event(self.get_called)
     self.get_called.clear()
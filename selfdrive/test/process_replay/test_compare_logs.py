@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import math
+import unittest
+
+import dictdiffer
+
+import cereal.messaging as messaging
+from cereal import log
+from selfdrive.test.process_replay.compare_logs import LogComparer, compare_logs, zero_ignored_fields
+from selfdrive.test.process_replay.test_processes import format_diff
+
+
+def controls_state(v_pid=1.0, v_target_lead=0.0, output=0.5, lqr=False):
+  msg = messaging.new_message('controlsState')
+  msg.controlsState.vPid = v_pid
+  msg.controlsState.vTargetLead = v_target_lead
+  msg.controlsState.alertText1 = "TAKE CONTROL"
+  msg.controlsState.canMonoTimes = [1, 2]
+  if lqr:
+    lqr_log = log.ControlsState.LateralLQRState.new_message()
+    lqr_log.active = True
+    lqr_log.output = output
+    msg.controlsState.lateralControlState.lqrState = lqr_log
+  else:
+    pid_log = log.ControlsState.LateralPIDState.new_message()
+    pid_log.active = True
+    pid_log.output = output
+    msg.controlsState.lateralControlState.pidState = pid_log
+  return msg.as_reader()
+
+
+def position_ecef(value):
+  msg = messaging.new_message('liveLocationKalman')
+  msg.liveLocationKalman.positionECEF.value = value
+  msg.liveLocationKalman.positionECEF.std = [1.0] * len(value)
+  return msg.as_reader()
+
+
+def live_tracks(d_rels):
+  msg = messaging.new_message('liveTracks', len(d_rels))
+  for i, d_rel in enumerate(d_rels):
+    msg.liveTracks[i].trackId = i
+    msg.liveTracks[i].dRel = d_rel
+  return msg.as_reader()
+
+
+def dictdiffer_diff(msg1, msg2):
+  # how compare_logs diffed mismatching messages before LogComparer
+  return list(dictdiffer.diff(msg1.to_dict(verbose=True), msg2.to_dict(verbose=True), ignore=["logMonoTime"]))
+
+
+class TestCompareLogs(unittest.TestCase):
+  def assertDiff(self, msg1, msg2, expected, ignore=None, tolerance=None):
+    self.assertEqual(compare_logs([msg1], [msg2], ["logMonoTime"] + (ignore or []), tolerance=tolerance), expected)
+
+  def test_identical(self):
+    self.assertDiff(controls_state(), controls_state(), [])
+    self.assertDiff(live_tracks([1.0, 2.0]), live_tracks([1.0, 2.0]), [])
+
+  def test_float_tolerance(self):
+    msg1, msg2 = controls_state(v_pid=1.0), controls_state(v_pid=1.5)
+    self.assertDiff(msg1, msg2, [('change', 'controlsState.vPid', (1.0, 1.5))])
+    self.assertDiff(msg1, msg2, [], tolerance=0.6)
+    # relative to the larger value
+    self.assertDiff(controls_state(v_pid=1000.0), controls_state(v_pid=1000.5), [], tolerance=1e-3)
+    self.assertDiff(controls_state(v_pid=1000.0), controls_state(v_pid=1002.0), [('change', 'controlsState.vPid', (1000.0, 1002.0))], tolerance=1e-3)
+
+    msg1, msg2 = position_ecef([1.0, 2.0, 3.0]), position_ecef([1.0, 2.0005, 3.0])
+    self.assertDiff(msg1, msg2, [('change', ['liveLocationKalman', 'positionECEF', 'value', 1], (2.0, 2.0005))])
+    self.assertDiff(msg1, msg2, [], tolerance=1e-3)
+
+  def test_nan(self):
+    nan = float('nan')
+    diff = compare_logs([controls_state(v_pid=nan)], [controls_state(v_pid=1.0)], ["logMonoTime"])
+    self.assertEqual(len(diff), 1)
+    self.assertEqual(diff[0][:2], ('change', 'controlsState.vPid'))
+    self.assertTrue(math.isnan(diff[0][2][0]))
+    self.assertEqual(diff[0][2][1], 1.0)
+
+    diff = compare_logs([position_ecef([1.0, nan])], [position_ecef([1.0, 2.0])], ["logMonoTime"])
+    self.assertEqual([d[:2] for d in diff], [('change', ['liveLocationKalman', 'positionECEF', 'value', 1])])
+
+    # NaN against NaN is no difference, next to a field that does differ so the messages get walked
+    self.assertDiff(controls_state(v_pid=nan, v_target_lead=1.0), controls_state(v_pid=nan, v_target_lead=2.0),
+                    [('change', 'controlsState.vTargetLead', (1.0, 2.0))])
+    self.assertEqual(LogComparer().compare(position_ecef([nan, 1.0]), position_ecef([nan, 1.0])), [])
+
+  def test_list_length(self):
+    path = 'liveLocationKalman.positionECEF.value'
+    self.assertDiff(position_ecef([1.0, 2.0, 3.0]), position_ecef([1.0]),
+                    [('remove', path, [(2, 3.0), (1, 2.0)]), ('remove', 'liveLocationKalman.positionECEF.std', [(2, 1.0), (1, 1.0)])])
+    self.assertDiff(position_ecef([1.0]), position_ecef([1.0, 2.0, 3.0]),
+                    [('add', path, [(1, 2.0), (2, 3.0)]), ('add', 'liveLocationKalman.positionECEF.std', [(1, 1.0), (2, 1.0)])])
+
+    diff = compare_logs([live_tracks([1.0])], [live_tracks([1.0, 2.0])], ["logMonoTime"])
+    self.assertEqual(len(diff), 1)
+    self.assertEqual(diff[0][:2], ('add', 'liveTracks'))
+    (i, track), = diff[0][2]
+    self.assertEqual((i, track['trackId'], track['dRel']), (1, 1, 2.0))
+
+  def test_union_mismatch(self):
+    diff = compare_logs([controls_state()], [controls_state(lqr=True)], ["logMonoTime"])
+    self.assertEqual([d[:2] for d in diff], [('add', 'controlsState.lateralControlState'),
+                                             ('remove', 'controlsState.lateralControlState')])
+    (which2, lqr_state), = diff[0][2]
+    (which1, pid_state), = diff[1][2]
+    self.assertEqual((which1, which2), ('pidState', 'lqrState'))
+    self.assertEqual((pid_state['output'], lqr_state['output']), (0.5, 0.5))
+
+    # an ignored member is neither added nor removed
+    diff = compare_logs([controls_state()], [controls_state(lqr=True)], ["logMonoTime", "controlsState.lateralControlState.pidState"])
+    self.assertEqual([d[:2] for d in diff], [('add', 'controlsState.lateralControlState')])
+
+    with self.assertRaises(Exception):
+      compare_logs([controls_state()], [position_ecef([1.0])])
+
+  def test_nested_ignore(self):
+    ignore = ["controlsState.lateralControlState.pidState.output", "controlsState.alertText1"]
+    msg1, msg2 = controls_state(output=0.5), controls_state(output=0.25)
+    self.assertDiff(msg1, msg2, [('change', 'controlsState.lateralControlState.pidState.output', (0.5, 0.25))])
+    self.assertDiff(msg1, msg2, [], ignore=ignore)
+
+    # numeric fields are zeroed, the rest are left as they are without strict
+    msg = zero_ignored_fields(msg1.as_builder(), ignore + ["controlsState.lateralControlState.pidState.active"], strict=False)
+    self.assertEqual(msg.controlsState.lateralControlState.pidState.output, 0)
+    self.assertFalse(msg.controlsState.lateralControlState.pidState.active)
+    self.assertEqual(msg.controlsState.alertText1, "TAKE CONTROL")
+    with self.assertRaises(NotImplementedError):
+      zero_ignored_fields(msg1.as_builder(), ignore)
+
+    # paths for other services and fields the union doesn't hold are skipped
+    msg = zero_ignored_fields(controls_state(lqr=True).as_builder(), ["liveTracks.dRel", "controlsState.lateralControlState.pidState.output"])
+    self.assertEqual(msg.controlsState.lateralControlState.lqrState.output, 0.5)
+
+  def test_matches_dictdiffer(self):
+    cases = [
+      (controls_state(v_pid=1.0, output=0.5), controls_state(v_pid=2.0, output=0.25)),
+      (controls_state(), controls_state(lqr=True)),
+      (position_ecef([1.0, 2.0, 3.0]), position_ecef([1.0, 4.0])),
+      (position_ecef([1.0]), position_ecef([1.0, 2.0, 3.0])),
+      (live_tracks([1.0, 2.0]), live_tracks([1.0, 3.0, 5.0])),
+      (live_tracks([1.0, 2.0, 3.0]), live_tracks([4.0])),
+    ]
+    for msg1, msg2 in cases:
+      self.assertEqual(compare_logs([msg1], [msg2], ["logMonoTime"]), dictdiffer_diff(msg1, msg2))
+
+  def test_format_diff(self):
+    diff = compare_logs([live_tracks([1.0, 2.0]), controls_state()], [live_tracks([1.0, 3.0]), controls_state(v_pid=1.5)], ["logMonoTime"])
+    self.assertEqual(diff, [('change', ['liveTracks', 1, 'dRel'], (2.0, 3.0)),
+                            ('change', 'controlsState.vPid', (1.0, 1.5))])
+
+    diff1, diff2, failed = format_diff({"segment": {"proc": diff}}, "ref")
+    self.assertTrue(failed)
+    self.assertEqual(diff1, "***** results for segment segment *****\n"
+                            "\tproc\n"
+                            "\t\t['liveTracks', 1, 'dRel']: 1\n"
+                            "\t\tcontrolsState.vPid: 1\n")
+    self.assertEqual(diff2, "***** tested against commit ref *****\n"
+                            "***** differences for segment segment *****\n"
+                            "*** process: proc ***\n"
+                            "\t('change', ['liveTracks', 1, 'dRel'], (2.0, 3.0))\n"
+                            "\t('change', 'controlsState.vPid', (1.0, 1.5))\n")
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+import threading
+import unittest
+
+from selfdrive.controls.lib.message_reuse import ReusedMessage
+from selfdrive.controls.tests.test_message_reuse import fill_controls_state
+from selfdrive.test.process_replay.process_replay import FakePubMaster
+
+FRAMES = 10
+
+
+class TestFakePubMaster(unittest.TestCase):
+  def check_captured(self, captured):
+    self.assertEqual(len(captured), FRAMES)
+    for frame, m in enumerate(captured):
+      self.assertEqual(list(m.controlsState.canMonoTimes), [frame, frame + 1])
+    for prev, cur in zip(captured, captured[1:]):
+      self.assertNotEqual(prev.controlsState.vPid, cur.controlsState.vPid)
+
+  def test_reused_builder(self):
+    # the replay keeps what wait_for_msg returns while the process writes the next frame
+    fpm = FakePubMaster(['controlsState'])
+    msg = ReusedMessage('controlsState')
+
+    def process():
+      for frame in range(FRAMES):
+        fpm.send('controlsState', fill_controls_state(msg, frame))
+
+    t = threading.Thread(target=process)
+    t.start()
+    captured = [fpm.wait_for_msg() for _ in range(FRAMES)]
+    t.join()
+    self.check_captured(captured)
+
+
+if __name__ == "__main__":
+  unittest.main()
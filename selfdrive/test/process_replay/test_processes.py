@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 import argparse
+import multiprocessing
 import os
+import queue
+import shutil
 import sys
+import tempfile
+import traceback
 from typing import Any
 
 from selfdrive.car.car_helpers import interface_names
+from selfdrive.manager.process import PythonProcess
+from selfdrive.manager.process_config import managed_processes
 from selfdrive.test.process_replay.compare_logs import compare_logs
 from selfdrive.test.process_replay.process_replay import CONFIGS, replay_process
 from tools.lib.logreader import LogReader
@@ -75,6 +82,84 @@ def test_process(cfg, lr, cmp_log_fn, ignore_fields=None, ignore_msgs=None):
   except Exception as e:
     return str(e)
 
+def _replay_worker(tasks, results, ignore_fields, ignore_msgs):
+  cfgs = {cfg.proc_name: cfg for cfg in CONFIGS}
+  segment, lr = None, None
+  for task in iter(tasks.get, None):
+    try:
+      # tasks come segment by segment, keep the last log around
+      if task[0] != segment:
+        segment, lr = task[0], LogReader(get_segment(task[0]))
+      result = test_process(cfgs[task[1]], lr, task[2], ignore_fields, ignore_msgs)
+    except Exception:
+      result = traceback.format_exc()
+    results.put((task, result))
+
+
+def run_tests(tests, jobs, ignore_fields=None, ignore_msgs=None):
+  """Runs every (segment, proc_name, cmp_log_fn) in tests, returns {(segment, proc_name): result}.
+
+     Python processes are replayed in `jobs` worker processes. Each worker gets its own HOME, so
+     the Params() store the replayed daemons share is private to it. Native processes talk over
+     the real messaging sockets, so they are replayed one at a time in this process meanwhile.
+  """
+  def is_python(proc_name):
+    return isinstance(managed_processes[proc_name], PythonProcess)
+
+  py_tests = [t for t in tests if is_python(t[1])]
+  cpp_tests = [t for t in tests if not is_python(t[1])]
+
+  ctx = multiprocessing.get_context("spawn")
+  tasks, results = ctx.Queue(), ctx.Queue()
+  for t in py_tests:
+    tasks.put(t)
+
+  workers, homes = [], []
+  home = os.environ.get("HOME")
+  try:
+    for _ in range(min(jobs, len(py_tests))):
+      # params path is read from HOME when the params library loads, so it has to be set before spawning
+      homes.append(tempfile.mkdtemp(prefix="process_replay_"))
+      os.environ["HOME"] = homes[-1]
+      workers.append(ctx.Process(target=_replay_worker, args=(tasks, results, ignore_fields, ignore_msgs), daemon=True))
+      workers[-1].start()
+      tasks.put(None)
+  finally:
+    if home is None:
+      os.environ.pop("HOME", None)
+    else:
+      os.environ["HOME"] = home
+
+  ret = {}
+  cfgs = {cfg.proc_name: cfg for cfg in CONFIGS}
+  for segment, proc_name, cmp_log_fn in cpp_tests:
+    print("***** testing %s on route segment %s *****\n" % (proc_name, segment))
+    lr = LogReader(get_segment(segment))
+    ret[(segment, proc_name)] = test_process(cfgs[proc_name], lr, cmp_log_fn, ignore_fields, ignore_msgs)
+
+  try:
+    while len(ret) < len(tests):
+      try:
+        task, result = results.get(timeout=1)
+      except queue.Empty:
+        if not any(w.is_alive() for w in workers):
+          break
+        continue
+      print("***** tested %s on route segment %s *****" % (task[1], task[0]))
+      ret[task[:2]] = result
+  finally:
+    for w in workers:
+      w.join(timeout=5)
+      if w.is_alive():
+        w.kill()
+    for h in homes:
+      shutil.rmtree(h, ignore_errors=True)
+
+  for segment, proc_name, _ in tests:
+    ret.setdefault((segment, proc_name), "replay worker died")
+  return ret
+
+
 def format_diff(results, ref_commit):
   diff1, diff2 = "", ""
   diff2 += "***** tested against commit %s *****\n" % ref_commit
@@ -121,6 +206,8 @@ if __name__ == "__main__":
                         help="Extra fields or msgs to ignore (e.g. carState.events)")
   parser.add_argument("--ignore-msgs", type=str, nargs="*", default=[],
                         help="Msgs to ignore (e.g. carEvents)")
+  parser.add_argument("-j", "--jobs", type=int, default=multiprocessing.cpu_count(),
+                        help="Number of processes replaying in parallel, 1 replays serially in this process")
   args = parser.parse_args()
 
   cars_whitelisted = len(args.whitelist_cars) > 0
@@ -141,26 +228,33 @@ if __name__ == "__main__":
     untested = (set(interface_names) - set(excluded_interfaces)) - tested_cars
     assert len(untested) == 0, "Cars missing routes: %s" % (str(untested))
 
-  results: Any = {}
+  tests = []
   for car_brand, segment in segments:
     if (cars_whitelisted and car_brand.upper() not in args.whitelist_cars) or \
        (not cars_whitelisted and car_brand.upper() in args.blacklist_cars):
       continue
 
-    print("***** testing route segment %s *****\n" % segment)
-
-    results[segment] = {}
-
-    rlog_fn = get_segment(segment)
-    lr = LogReader(rlog_fn)
-
     for cfg in CONFIGS:
       if (procs_whitelisted and cfg.proc_name not in args.whitelist_procs) or \
          (not procs_whitelisted and cfg.proc_name in args.blacklist_procs):
         continue
 
       cmp_log_fn = os.path.join(process_replay_dir, "%s_%s_%s.bz2" % (segment, cfg.proc_name, ref_commit))
-      results[segment][cfg.proc_name] = test_process(cfg, lr, cmp_log_fn, args.ignore_fields, args.ignore_msgs)
+      tests.append((segment, cfg.proc_name, cmp_log_fn))
+
+  results: Any = {}
+  if args.jobs > 1:
+    replayed = run_tests(tests, args.jobs, args.ignore_fields, args.ignore_msgs)
+    for segment, proc_name, _ in tests:
+      results.setdefault(segment, {})[proc_name] = replayed[(segment, proc_name)]
+  else:
+    cfgs = {cfg.proc_name: cfg for cfg in CONFIGS}
+    lr, lr_segment = None, None
+    for segment, proc_name, cmp_log_fn in tests:
+      if segment != lr_segment:
+        print("***** testing route segment %s *****\n" % segment)
+        lr, lr_segment = LogReader(get_segment(segment)), segment
+      results.setdefault(segment, {})[proc_name] = test_process(cfgs[proc_name], lr, cmp_log_fn, args.ignore_fields, args.ignore_msgs)
 
   diff1, diff2, failed = format_diff(results, ref_commit)
   with open(os.path.join(process_replay_dir, "diff.txt"), "w") as f:
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Timings of the batched transformations, lead association and locationd outputs against
+   the one at a time code they replaced. The unit tests check that both give the same results.
+
+   ./batch_benchmark.py
+   ./batch_benchmark.py transformations leads
+"""
+import argparse
+import time
+
+import numpy as np
+
+
+def timed(f, *args):
+  t = time.perf_counter()
+  ret = f(*args)
+  return ret, time.perf_counter() - t
+
+
+def benchmark_transformations():
+  import common.transformations.coordinates as coord
+  from common.transformations.orientation import quat2euler, quat2rot
+  from common.transformations.transformations import ecef2geodetic_single, quat2euler_single, quat2rot_single
+
+  np.random.seed(0)
+  quats = np.random.normal(size=(100000, 4))
+  quats /= np.linalg.norm(quats, axis=1, keepdims=True)
+  for batched, single in ((quat2euler, quat2euler_single), (quat2rot, quat2rot_single)):
+    _, t_single = timed(lambda: [single(q) for q in quats])
+    _, t_batch = timed(batched, quats)
+    print(f"{single.__name__} of {len(quats)} quaternions: {t_single*1e3:.1f} ms one at a time, {t_batch*1e3:.1f} ms batched")
+
+  # a route's worth of positions at 20Hz
+  ecef_init = np.array([-2711076.55270557, -4259167.14692758, 3884579.87669935])
+  ecef = ecef_init + np.random.normal(scale=1000., size=(72000, 3))
+  converter = coord.LocalCoord.from_ecef(ecef_init)
+  _, t_single = timed(lambda: ([ecef2geodetic_single(e) for e in ecef], [converter.ecef2ned_single(e) for e in ecef]))
+  _, t_batch = timed(lambda: (coord.ecef2geodetic(ecef), converter.ecef2ned(ecef)))
+  print(f"ecef2geodetic and ecef2ned of {len(ecef)} positions: {t_single*1e3:.1f} ms one at a time, {t_batch*1e3:.1f} ms batched")
+
+
+def benchmark_leads(num_frames=2000):
+  from selfdrive.controls.radard import get_leads
+  from selfdrive.controls.tests.test_leads import get_lead, random_frame
+
+  np.random.seed(1337)
+  frames = [random_frame() for _ in range(num_frames)]
+  _, t_old = timed(lambda: [(get_lead(v_ego, ready, clusters, leads[0], low_speed_override=True),
+                             get_lead(v_ego, ready, clusters, leads[1], low_speed_override=False))
+                            for v_ego, ready, clusters, leads in frames])
+  _, t_new = timed(lambda: [get_leads(v_ego, ready, clusters, leads) for v_ego, ready, clusters, leads in frames])
+  print(f"lead association of {num_frames} frames: {t_old*1e3:.1f} ms one cluster at a time, {t_new*1e3:.1f} ms batched")
+
+
+def benchmark_locationd(num_states=500):
+  from selfdrive.locationd.locationd import LiveOutputs
+  from selfdrive.locationd.test.test_locationd import random_state, reference_outputs
+
+  np.random.seed(0)
+  states = [random_state() for _ in range(num_states)]
+  _, t_old = timed(lambda: [reference_outputs(*s) for s in states])
+
+  outputs = LiveOutputs()
+  _, t_new = timed(lambda: [outputs.update(converter.ned_from_ecef_matrix, calib_from_device, state, cov)
+                            for converter, calib_from_device, state, cov in states])
+  print(f"locationd outputs: {t_old/num_states*1e6:.1f} us per message for the reference, {t_new/num_states*1e6:.1f} us with LiveOutputs")
+
+
+BENCHMARKS = {
+  'transformations': benchmark_transformations,
+  'leads': benchmark_leads,
+  'locationd': benchmark_locationd,
+}
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS.keys()), choices=list(BENCHMARKS.keys()))
+  args = parser.parse_args()
+
+  for name in args.benchmarks:
+    BENCHMARKS[name]()
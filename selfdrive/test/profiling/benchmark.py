@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Replay throughput and per iteration latency of the daemons, against their real-time budgets.
+
+   ./benchmark.py --car toyota --json toyota.json
+   ./benchmark.py --log ~/rlog.bz2 --procs controlsd radard
+
+   Results from two commits can be diffed with --compare old.json new.json.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from common.realtime import DT_CTRL, DT_MDL
+from selfdrive.test.profiling.lib import BASE_URL, CARS, IterationTimer, ReplayDone, get_inputs
+from tools.lib.logreader import LogReader
+
+# (module, main function, time budget of one loop iteration). Loops run once per message of
+# the first service in the process replay config, CAN at 100Hz or model outputs at 20Hz
+PROCS = {
+  'controlsd': ('selfdrive.controls.controlsd', 'main', DT_CTRL),
+  'radard': ('selfdrive.controls.radard', 'radard_thread', DT_CTRL),
+  'plannerd': ('selfdrive.controls.plannerd', 'plannerd_thread', DT_MDL),
+  'calibrationd': ('selfdrive.locationd.calibrationd', 'calibrationd_thread', DT_MDL),
+  'locationd': ('selfdrive.locationd.locationd', 'locationd_thread', DT_MDL),
+  'paramsd': ('selfdrive.locationd.paramsd', 'main', DT_MDL),
+}
+
+
+def get_fingerprint(msgs):
+  for msg in msgs:
+    if msg.which() == 'carParams':
+      return msg.carParams.carFingerprint
+  return ""
+
+
+def benchmark(proc, msgs):
+  """Runs proc over msgs, returns its throughput and loop iteration latency stats."""
+  module, func, budget = PROCS[proc]
+  func = getattr(importlib.import_module(module), func)
+
+  timer = IterationTimer()
+  sm, pm, can_sock = get_inputs(msgs, proc, timer)
+  services = set(sm.data.keys())
+  num_msgs = sum(m.which() in services for m in msgs)
+
+  t = time.perf_counter()
+  try:
+    if can_sock is not None:
+      func(sm, pm, can_sock)
+    else:
+      func(sm, pm)
+  except ReplayDone:
+    pass
+  wall_time = time.perf_counter() - t
+
+  times = np.array(timer.times)
+  if not len(times):
+    times = np.zeros(1)
+  return {
+    'msgs': num_msgs,
+    'iterations': len(timer.times),
+    'wall_time': wall_time,
+    'msgs_per_sec': num_msgs / wall_time,
+    'p50_ms': float(np.percentile(times, 50) * 1e3),
+    'p99_ms': float(np.percentile(times, 99) * 1e3),
+    'max_ms': float(times.max() * 1e3),
+    'budget_ms': budget * 1e3,
+    'over_budget': float(np.mean(times > budget)),
+  }
+
+
+def print_results(results):
+  print(f"{'process':<14}{'msgs/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'budget':>8}{'over':>8}")
+  for proc, r in results.items():
+    print(f"{proc:<14}{r['msgs_per_sec']:>10.0f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['max_ms']:>9.2f}"
+          f"{r['budget_ms']:>8.0f}{r['over_budget']:>8.1%}")
+
+
+def compare_results(old, new):
+  print(f"{'process':<14}{'msgs/s':>20}{'p50 ms':>20}{'p99 ms':>20}")
+  for proc in new['results']:
+    if proc not in old['results']:
+      continue
+    o, n = old['results'][proc], new['results'][proc]
+    cols = [f"{o[k]:.4g} -> {n[k]:.4g}" for k in ('msgs_per_sec', 'p50_ms', 'p99_ms')]
+    print(f"{proc:<14}" + "".join(f"{c:>20}" for c in cols))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark daemons by replaying a log through them")
+  parser.add_argument("--procs", nargs="*", default=list(PROCS.keys()), choices=list(PROCS.keys()))
+  parser.add_argument("--car", default="toyota", choices=list(CARS.keys()),
+                      help="CI segment to replay when no --log is given")
+  parser.add_argument("--log", nargs="*", default=[], help="Local logs to replay instead of a CI segment")
+  parser.add_argument("--loop", type=int, default=1, help="Replay the logs this many times")
+  parser.add_argument("--json", help="Write the results to this file")
+  parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+  args = parser.parse_args()
+
+  if args.compare:
+    with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+      compare_results(json.load(f_old), json.load(f_new))
+    sys.exit(0)
+
+  if len(args.log):
+    log_paths = args.log
+    fingerprint = None
+  else:
+    segment, fingerprint = CARS[args.car]
+    log_paths = [f"{BASE_URL}{segment.replace('|', '/')}/rlog.bz2"]
+
+  msgs = [m for path in log_paths for m in LogReader(path)] * args.loop
+  os.environ['FINGERPRINT'] = fingerprint if fingerprint is not None else get_fingerprint(msgs)
+  os.environ['SKIP_FW_QUERY'] = "1"
+  os.environ['NO_RADAR_SLEEP'] = "1"
+
+  results = {}
+  for proc in args.procs:
+    results[proc] = benchmark(proc, msgs)
+  print_results(results)
+
+  if args.json:
+    from selfdrive.version import get_git_commit
+    with open(args.json, "w") as f:
+      json.dump({'commit': get_git_commit(), 'logs': log_paths, 'loop': args.loop, 'results': results}, f, indent=2)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Import time of the locationd and paramsd daemons in a fresh interpreter, with sympy deferred
+   as on the device, and with sympy imported up front as rednose's ekf_sym does on its own.
+
+   ./import_time.py
+   ./import_time.py --runs 10 selfdrive.locationd.locationd
+"""
+import argparse
+import subprocess
+import sys
+
+import numpy as np
+
+from common.basedir import BASEDIR
+
+MODULES = ['selfdrive.locationd.locationd', 'selfdrive.locationd.paramsd']
+
+IMPORT_SCRIPT = """
+import sys, time
+t = time.monotonic()
+{eager}import {module}
+print(time.monotonic() - t, 'sympy.core' in sys.modules)
+"""
+
+
+def import_time(module, eager_sympy):
+  script = IMPORT_SCRIPT.format(module=module, eager="import sympy\n" if eager_sympy else "")
+  out = subprocess.check_output([sys.executable, '-c', script], cwd=BASEDIR, encoding='utf8')
+  dt, sympy_loaded = out.split()[-2:]
+  return float(dt), sympy_loaded == 'True'
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("modules", nargs="*", default=MODULES)
+  args = parser.parse_args()
+
+  for module in args.modules:
+    for eager, label in ((True, 'sympy imported'), (False, 'sympy deferred')):
+      results = [import_time(module, eager) for _ in range(args.runs)]
+      dts = [dt for dt, _ in results]
+      print(f"{module:35s} {label}: {np.median(dts)*1e3:7.1f} ms median of {args.runs}, "
+            f"sympy loaded: {results[-1][1]}")
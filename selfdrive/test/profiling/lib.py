@@ -1,17 +1,43 @@
+import time
 from collections import defaultdict
 from cereal.services import service_list
 import cereal.messaging as messaging
 import capnp
 
+from common.params import Params
+
+
+BASE_URL = "https://commadataci.blob.core.windows.net/openpilotci/"
+
+CARS = {
+  'toyota': ("77611a1fac303767|2020-02-29--13-29-33/3", "TOYOTA COROLLA TSS2 2019"),
+  'honda': ("99c94dc769b5d96e|2019-08-03--14-19-59/2", "HONDA CIVIC 2016 TOURING"),
+  "vw": ("e2a273d7e6eecec2|2021-03-03--16-05-26/4", "AUDI A3"),
+}
+
 
 class ReplayDone(Exception):
   pass
 
 
+class IterationTimer():
+  """Records the time between consecutive ticks, one tick per loop iteration of the process."""
+  def __init__(self):
+    self.times = []
+    self._last = None
+
+  def tick(self):
+    t = time.perf_counter()
+    if self._last is not None:
+      self.times.append(t - self._last)
+    self._last = t
+
+
 class SubSocket():
-  def __init__(self, msgs, trigger):
+  def __init__(self, msgs, trigger, timer=None):
     self.i = 0
     self.trigger = trigger
+    self.timer = timer
     self.msgs = [m.as_builder().to_bytes() for m in msgs if m.which() == trigger]
     self.max_i = len(self.msgs) - 1
 
@@ -19,6 +45,9 @@ class SubSocket():
     if non_blocking:
       return None
 
+    if self.timer is not None:
+      self.timer.tick()
+
     if self.i == self.max_i:
       raise ReplayDone
 
@@ -34,8 +63,9 @@ class PubSocket():
 
 
 class SubMaster(messaging.SubMaster):
-  def __init__(self, msgs, trigger, services):  # pylint: disable=super-init-not-called
+  def __init__(self, msgs, trigger, services, timer=None):  # pylint: disable=super-init-not-called
     self.frame = 0
+    self.timer = timer
     self.data = {}
     self.ignore_alive = []
 
@@ -72,13 +102,44 @@ class SubMaster(messaging.SubMaster):
       self.sock[s] = SubSocket(msgs, s)
 
   def update(self, timeout=None):
+    if self.timer is not None:
+      self.timer.tick()
+
     if not len(self.msgs):
       raise ReplayDone
 
     cur_msgs = self.msgs.pop()
-    self.update_msgs(cur_msgs[0].logMonoTime, self.msgs.pop())
+    self.update_msgs(cur_msgs[0].logMonoTime, cur_msgs)
 
 
 class PubMaster(messaging.PubMaster):
   def __init__(self):  # pylint: disable=super-init-not-called
     self.sock = defaultdict(PubSocket)
+
+
+def get_inputs(msgs, process, timer=None):
+  """Returns sm, pm and can_sock replaying msgs into process. The timer ticks on the socket
+     that drives the process loop, can for processes reading it, else the SubMaster.
+  """
+  from selfdrive.test.process_replay.process_replay import CONFIGS
+
+  for config in CONFIGS:
+    if config.proc_name == process:
+      sub_socks = list(config.pub_sub.keys())
+      trigger = sub_socks[0]
+      break
+
+  # some procs block on CarParams
+  for msg in msgs:
+    if msg.which() == 'carParams':
+      Params().put("CarParams", msg.as_builder().to_bytes())
+      break
+
+  if 'can' in sub_socks:
+    sm = SubMaster(msgs, trigger, sub_socks)
+    can_sock = SubSocket(msgs, 'can', timer)
+  else:
+    sm = SubMaster(msgs, trigger, sub_socks, timer)
+    can_sock = None
+  pm = PubMaster()
+  return sm, pm, can_sock
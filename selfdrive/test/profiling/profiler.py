@@ -5,40 +5,8 @@ import cProfile  # pylint: disable=import-error
 import pprofile  # pylint: disable=import-error
 import pyprof2calltree  # pylint: disable=import-error
 
-from common.params import Params
 from tools.lib.logreader import LogReader
-from selfdrive.test.profiling.lib import SubMaster, PubMaster, SubSocket, ReplayDone
-from selfdrive.test.process_replay.process_replay import CONFIGS
-
-BASE_URL = "https://commadataci.blob.core.windows.net/openpilotci/"
-
-CARS = {
-  'toyota': ("77611a1fac303767|2020-02-29--13-29-33/3", "TOYOTA COROLLA TSS2 2019"),
-  'honda': ("99c94dc769b5d96e|2019-08-03--14-19-59/2", "HONDA CIVIC 2016 TOURING"),
-  "vw": ("e2a273d7e6eecec2|2021-03-03--16-05-26/4", "AUDI A3"),
-}
-
-
-def get_inputs(msgs, process):
-  for config in CONFIGS:
-    if config.proc_name == process:
-      sub_socks = list(config.pub_sub.keys())
-      trigger = sub_socks[0]
-      break
-
-  # some procs block on CarParams
-  for msg in msgs:
-    if msg.which() == 'carParams':
-      Params().put("CarParams", msg.as_builder().to_bytes())
-      break
-
-  sm = SubMaster(msgs, trigger, sub_socks)
-  pm = PubMaster()
-  if 'can' in sub_socks:
-    can_sock = SubSocket(msgs, 'can')
-  else:
-    can_sock = None
-  return sm, pm, can_sock
+from selfdrive.test.profiling.lib import BASE_URL, CARS, ReplayDone, get_inputs
 
 
 def profile(proc, func, car='vw'):
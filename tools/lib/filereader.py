@@ -1,3 +1,5 @@
+import mmap
+import os
 from tools.lib.url_file import URLFile
 
 
@@ -6,3 +8,16 @@ def FileReader(fn, debug=False):
     return URLFile(fn, debug=debug)
   else:
     return open(fn, "rb")
+
+
+def map_file(fn):
+  """Returns a read-only memory map of a local file, or None if fn is an url.
+
+     Mappings of the same file share the page cache across processes.
+  """
+  if fn.startswith("http://") or fn.startswith("https://"):
+    return None
+  with open(fn, "rb") as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
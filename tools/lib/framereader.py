@@ -1,45 +1,56 @@
 # pylint: skip-file
 import json
 import os
-import pickle
 import queue
+import select
 import struct
 import subprocess
 import tempfile
 import threading
-from functools import wraps
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import numpy as np
 from aenum import Enum
-from lru import LRU
 
 import _io
-from tools.lib.cache import cache_path_for_file_path
 from tools.lib.exceptions import DataUnreadableError
-from tools.lib.file_helpers import atomic_write_in_dir
+from tools.lib.video_index import VideoIndex, video_index_path, video_source_size
 
 try:
   from xx.chffr.lib.filereader import FileReader
 except ImportError:
   from tools.lib.filereader import FileReader
+from tools.lib.filereader import map_file
 
 HEVC_SLICE_B = 0
 HEVC_SLICE_P = 1
 HEVC_SLICE_I = 2
 
+# access unit delimiter, makes the parser emit the last frame of a GOP without waiting for the next one
+HEVC_AUD = b"\x00\x00\x01\x46\x01\x50"
+
+# long running ffmpeg processes shared by all frame readers
+DECODER_POOL_SIZE = int(os.getenv("FFMPEG_DECODERS", "4"))
+DECODER_TIMEOUT = 10.
+
+# per GOPFrameReader defaults
+FRAME_CACHE_SIZE = int(os.getenv("FRAME_CACHE_SIZE", str(512 << 20)))
+READAHEAD_THREADS = int(os.getenv("FRAMEREADER_READAHEAD_THREADS", str(min(4, os.cpu_count() or 1))))
+
 
 class GOPReader:
+  # True if frames are never reordered, so GOPs can be decoded by a persistent decoder
+  low_delay = False
+
   def get_gop(self, num):
     # returns (start_frame_num, num_frames, frames_to_skip, gop_data)
     raise NotImplementedError
 
-
-class DoNothingContextManager:
-  def __enter__(self):
-    return self
-
-  def __exit__(self, *x):
-    pass
+  def gop_range(self, num):
+    # returns (start_frame_num, end_frame_num) of the GOP containing frame num
+    raise NotImplementedError
 
 
 class FrameType(Enum):
@@ -80,11 +91,19 @@ def ffprobe(fn, fmt=None):
   return json.loads(ffprobe_output)
 
 
+_vidindex_lock = threading.Lock()
+_vidindex_built = False
+
+
 def vidindex(fn, typ):
+  global _vidindex_built
   vidindex_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "vidindex")
   vidindex = os.path.join(vidindex_dir, "vidindex")
 
-  subprocess.check_call(["make"], cwd=vidindex_dir, stdout=open("/dev/null", "w"))
+  with _vidindex_lock:
+    if not _vidindex_built:
+      subprocess.check_call(["make"], cwd=vidindex_dir, stdout=open("/dev/null", "w"))
+      _vidindex_built = True
 
   with tempfile.NamedTemporaryFile() as prefix_f, \
        tempfile.NamedTemporaryFile() as index_f:
@@ -105,31 +124,6 @@ def vidindex(fn, typ):
   return index, prefix
 
 
-def cache_fn(func):
-  @wraps(func)
-  def cache_inner(fn, *args, **kwargs):
-    if kwargs.pop('no_cache', None):
-      cache_path = None
-    else:
-      cache_prefix = kwargs.pop('cache_prefix', None)
-      cache_path = cache_path_for_file_path(fn, cache_prefix)
-
-    if cache_path and os.path.exists(cache_path):
-      with open(cache_path, "rb") as cache_file:
-        cache_value = pickle.load(cache_file)
-    else:
-      cache_value = func(fn, *args, **kwargs)
-
-      if cache_path:
-        with atomic_write_in_dir(cache_path, mode="wb", overwrite=True) as cache_file:
-          pickle.dump(cache_value, cache_file, -1)
-
-    return cache_value
-
-  return cache_inner
-
-
-@cache_fn
 def index_stream(fn, typ):
   assert typ in ("hevc", )
 
@@ -138,48 +132,48 @@ def index_stream(fn, typ):
     index, prefix = vidindex(f.name, typ)
     probe = ffprobe(f.name, typ)
 
-  return {
-    'index': index,
-    'global_prefix': prefix,
-    'probe': probe
-  }
+  stream = probe['streams'][0]
+  return VideoIndex(index, prefix, stream['width'], stream['height'])
+
 
+def index_videos(camera_paths, cache_prefix=None, workers=None):
+  """Builds the missing indexes of a list of videos in parallel.
 
-def index_videos(camera_paths, cache_prefix=None):
-  """Requires that paths in camera_paths are contiguous and of the same type."""
+     Requires that paths in camera_paths are contiguous and of the same type.
+  """
   if len(camera_paths) < 1:
     raise ValueError("must provide at least one video to index")
 
   frame_type = fingerprint_video(camera_paths[0])
-  for fn in camera_paths:
-    index_video(fn, frame_type, cache_prefix)
+  # the work happens in vidindex, ffprobe and downloads, threads are enough
+  with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+    for _ in pool.map(lambda fn: index_video(fn, frame_type, cache_prefix), camera_paths):
+      pass
 
 
 def index_video(fn, frame_type=None, cache_prefix=None):
-  cache_path = cache_path_for_file_path(fn, cache_prefix)
+  """Returns the index of a video, building and caching it if needed."""
+  cache_path = video_index_path(fn, cache_prefix)
+  source_size = video_source_size(fn)
 
-  if os.path.exists(cache_path):
-    return
+  index = VideoIndex.load(cache_path, source_size)
+  if index is not None:
+    return index
 
   if frame_type is None:
-    frame_type = fingerprint_video(fn[0])
+    frame_type = fingerprint_video(fn)
 
   if frame_type == FrameType.h265_stream:
-    index_stream(fn, "hevc", cache_prefix=cache_prefix)
+    index = index_stream(fn, "hevc")
   else:
     raise NotImplementedError("Only h265 supported")
 
+  index.save(cache_path, source_size)
+  return index
 
-def get_video_index(fn, frame_type, cache_prefix=None):
-  cache_path = cache_path_for_file_path(fn, cache_prefix)
-
-  if not os.path.exists(cache_path):
-    index_video(fn, frame_type, cache_prefix)
 
-  if not os.path.exists(cache_path):
-    return None
-  with open(cache_path, "rb") as cache_file:
-    return pickle.load(cache_file)
+def get_video_index(fn, frame_type, cache_prefix=None):
+  return index_video(fn, frame_type, cache_prefix)
 
 
 def read_file_check_size(f, sz, cookie):
@@ -239,6 +233,19 @@ def decompress_video_data(rawdat, vid_fmt, w, h, pix_fmt):
     if proc.wait() != 0:
       raise DataUnreadableError("ffmpeg failed")
 
+  return frames_from_buffer(dat, w, h, pix_fmt)
+
+
+def frame_size(w, h, pix_fmt):
+  if pix_fmt == "yuv420p":
+    return w*h*3//2
+  elif pix_fmt in ("rgb24", "yuv444p"):
+    return w*h*3
+  else:
+    raise NotImplementedError
+
+
+def frames_from_buffer(dat, w, h, pix_fmt):
   if pix_fmt == "rgb24":
     ret = np.frombuffer(dat, dtype=np.uint8).reshape(-1, h, w, 3)
   elif pix_fmt == "yuv420p":
@@ -251,6 +258,143 @@ def decompress_video_data(rawdat, vid_fmt, w, h, pix_fmt):
   return ret
 
 
+def hevc_picture_count(dat):
+  """Number of coded pictures in an HEVC bytestream, each starts with its first slice segment."""
+  count = 0
+  pos = dat.find(b"\x00\x00\x01")
+  while pos != -1 and pos + 5 < len(dat):
+    nal_type = (dat[pos + 3] >> 1) & 0x3f
+    # VCL NAL units, with first_slice_segment_in_pic_flag set
+    if nal_type < 32 and dat[pos + 5] & 0x80:
+      count += 1
+    pos = dat.find(b"\x00\x00\x01", pos + 3)
+  return count
+
+
+class GOPDecoder:
+  """A long running ffmpeg process that decodes GOPs written to it one at a time.
+
+     Only usable for low delay streams, where every frame of a GOP is output as soon as
+     the GOP is terminated by an access unit delimiter. ffmpeg outputs one frame per coded
+     picture, any other frame count raises and the decoder has to be replaced.
+  """
+  def __init__(self, vid_fmt, w, h, pix_fmt):
+    self.w = w
+    self.h = h
+    self.pix_fmt = pix_fmt
+    self.out_size = frame_size(w, h, pix_fmt)
+
+    threads = os.getenv("FFMPEG_THREADS", "0")
+    cuda = os.getenv("FFMPEG_CUDA", "0") == "1"
+    self.proc = subprocess.Popen(
+      ["ffmpeg",
+       "-threads", threads,
+       # frame threading delays output by a frame per thread
+       "-thread_type", "slice",
+       "-hwaccel", "none" if not cuda else "cuda",
+       "-c:v", "hevc",
+       "-analyzeduration", "0",
+       "-probesize", "32",
+       "-vsync", "0",
+       "-f", vid_fmt,
+       "-flags2", "showall",
+       "-i", "pipe:0",
+       "-threads", threads,
+       "-f", "rawvideo",
+       "-pix_fmt", pix_fmt,
+       "-flush_packets", "1",
+       "pipe:1"],
+      stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=open("/dev/null", "wb"), bufsize=0)
+
+    # written from another thread, ffmpeg stops reading once the output pipe is full
+    self.in_q = queue.Queue()
+    self.t = threading.Thread(target=self._write_thread)
+    self.t.daemon = True
+    self.t.start()
+
+  def _write_thread(self):
+    while True:
+      dat = self.in_q.get()
+      if dat is None:
+        break
+      try:
+        view = memoryview(dat)
+        while len(view):
+          view = view[self.proc.stdin.write(view):]
+      except OSError:
+        break
+
+  def _output_pending(self):
+    ready, _, _ = select.select([self.proc.stdout], [], [], 0)
+    return bool(ready)
+
+  def decode(self, rawdat, num_frames):
+    # the output isn't framed, a wrong count would shift frames between GOPs
+    pictures = hevc_picture_count(rawdat)
+    if pictures != num_frames:
+      raise DataUnreadableError(f"GOP has {pictures} pictures, expected {num_frames}")
+    if self._output_pending():
+      raise DataUnreadableError("ffmpeg decoder has output left from the last GOP")
+
+    self.in_q.put(rawdat)
+    self.in_q.put(HEVC_AUD)
+
+    dat = bytearray(num_frames * self.out_size)
+    with memoryview(dat) as view:
+      pos = 0
+      while pos < len(dat):
+        ready, _, _ = select.select([self.proc.stdout], [], [], DECODER_TIMEOUT)
+        if not ready:
+          raise DataUnreadableError("ffmpeg decoder timed out")
+        n = self.proc.stdout.readinto(view[pos:])
+        if not n:
+          raise DataUnreadableError("ffmpeg decoder exited")
+        pos += n
+
+    if self._output_pending():
+      raise DataUnreadableError(f"ffmpeg decoder output more than {num_frames} frames")
+    return frames_from_buffer(dat, self.w, self.h, self.pix_fmt)
+
+  def close(self):
+    self.in_q.put(None)
+    self.proc.kill()
+    self.proc.wait()
+
+
+class GOPDecoderPool:
+  """Keeps up to max_decoders GOPDecoders alive across frame readers, so seeks don't spawn ffmpeg."""
+  def __init__(self, max_decoders):
+    self.max_decoders = max_decoders
+    self._lock = threading.Lock()
+    self._slots = threading.Semaphore(max_decoders)
+    self._idle = []  # (key, decoder), least recently used first
+
+  def decode(self, rawdat, num_frames, vid_fmt, w, h, pix_fmt):
+    key = (vid_fmt, w, h, pix_fmt)
+    with self._slots:
+      with self._lock:
+        i = next((i for i, (k, _) in enumerate(self._idle) if k == key), None)
+        dec = self._idle.pop(i)[1] if i is not None else None
+      if dec is None:
+        dec = GOPDecoder(vid_fmt, w, h, pix_fmt)
+
+      try:
+        ret = dec.decode(rawdat, num_frames)
+      except Exception:
+        # restarted on the next decode, its output may be out of step with the input
+        dec.close()
+        raise
+
+      with self._lock:
+        self._idle.append((key, dec))
+        while len(self._idle) > self.max_decoders:
+          self._idle.pop(0)[1].close()
+    return ret
+
+
+decoder_pool = GOPDecoderPool(DECODER_POOL_SIZE)
+
+
 class BaseFrameReader:
   # properties: frame_type, frame_count, w, h
 
@@ -267,14 +411,15 @@ class BaseFrameReader:
     raise NotImplementedError
 
 
-def FrameReader(fn, cache_prefix=None, readahead=False, readbehind=False, index_data=None):
+def FrameReader(fn, cache_prefix=None, readahead=False, readbehind=False, index_data=None, cache_size=None, readahead_threads=None):
   frame_type = fingerprint_video(fn)
   if frame_type == FrameType.raw:
     return RawFrameReader(fn)
   elif frame_type in (FrameType.h265_stream,):
     if not index_data:
       index_data = get_video_index(fn, frame_type, cache_prefix)
-    return StreamFrameReader(fn, frame_type, index_data, readahead=readahead, readbehind=readbehind)
+    return StreamFrameReader(fn, frame_type, index_data, readahead=readahead, readbehind=readbehind,
+                             cache_size=cache_size, readahead_threads=readahead_threads)
   else:
     raise NotImplementedError(frame_type)
 
@@ -413,6 +558,7 @@ class StreamGOPReader(GOPReader):
     assert frame_type == FrameType.h265_stream
 
     self.fn = fn
+    self.mapped = None
 
     self.frame_type = frame_type
     self.frame_count = None
@@ -421,9 +567,12 @@ class StreamGOPReader(GOPReader):
     self.prefix = None
     self.index = None
 
-    self.index = index_data['index']
-    self.prefix = index_data['global_prefix']
-    probe = index_data['probe']
+    if isinstance(index_data, dict):
+      # legacy pickled index
+      probe = index_data['probe']['streams'][0]
+      index_data = VideoIndex(index_data['index'], index_data['global_prefix'], probe['width'], probe['height'])
+    self.index = index_data.index
+    self.prefix = index_data.prefix
 
     self.prefix_frame_data = None
     self.num_prefix_frames = 0
@@ -436,10 +585,12 @@ class StreamGOPReader(GOPReader):
 
     assert self.first_iframe == 0
 
+    self.low_delay = not np.any(self.index[:-1, 0] == HEVC_SLICE_B)
+
     self.frame_count = len(self.index) - 1
 
-    self.w = probe['streams'][0]['width']
-    self.h = probe['streams'][0]['height']
+    self.w = index_data.w
+    self.h = index_data.h
 
   def _lookup_gop(self, num):
     frame_b = num
@@ -455,21 +606,33 @@ class StreamGOPReader(GOPReader):
 
     return (frame_b, frame_e, offset_b, offset_e)
 
+  def gop_range(self, num):
+    frame_b, frame_e, _, _ = self._lookup_gop(num)
+    return frame_b, frame_e
+
   def get_gop(self, num):
     frame_b, frame_e, offset_b, offset_e = self._lookup_gop(num)
     assert frame_b <= num < frame_e
 
     num_frames = frame_e - frame_b
 
-    with FileReader(self.fn) as f:
-      f.seek(offset_b)
-      rawdat = f.read(offset_e - offset_b)
+    if self.mapped is None:
+      self.mapped = map_file(self.fn)
 
-      if num < self.first_iframe:
-        assert self.prefix_frame_data
-        rawdat = self.prefix_frame_data + rawdat
+    if self.mapped is not None:
+      # local files are sliced straight out of the shared mapping
+      gop = memoryview(self.mapped)[offset_b:offset_e]
+    else:
+      with FileReader(self.fn) as f:
+        f.seek(offset_b)
+        gop = f.read(offset_e - offset_b)
 
-      rawdat = self.prefix + rawdat
+    parts = [self.prefix]
+    if num < self.first_iframe:
+      assert self.prefix_frame_data
+      parts.append(self.prefix_frame_data)
+    parts.append(gop)
+    rawdat = b"".join(parts)
 
     skip_frames = 0
     if num < self.first_iframe:
@@ -478,79 +641,187 @@ class StreamGOPReader(GOPReader):
     return frame_b, num_frames, skip_frames, rawdat
 
 
+class FrameCache:
+  """Decoded GOPs of one reader, bounded by their size in bytes.
+
+     Eviction is least recently used first, except for GOPs in the window the reader is
+     about to read, in either direction, which are only dropped once nothing else is left.
+  """
+  def __init__(self, max_bytes):
+    self.max_bytes = max_bytes
+    self.nbytes = 0
+    self._gops = OrderedDict()  # (frame_b, pix_fmt) -> frames
+    self._frame_gop = {}  # (num, pix_fmt) -> frame_b
+
+  def __len__(self):
+    return len(self._frame_gop)
+
+  def __contains__(self, key):
+    return key in self._frame_gop
+
+  def get(self, num, pix_fmt):
+    frame_b = self._frame_gop.get((num, pix_fmt))
+    if frame_b is None:
+      return None
+    self._gops.move_to_end((frame_b, pix_fmt))
+    return self._gops[(frame_b, pix_fmt)][num - frame_b]
+
+  def put(self, frame_b, pix_fmt, frames, keep=None):
+    """Adds the frames of a GOP, keep is the (begin, end) frame window to evict last.
+       Returns the number of bytes evicted.
+    """
+    key = (frame_b, pix_fmt)
+    if key in self._gops:
+      return 0
+    self._gops[key] = frames
+    self.nbytes += frames.nbytes
+    for i in range(len(frames)):
+      self._frame_gop[(frame_b + i, pix_fmt)] = frame_b
+
+    evicted = 0
+    while self.nbytes > self.max_bytes and len(self._gops) > 1:
+      victim = None
+      for k, v in self._gops.items():
+        if k == key:
+          continue
+        if victim is None:
+          victim = k
+        if keep is None or k[0] + len(v) <= keep[0] or k[0] >= keep[1]:
+          victim = k
+          break
+      evicted += self._evict(victim)
+    return evicted
+
+  def _evict(self, key):
+    frames = self._gops.pop(key)
+    self.nbytes -= frames.nbytes
+    for i in range(len(frames)):
+      del self._frame_gop[(key[0] + i, key[1])]
+    return frames.nbytes
+
+
 class GOPFrameReader(BaseFrameReader):
   #FrameReader with caching and readahead for formats that are group-of-picture based
 
-  def __init__(self, readahead=False, readbehind=False):
+  def __init__(self, readahead=False, readbehind=False, cache_size=None, readahead_threads=None):
     self.open_ = True
 
     self.readahead = readahead
     self.readbehind = readbehind
-    self.frame_cache = LRU(64)
-
+    self.readahead_len = 30
+
+    self.cache_lock = threading.Lock()
+    self.frame_cache = FrameCache(cache_size if cache_size is not None else FRAME_CACHE_SIZE)
+    self._pending = {}  # (frame_b, pix_fmt) -> Future of the GOP being decoded
+    self._last = None  # (num, pix_fmt) after the last get
+
+    self.stats = {
+      'hits': 0,  # frames returned from the cache
+      'misses': 0,  # frames that had to wait for a decode
+      'gops_decoded': 0,
+      'readahead_gops': 0,  # GOPs decoded ahead of being asked for
+      'decode_time': 0.,  # seconds spent decoding, summed over threads
+      'evicted_bytes': 0,
+    }
+
+    self.readahead_pool = None
     if self.readahead:
-      self.cache_lock = threading.RLock()
-      self.readahead_last = None
-      self.readahead_len = 30
-      self.readahead_c = threading.Condition()
-      self.readahead_thread = threading.Thread(target=self._readahead_thread)
-      self.readahead_thread.daemon = True
-      self.readahead_thread.start()
-    else:
-      self.cache_lock = DoNothingContextManager()
+      threads = readahead_threads if readahead_threads is not None else READAHEAD_THREADS
+      self.readahead_pool = ThreadPoolExecutor(max_workers=max(1, threads))
 
   def close(self):
     if not self.open_:
       return
     self.open_ = False
 
-    if self.readahead:
-      self.readahead_c.acquire()
-      self.readahead_c.notify()
-      self.readahead_c.release()
-      self.readahead_thread.join()
-
-  def _readahead_thread(self):
-    while True:
-      self.readahead_c.acquire()
-      try:
-        if not self.open_:
-          break
-        self.readahead_c.wait()
-      finally:
-        self.readahead_c.release()
-      if not self.open_:
-        break
-      assert self.readahead_last
-      num, pix_fmt = self.readahead_last
-
-      if self.readbehind:
-        for k in range(num - 1, max(0, num - self.readahead_len), -1):
-          self._get_one(k, pix_fmt)
-      else:
-        for k in range(num, min(self.frame_count, num + self.readahead_len)):
-          self._get_one(k, pix_fmt)
-
-  def _get_one(self, num, pix_fmt):
-    assert num < self.frame_count
-
-    if (num, pix_fmt) in self.frame_cache:
-      return self.frame_cache[(num, pix_fmt)]
+    if self.readahead_pool is not None:
+      self.readahead_pool.shutdown(wait=True)
 
+  def cache_info(self):
+    """Counters of the frame cache, for tuning cache_size and readahead."""
     with self.cache_lock:
-      if (num, pix_fmt) in self.frame_cache:
-        return self.frame_cache[(num, pix_fmt)]
+      ret = dict(self.stats)
+      ret['cached_frames'] = len(self.frame_cache)
+      ret['cached_bytes'] = self.frame_cache.nbytes
+    return ret
+
+  def _keep_window(self):
+    if self._last is None:
+      return None
+    num = self._last[0]
+    if self.readbehind:
+      return (max(0, num - self.readahead_len), num)
+    return (num, num + self.readahead_len)
 
+  def _decode_gop(self, num, pix_fmt, fut, readahead=False):
+    try:
+      t = time.monotonic()
       frame_b, num_frames, skip_frames, rawdat = self.get_gop(num)
 
-      ret = decompress_video_data(rawdat, self.vid_fmt, self.w, self.h, pix_fmt)
+      ret = None
+      if self.low_delay and DECODER_POOL_SIZE > 0:
+        try:
+          ret = decoder_pool.decode(rawdat, skip_frames + num_frames, self.vid_fmt, self.w, self.h, pix_fmt)
+        except DataUnreadableError:
+          pass
+      if ret is None:
+        ret = decompress_video_data(rawdat, self.vid_fmt, self.w, self.h, pix_fmt)
       ret = ret[skip_frames:]
       assert ret.shape[0] == num_frames
 
-      for i in range(ret.shape[0]):
-        self.frame_cache[(frame_b+i, pix_fmt)] = ret[i]
+      with self.cache_lock:
+        self.stats['gops_decoded'] += 1
+        self.stats['readahead_gops'] += int(readahead)
+        self.stats['decode_time'] += time.monotonic() - t
+        self.stats['evicted_bytes'] += self.frame_cache.put(frame_b, pix_fmt, ret, self._keep_window())
+        del self._pending[(frame_b, pix_fmt)]
+      fut.set_result(ret)
+    except BaseException as e:
+      with self.cache_lock:
+        self._pending.pop((self.gop_range(num)[0], pix_fmt), None)
+      fut.set_exception(e)
+
+  def _get_gop_future(self, num, pix_fmt):
+    # returns (frame_b, future, owner), the caller has to run the decode if it's the owner
+    frame_b = self.gop_range(num)[0]
+    fut = self._pending.get((frame_b, pix_fmt))
+    if fut is not None:
+      return frame_b, fut, False
+    fut = Future()
+    self._pending[(frame_b, pix_fmt)] = fut
+    return frame_b, fut, True
 
-      return self.frame_cache[(num, pix_fmt)]
+  def _get_one(self, num, pix_fmt):
+    assert num < self.frame_count
+
+    with self.cache_lock:
+      frame = self.frame_cache.get(num, pix_fmt)
+      if frame is not None:
+        self.stats['hits'] += 1
+        return frame
+      self.stats['misses'] += 1
+      frame_b, fut, owner = self._get_gop_future(num, pix_fmt)
+
+    if owner:
+      self._decode_gop(num, pix_fmt, fut)
+    return fut.result()[num - frame_b]
+
+  def _schedule_readahead(self, num, pix_fmt):
+    if self.readbehind:
+      k, stop, step = num - 1, max(0, num - self.readahead_len) - 1, -1
+    else:
+      k, stop, step = num, min(self.frame_count, num + self.readahead_len), 1
+
+    while (k - stop) * step < 0:
+      frame_b, frame_e = self.gop_range(k)
+      with self.cache_lock:
+        if (k, pix_fmt) in self.frame_cache or (frame_b, pix_fmt) in self._pending:
+          fut = None
+        else:
+          _, fut, _ = self._get_gop_future(k, pix_fmt)
+      if fut is not None:
+        self.readahead_pool.submit(self._decode_gop, k, pix_fmt, fut, True)
+      k = frame_b - 1 if step < 0 else frame_e
 
   def get(self, num, count=1, pix_fmt="yuv420p"):
     assert self.frame_count is not None
@@ -561,21 +832,29 @@ class GOPFrameReader(BaseFrameReader):
     if pix_fmt not in ("yuv420p", "rgb24", "yuv444p"):
       raise ValueError("Unsupported pixel format %r" % pix_fmt)
 
+    self._last = (num + count, pix_fmt)
+    if self.readahead:
+      # decode the rest of the request concurrently too
+      if self.readbehind:
+        self._schedule_readahead(num + count, pix_fmt)
+      else:
+        self._schedule_readahead(num, pix_fmt)
+
     ret = [self._get_one(num + i, pix_fmt) for i in range(count)]
 
     if self.readahead:
-      self.readahead_last = (num+count, pix_fmt)
-      self.readahead_c.acquire()
-      self.readahead_c.notify()
-      self.readahead_c.release()
+      if self.readbehind:
+        self._schedule_readahead(num, pix_fmt)
+      else:
+        self._schedule_readahead(num + count, pix_fmt)
 
     return ret
 
 
 class StreamFrameReader(StreamGOPReader, GOPFrameReader):
-  def __init__(self, fn, frame_type, index_data, readahead=False, readbehind=False):
+  def __init__(self, fn, frame_type, index_data, readahead=False, readbehind=False, cache_size=None, readahead_threads=None):
     StreamGOPReader.__init__(self, fn, frame_type, index_data)
-    GOPFrameReader.__init__(self, readahead, readbehind)
+    GOPFrameReader.__init__(self, readahead, readbehind, cache_size, readahead_threads)
 
 
 def GOPFrameIterator(gop_reader, pix_fmt):
@@ -0,0 +1,143 @@
+"""Columnar export of scalar Event fields, with a memory-mappable per segment cache."""
+import json
+import operator
+import os
+import shutil
+import numpy as np
+
+from cereal import log as capnp_log
+from tools.lib.cache import cache_path_for_file_path
+from tools.lib.file_helpers import atomic_write_in_dir, mkdirs_exists_ok
+from tools.lib.log_index import log_source_size
+
+LOG_COLUMNS_VERSION = 1
+
+_SCALAR_DTYPES = {
+  'bool': np.bool_,
+  'int8': np.int8,
+  'int16': np.int16,
+  'int32': np.int32,
+  'int64': np.int64,
+  'uint8': np.uint8,
+  'uint16': np.uint16,
+  'uint32': np.uint32,
+  'uint64': np.uint64,
+  'float32': np.float32,
+  'float64': np.float64,
+  'enum': np.uint16,  # raw enumerant value
+}
+
+
+def field_getter(path):
+  """Returns (getter, dtype) for a dotted path to a scalar field of Event, e.g. carState.vEgo."""
+  schema = capnp_log.Event.schema
+  names = path.split('.')
+  for i, name in enumerate(names):
+    if name not in schema.fields:
+      raise ValueError(f"unknown field {path}")
+    field = schema.fields[name]
+    last = i == len(names) - 1
+
+    if field.proto.which() == 'group':
+      typ = 'group'
+    else:
+      typ = field.proto.slot.type.which()
+
+    if last and typ in _SCALAR_DTYPES:
+      getter = operator.attrgetter(path)
+      if typ == 'enum':
+        return (lambda ent: getter(ent).raw), _SCALAR_DTYPES[typ]
+      return getter, _SCALAR_DTYPES[typ]
+    elif last or typ not in ('struct', 'group'):
+      raise ValueError(f"{path} is not a scalar field")
+    schema = field.schema
+
+
+def split_fields(fields):
+  """Returns the service the fields belong to, fields may also include logMonoTime."""
+  services = {f.split('.')[0] for f in fields if f != 'logMonoTime'}
+  if len(services) != 1:
+    raise ValueError(f"fields must belong to exactly one service, got {sorted(services)}")
+  return services.pop()
+
+
+def columns_from_events(events, fields):
+  """Builds {field: array} with one row per event of the fields' service, in one pass."""
+  service = split_fields(fields)
+  getters = {f: field_getter(f) for f in fields}
+
+  values = {f: [] for f in fields}
+  for ent in events:
+    if ent.which() != service:
+      continue
+    for f, (getter, _) in getters.items():
+      values[f].append(getter(ent))
+
+  return {f: np.array(values[f], dtype=getters[f][1]) for f in fields}
+
+
+def _cache_name(service, field):
+  # logMonoTime is per service, so that every column in the cache has the length of its service
+  return f"{service}.logMonoTime" if field == 'logMonoTime' else field
+
+
+class LogColumnCache:
+  """One .npy file per column of a log, so they can be loaded with mmap_mode."""
+  def __init__(self, fn):
+    self.path = cache_path_for_file_path(fn) + "_columns"
+    self._meta = {'version': LOG_COLUMNS_VERSION, 'source_size': log_source_size(fn)}
+
+    meta_path = os.path.join(self.path, "meta.json")
+    if os.path.exists(meta_path):
+      with open(meta_path) as f:
+        stale = json.load(f) != self._meta
+      if stale:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    if not os.path.exists(meta_path):
+      mkdirs_exists_ok(self.path)
+      with atomic_write_in_dir(meta_path, mode="w", overwrite=True) as f:
+        json.dump(self._meta, f)
+
+  def _column_path(self, name):
+    return os.path.join(self.path, name + ".npy")
+
+  def load(self, service, fields, mmap_mode='r'):
+    """Returns {field: array}, or None if any of the columns is missing."""
+    ret = {}
+    for f in fields:
+      path = self._column_path(_cache_name(service, f))
+      if not os.path.exists(path):
+        return None
+      ret[f] = np.load(path, mmap_mode=mmap_mode)
+    return ret
+
+  def save(self, service, columns):
+    for f, col in columns.items():
+      with atomic_write_in_dir(self._column_path(_cache_name(service, f)), mode="wb", overwrite=True) as fh:
+        np.save(fh, col)
+
+
+def read_columns(fn, fields, cache=True, mmap_mode='r'):
+  """Returns {field: array} for scalar fields of one service in a log, e.g.
+     ['logMonoTime', 'carState.vEgo', 'carState.steeringAngleDeg'].
+
+     Only messages of that service are decoded, and with cache=True columns are read back
+     from ~/.commacache on later calls instead of opening the log at all.
+  """
+  from tools.lib.logreader import LogReader
+
+  service = split_fields(fields)
+  for f in fields:
+    field_getter(f)
+
+  column_cache = LogColumnCache(fn) if cache else None
+  if column_cache is not None:
+    columns = column_cache.load(service, fields, mmap_mode)
+    if columns is not None:
+      return columns
+
+  columns = LogReader(fn, services=[service]).columns(fields)
+  if column_cache is not None:
+    column_cache.save(service, columns)
+  return columns
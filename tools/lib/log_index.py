@@ -0,0 +1,210 @@
+import os
+import struct
+import numpy as np
+
+from cereal import log as capnp_log
+from tools.lib.cache import cache_path_for_file_path
+from tools.lib.file_helpers import atomic_write_in_dir
+
+LOG_INDEX_VERSION = 1
+NO_DISCRIMINANT = 0xFFFF
+
+# one row per framed message in the decompressed log
+INDEX_DTYPE = np.dtype([
+  ('offset', np.uint64),
+  ('size', np.uint32),
+  ('which', np.uint16),
+  ('logMonoTime', np.uint64),
+])
+
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+
+def frame_size(buf, offset):
+  """Returns (header_size, message_size) of the framed capnp message starting at
+     offset, or None if buf does not hold the complete segment table yet.
+  """
+  if len(buf) - offset < 4:
+    return None
+  num_segments = _U32.unpack_from(buf, offset)[0] + 1
+  header_size = (4 * (num_segments + 1) + 7) & ~7
+  if len(buf) - offset < header_size:
+    return None
+  words = sum(struct.unpack_from("<%dI" % num_segments, buf, offset + 4))
+  return header_size, header_size + 8 * words
+
+
+class EventLayout:
+  """Byte offsets of the Event fields needed to index a message without decoding it."""
+  def __init__(self, schema=None):
+    node = (schema or capnp_log.Event.schema).node
+    self.discriminant_offset = node.struct.discriminantOffset * 2
+
+    names = {}
+    self.mono_time_offset = 0
+    for field in node.struct.fields:
+      if field.discriminantValue != NO_DISCRIMINANT:
+        names[field.discriminantValue] = field.name
+      elif field.name == 'logMonoTime':
+        self.mono_time_offset = field.slot.offset * 8
+
+    self.services = tuple(names.get(i, "") for i in range(max(names) + 1))
+    self.codes = {name: code for code, name in enumerate(self.services) if name}
+
+  def parse(self, buf, offset, header_size, size):
+    """Returns (logMonoTime, discriminant) of the Event at offset."""
+    root = offset + header_size
+    ptr = _U64.unpack_from(buf, root)[0]
+    if ptr & 3 != 0:
+      # far pointer to the root struct, let capnp resolve it
+      return self._parse_slow(bytes(buf[offset:offset + size]))
+
+    ptr_offset = (ptr & 0xFFFFFFFF) >> 2
+    if ptr_offset & (1 << 29):
+      ptr_offset -= 1 << 30
+    data_size = ((ptr >> 32) & 0xFFFF) * 8
+    data = root + 8 * (ptr_offset + 1)
+
+    mono_time = 0
+    if self.mono_time_offset + 8 <= data_size:
+      mono_time = _U64.unpack_from(buf, data + self.mono_time_offset)[0]
+    which = 0
+    if self.discriminant_offset + 2 <= data_size:
+      which = struct.unpack_from("<H", buf, data + self.discriminant_offset)[0]
+    return mono_time, which
+
+  def _parse_slow(self, dat):
+    ent = capnp_log.Event.from_bytes(dat)
+    try:
+      which = self.codes[ent.which()]
+    except Exception:
+      which = NO_DISCRIMINANT
+    return ent.logMonoTime, which
+
+
+_layout = None
+
+def event_layout():
+  global _layout
+  if _layout is None:
+    _layout = EventLayout()
+  return _layout
+
+
+def iter_frames(buf):
+  """Yields (offset, header_size, size) of every complete framed message in buf."""
+  offset = 0
+  while True:
+    frame = frame_size(buf, offset)
+    if frame is None or offset + frame[1] > len(buf):
+      return
+    yield (offset,) + frame
+    offset += frame[1]
+
+
+def service_codes(services=None, only_union_types=False):
+  """Union discriminants of the events to decode, or None to decode all of them."""
+  layout = event_layout()
+  if services is None:
+    return frozenset(range(len(layout.services))) if only_union_types else None
+
+  unknown = set(services) - set(layout.codes)
+  if len(unknown):
+    raise ValueError(f"unknown services {sorted(unknown)}")
+  return frozenset(layout.codes[s] for s in services)
+
+
+class LogIndexBuilder:
+  def __init__(self):
+    self._rows = []
+
+  def append(self, log_offset, size, which, mono_time):
+    self._rows.append((log_offset, size, which, mono_time))
+
+  def finish(self):
+    return LogIndex(np.array(self._rows, dtype=INDEX_DTYPE), event_layout().services)
+
+
+class LogIndex:
+  """Offsets, union types and logMonoTimes of every message in a decompressed log."""
+  def __init__(self, entries, services):
+    self.entries = entries
+    self.services = tuple(services)
+
+  def __len__(self):
+    return len(self.entries)
+
+  @property
+  def offsets(self):
+    return self.entries['offset']
+
+  @property
+  def sizes(self):
+    return self.entries['size']
+
+  @property
+  def which(self):
+    return self.entries['which']
+
+  @property
+  def mono_times(self):
+    return self.entries['logMonoTime']
+
+  @property
+  def known_types(self):
+    """Mask of the messages whose union type is part of the current schema."""
+    return self.which < len(self.services)
+
+  def select(self, codes):
+    """Mask of the messages whose union discriminant is in codes."""
+    return np.isin(self.which, np.fromiter(codes, dtype=np.uint16, count=len(codes)))
+
+  def first_at(self, mono_time):
+    """Position of the first message logged at or after mono_time, in log order."""
+    after = self.mono_times >= mono_time
+    return int(np.argmax(after)) if after.any() else len(self)
+
+  @classmethod
+  def build(cls, dat):
+    layout = event_layout()
+    builder = LogIndexBuilder()
+    for offset, header_size, size in iter_frames(dat):
+      mono_time, which = layout.parse(dat, offset, header_size, size)
+      builder.append(offset, size, which, mono_time)
+    return builder.finish()
+
+  def save(self, path, source_size=-1):
+    with atomic_write_in_dir(path, mode="wb", overwrite=True) as f:
+      np.savez(f, version=LOG_INDEX_VERSION, source_size=source_size,
+               services=np.array(self.services), entries=self.entries)
+
+  @classmethod
+  def load(cls, path, source_size=-1):
+    """Returns the index stored at path, or None if it is missing or stale."""
+    if not os.path.exists(path):
+      return None
+    try:
+      with np.load(path) as dat:
+        if int(dat['version']) != LOG_INDEX_VERSION or int(dat['source_size']) != source_size:
+          return None
+        services = tuple(str(s) for s in dat['services'])
+        entries = dat['entries']
+    except (OSError, ValueError, KeyError):
+      return None
+
+    # codes are union discriminants, only valid against the schema they were read with
+    if services != event_layout().services:
+      return None
+    return cls(entries, services)
+
+
+def log_index_path(fn):
+  return cache_path_for_file_path(fn) + "_msgindex.npz"
+
+
+def log_source_size(fn):
+  # remote logs are immutable once uploaded, only local ones can change under the index
+  if fn.startswith("http://") or fn.startswith("https://"):
+    return -1
+  return os.path.getsize(fn)
@@ -2,35 +2,81 @@
 import os
 import sys
 import bz2
+import itertools
+import threading
 import urllib.parse
-import capnp
+from concurrent.futures import Future
+import numpy as np
 
 try:
   from xx.chffr.lib.filereader import FileReader
 except ImportError:
   from tools.lib.filereader import FileReader
 from cereal import log as capnp_log
+from tools.lib.filereader import map_file
+from tools.lib.log_columns import columns_from_events
+from tools.lib.log_index import LogIndex, LogIndexBuilder, event_layout, iter_frames, log_index_path, \
+                                log_source_size, service_codes
+
+# decompressed incrementally in pieces of this size when streaming
+STREAM_CHUNK_SIZE = 1 << 20
 
 # this is an iterator itself, and uses private variables from LogReader
 class MultiLogIterator(object):
-  def __init__(self, log_paths, wraparound=True):
+  def __init__(self, log_paths, wraparound=True, services=None, prefetch=True, cache_index=False):
     self._log_paths = log_paths
     self._wraparound = wraparound
+    self._services = services
+    self._prefetch = prefetch
+    self._cache_index = cache_index
 
     self._first_log_idx = next(i for i in range(len(log_paths)) if log_paths[i] is not None)
     self._current_log = self._first_log_idx
     self._idx = 0
     self._log_readers = [None]*len(log_paths)
-    self.start_time = self._log_reader(self._first_log_idx)._ts[0]
+    self._seek_times = [None]*len(log_paths)
+    self._prefetching = {}
+
+    lr = self._log_reader(self._first_log_idx)
+    if lr.index is not None and len(lr.index):
+      # the first message of the route, even if it was filtered out
+      self.start_time = int(lr.index.mono_times[0])
+    else:
+      self.start_time = lr._ts[0]
+    self._prefetch_next(self._first_log_idx)
+
+  def _new_log_reader(self, i):
+    log_path = self._log_paths[i]
+    print("LogReader:%s" % log_path)
+    return LogReader(log_path, services=self._services, cache_index=self._cache_index)
 
   def _log_reader(self, i):
     if self._log_readers[i] is None and self._log_paths[i] is not None:
-      log_path = self._log_paths[i]
-      print("LogReader:%s" % log_path)
-      self._log_readers[i] = LogReader(log_path)
+      if i in self._prefetching:
+        self._log_readers[i] = self._prefetching.pop(i).result()
+      else:
+        self._log_readers[i] = self._new_log_reader(i)
 
     return self._log_readers[i]
 
+  def _prefetch_next(self, i):
+    # decode the following segment in the background so playback and seeks don't stall at the boundary
+    nxt = next((j for j in range(i + 1, len(self._log_paths)) if self._log_paths[j] is not None), None)
+    if nxt is None and self._wraparound:
+      nxt = self._first_log_idx
+    if not self._prefetch or nxt is None or self._log_readers[nxt] is not None or nxt in self._prefetching:
+      return
+
+    fut = Future()
+    def load():
+      try:
+        fut.set_result(self._new_log_reader(nxt))
+      except Exception as e:
+        fut.set_exception(e)
+
+    self._prefetching[nxt] = fut
+    threading.Thread(target=load, daemon=True).start()
+
   def __iter__(self):
     return self
 
@@ -43,69 +89,225 @@ class MultiLogIterator(object):
       self._current_log = next(i for i in range(self._current_log + 1, len(self._log_readers) + 1)
                                if i == len(self._log_readers) or self._log_paths[i] is not None)
       # wraparound
-      if self._current_log == len(self._log_readers):
-        if self._wraparound:
-          self._current_log = self._first_log_idx
-        else:
-          raise StopIteration
+      if self._current_log == len(self._log_readers) and self._wraparound:
+        self._current_log = self._first_log_idx
+      if self._current_log < len(self._log_readers):
+        self._prefetch_next(self._current_log)
 
   def __next__(self):
+    empty_logs = 0
     while 1:
+      if self._current_log == len(self._log_readers):
+        raise StopIteration
       lr = self._log_reader(self._current_log)
-      ret = lr._ents[self._idx]
+      if self._idx < len(lr._ents):
+        ret = lr._ents[self._idx]
+        self._inc()
+        return ret
+
+      # nothing selected by the services filter in this log
+      empty_logs += 1
+      if empty_logs > len(self._log_readers):
+        raise StopIteration
       self._inc()
-      return ret
 
   def tell(self):
     # returns seconds from start of log
     return (self._log_reader(self._current_log)._ts[self._idx] - self.start_time) * 1e-9
 
+  def _seek_time_array(self, i):
+    # rlogs are only mostly sorted, the running max is sorted and its first
+    # entry >= t is the first message logged at or after t
+    if self._seek_times[i] is None:
+      ts = np.array(self._log_reader(i)._ts, dtype=np.uint64)
+      self._seek_times[i] = np.maximum.accumulate(ts) if len(ts) else ts
+    return self._seek_times[i]
+
   def seek(self, ts):
     # seek to nearest minute
     minute = int(ts/60)
-    if minute >= len(self._log_paths) or self._log_paths[minute] is None:
+    if ts < 0 or minute >= len(self._log_paths) or self._log_paths[minute] is None:
       return False
 
     self._current_log = minute
+    self._prefetch_next(minute)
 
-    # HACK: O(n) seek afterward
-    self._idx = 0
-    while self.tell() < ts:
+    seek_times = self._seek_time_array(minute)
+    self._idx = int(np.searchsorted(seek_times, self.start_time + int(ts * 1e9)))
+    if self._idx == len(seek_times):
+      # past the end of this segment, continue at the start of the next one
+      self._idx = len(seek_times) - 1
       self._inc()
     return True
 
 
-class LogReader(object):
-  def __init__(self, fn, canonicalize=True, only_union_types=False):
-    data_version = None
-    _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
+def log_extension(fn):
+  _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
+  # old rlogs weren't bz2 compressed
+  if ext not in ("", ".bz2"):
+    raise Exception(f"unknown extension {ext}")
+  return ext
+
+
+def read_log(fn):
+  """Returns the decompressed contents of a log, uncompressed local logs are memory mapped."""
+  ext = log_extension(fn)
+  dat = map_file(fn)
+  if dat is None:
     with FileReader(fn) as f:
       dat = f.read()
+  if ext == ".bz2":
+    dat = bz2.decompress(dat)
+  return dat
 
-    if ext == "":
-      # old rlogs weren't bz2 compressed
-      ents = capnp_log.Event.read_multiple_bytes(dat)
-    elif ext == ".bz2":
-      dat = bz2.decompress(dat)
-      ents = capnp_log.Event.read_multiple_bytes(dat)
-    else:
-      raise Exception(f"unknown extension {ext}")
 
-    self._ents = list(ents)
-    self._ts = [x.logMonoTime for x in self._ents]
+class LogReader(object):
+  # log_data: decompressed contents of fn, if they were already read
+  # cache_index: load the message index from, and save it to, ~/.commacache
+  def __init__(self, fn, canonicalize=True, only_union_types=False, stream=False, cache_index=False, services=None,
+               log_data=None):
+    data_version = None
+    ext = log_extension(fn)
+
+    self._fn = fn
+    self._ext = ext
+    self._stream = stream
+    self._cache_index = cache_index
     self.data_version = data_version
     self._only_union_types = only_union_types
+    # events outside of these union types are skipped without being decoded
+    self._codes = service_codes(services, only_union_types)
 
-  def __iter__(self):
-    for ent in self._ents:
-      if self._only_union_types:
-        try:
-          ent.which()
-          yield ent
-        except capnp.lib.capnp.KjException:
-          pass
+    self.index = None
+    if cache_index:
+      self.index = LogIndex.load(log_index_path(fn), log_source_size(fn))
+
+    if not stream:
+      dat = read_log(fn) if log_data is None else log_data
+
+      self._positions = None
+      if self._codes is None:
+        ents = capnp_log.Event.read_multiple_bytes(dat)
+        self._ents = list(ents)
       else:
-        yield ent
+        if self.index is None:
+          self.index = LogIndex.build(dat)
+          self._save_index()
+        self._positions = np.flatnonzero(self.index.select(self._codes))
+        offsets = self.index.offsets[self._positions].tolist()
+        sizes = self.index.sizes[self._positions].tolist()
+        view = memoryview(dat)
+        self._ents = [capnp_log.Event.from_bytes(view[o:o + sz]) for o, sz in zip(offsets, sizes)]
+      self._ts = [x.logMonoTime for x in self._ents]
+
+  def _save_index(self):
+    if self._cache_index:
+      self.index.save(log_index_path(self._fn), log_source_size(self._fn))
+
+  def _read_chunks(self):
+    with FileReader(self._fn) as f:
+      length = f.get_length() if hasattr(f, "get_length") else None
+      decompressor = bz2.BZ2Decompressor() if self._ext == ".bz2" else None
+
+      pos = 0
+      while length is None or pos < length:
+        dat = f.read(STREAM_CHUNK_SIZE if length is None else min(STREAM_CHUNK_SIZE, length - pos))
+        if len(dat) == 0:
+          break
+        pos += len(dat)
+
+        if decompressor is None:
+          yield dat
+          continue
+
+        # rlogs can be several concatenated bz2 streams
+        while len(dat):
+          out = decompressor.decompress(dat)
+          if decompressor.eof:
+            dat = decompressor.unused_data
+            decompressor = bz2.BZ2Decompressor()
+          else:
+            dat = b""
+          if len(out):
+            yield out
+
+  def _decode_frames(self, buf, base, builder):
+    """Yields the selected events among the complete messages in buf, returns where the last one ends."""
+    layout = event_layout()
+    end = 0
+    for offset, header_size, size in iter_frames(buf):
+      end = offset + size
+      if builder is not None or self._codes is not None:
+        mono_time, which = layout.parse(buf, offset, header_size, size)
+        if builder is not None:
+          builder.append(base + offset, size, which, mono_time)
+        if self._codes is not None and which not in self._codes:
+          continue
+      # slicing a bytearray copies the message, slicing a memoryview doesn't
+      yield capnp_log.Event.from_bytes(buf[offset:end])
+    return end
+
+  def _stream_events(self, start=0):
+    builder = LogIndexBuilder() if self.index is None else None
+    skip_to = 0
+    if self.index is not None:
+      if start >= len(self.index):
+        return
+      skip_to = int(self.index.offsets[start])
+
+    mapped = map_file(self._fn) if self._ext == "" else None
+    if mapped is not None:
+      # uncompressed local logs are parsed in place
+      yield from self._decode_frames(memoryview(mapped)[skip_to:], skip_to, builder)
+    else:
+      buf = bytearray()
+      base = 0  # log offset of buf[0]
+      for chunk in self._read_chunks():
+        if base < skip_to:
+          n = min(len(chunk), skip_to - base)
+          base += n
+          chunk = chunk[n:]
+        buf += chunk
+
+        end = yield from self._decode_frames(buf, base, builder)
+        del buf[:end]
+        base += end
+
+    # a truncated message at the end of the log is dropped, the index only covers complete ones
+    if builder is not None:
+      self.index = builder.finish()
+      self._save_index()
+
+  def __iter__(self):
+    return self.iter_from(None)
+
+  def iter_from(self, mono_time):
+    """Yields events starting at the first one logged at or after mono_time, in log order.
+
+       Uses the message index, when available, to skip decoding everything before it.
+    """
+    start = 0
+    if mono_time is not None and self.index is not None:
+      start = self.index.first_at(mono_time)
+      mono_time = None
+
+    if self._stream:
+      ents = self._stream_events(start)
+    else:
+      if self._positions is not None:
+        start = int(np.searchsorted(self._positions, start))
+      ents = itertools.islice(self._ents, start, None)
+
+    for ent in ents:
+      if mono_time is not None:
+        if ent.logMonoTime < mono_time:
+          continue
+        mono_time = None
+      yield ent
+
+  def columns(self, fields):
+    """Returns {field: array} for scalar fields of one service, see tools.lib.log_columns.read_columns."""
+    return columns_from_events(self, fields)
 
 if __name__ == "__main__":
   import codecs
@@ -0,0 +1,66 @@
+"""RouteLogReader decompresses and filters the segments of a route in a process pool."""
+import collections
+import multiprocessing
+import numpy as np
+
+from tools.lib.log_index import LogIndex, log_index_path, log_source_size, service_codes
+from tools.lib.logreader import LogReader, read_log
+
+
+def _read_segment(log_path, services, only_union_types):
+  dat = read_log(log_path)
+  codes = service_codes(services, only_union_types)
+  if codes is None:
+    # uncompressed local logs come back memory mapped
+    return bytes(dat)
+
+  # only ship the selected messages back to the parent
+  index = LogIndex.load(log_index_path(log_path), log_source_size(log_path))
+  if index is None:
+    index = LogIndex.build(dat)
+    index.save(log_index_path(log_path), log_source_size(log_path))
+  selected = np.flatnonzero(index.select(codes))
+  offsets = index.offsets[selected].tolist()
+  sizes = index.sizes[selected].tolist()
+  return b"".join(dat[o:o + sz] for o, sz in zip(offsets, sizes))
+
+
+class RouteLogReader(object):
+  """Iterates over the events of a route, segment by segment in route order.
+
+     Segments are downloaded, decompressed and filtered by up to `workers` processes, at most
+     `in_flight` segments ahead of the one being iterated. Events are only decoded in the
+     calling process, as they are consumed.
+  """
+  def __init__(self, log_paths, services=None, only_union_types=False, workers=None, in_flight=None):
+    self._log_paths = [p for p in log_paths if p is not None]
+    self._services = services
+    self._only_union_types = only_union_types
+    self._workers = workers if workers is not None else multiprocessing.cpu_count()
+    self._in_flight = in_flight if in_flight is not None else self._workers
+
+    # fail early on unknown services
+    service_codes(services, only_union_types)
+
+  def __iter__(self):
+    with multiprocessing.Pool(self._workers) as pool:
+      pending = collections.deque()
+      to_submit = iter(self._log_paths)
+
+      def submit():
+        log_path = next(to_submit, None)
+        if log_path is not None:
+          args = (log_path, self._services, self._only_union_types)
+          pending.append((log_path, pool.apply_async(_read_segment, args)))
+
+      for _ in range(max(1, self._in_flight)):
+        submit()
+
+      while len(pending):
+        log_path, result = pending.popleft()
+        dat = result.get()
+        submit()
+
+        # data is already filtered and doesn't match the log on disk anymore, so no index caching
+        for ent in LogReader(log_path, cache_index=False, log_data=dat):
+          yield ent
@@ -1,17 +1,49 @@
 #!/usr/bin/env python3
 import os
+import re
 import shutil
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 os.environ["COMMA_CACHE"] = "/tmp/__test_cache__"
-from tools.lib.url_file import URLFile, CACHE_DIR
+from tools.lib.url_file import URLFile, CACHE_DIR, CHUNK_SIZE, evict_cache
+
+LOCAL_FILE_DATA = bytes(i % 251 for i in range(int(CHUNK_SIZE * 5.5)))
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+  def log_message(self, *args):
+    pass
+
+  def do_HEAD(self):
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(LOCAL_FILE_DATA)))
+    self.end_headers()
+
+  def do_GET(self):
+    m = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+    if m is None:
+      self.send_response(200)
+      dat = LOCAL_FILE_DATA
+    else:
+      start, end = int(m.group(1)), int(m.group(2))
+      if start >= len(LOCAL_FILE_DATA):
+        self.send_response(416)
+        self.end_headers()
+        return
+      self.send_response(206)
+      dat = LOCAL_FILE_DATA[start:end + 1]
+    self.send_header("Content-Length", str(len(dat)))
+    self.end_headers()
+    self.wfile.write(dat)
 
 
 class TestFileDownload(unittest.TestCase):
 
   def compare_loads(self, url, start=0, length=None):
     """Compares range between cached and non cached version"""
-    shutil.rmtree(CACHE_DIR)
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
 
     file_cached = URLFile(url, cache=True)
     file_downloaded = URLFile(url, cache=False)
@@ -64,6 +96,35 @@ class TestFileDownload(unittest.TestCase):
     self.compare_loads(large_file_url, length - 100, 100)
     self.compare_loads(large_file_url)
 
+  def test_local_server(self):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+      url = f"http://127.0.0.1:{server.server_address[1]}/rlog.bz2"
+      length = len(LOCAL_FILE_DATA)
+      self.compare_loads(url)
+      for start, ll in ((0, 100), (CHUNK_SIZE - 10, 20), (length - 100, 100), (123, 3 * CHUNK_SIZE)):
+        self.compare_loads(url, start, ll)
+
+      # reads past the end are cut short
+      f = URLFile(url, cache=True)
+      f.seek(length - 10)
+      self.assertEqual(f.read(ll=1000), LOCAL_FILE_DATA[-10:])
+
+      # sequential reads continue from the readahead
+      shutil.rmtree(CACHE_DIR, ignore_errors=True)
+      f = URLFile(url, cache=True)
+      dat = b"".join(f.read(ll=CHUNK_SIZE // 3) for _ in range(length // (CHUNK_SIZE // 3) + 1))
+      self.assertEqual(dat, LOCAL_FILE_DATA)
+
+      # only the most recently used chunks survive eviction
+      evict_cache(2 * CHUNK_SIZE)
+      self.assertLessEqual(sum(os.path.getsize(os.path.join(CACHE_DIR, fn)) for fn in os.listdir(CACHE_DIR)), 2 * CHUNK_SIZE)
+      f = URLFile(url, cache=True)
+      self.assertEqual(f.read(), LOCAL_FILE_DATA)
+    finally:
+      server.shutdown()
+
 
 if __name__ == "__main__":
     unittest.main()
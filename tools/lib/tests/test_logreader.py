@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import bz2
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+
+from cereal import log as capnp_log
+from tools.lib.log_columns import read_columns
+from tools.lib.log_index import log_index_path
+from tools.lib.logreader import LogReader, MultiLogIterator
+from tools.lib.route_logreader import RouteLogReader
+
+SERVICES = ['carState', 'controlsState', 'logMessage']
+NUM_MSGS = 3000
+START_TIME = 1000
+
+
+def make_log(n=NUM_MSGS, start_time=START_TIME, dt=1):
+  msgs = []
+  for i in range(n):
+    which = SERVICES[i % len(SERVICES)]
+    m = capnp_log.Event.new_message(logMonoTime=start_time + i * dt)
+    if which == 'logMessage':
+      m.logMessage = "x" * (i % 50)
+    elif which == 'carState':
+      m.init(which)
+      m.carState.vEgo = i * 0.5
+      m.carState.steeringAngleDeg = -i
+      m.carState.cruiseState.speed = i % 30
+    else:
+      m.init(which)
+    msgs.append(m.to_bytes())
+  return b"".join(msgs)
+
+
+class TestLogReader(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.mkdtemp()
+    # the message index and column caches go here instead of ~/.commacache
+    cache_patch = patch("tools.lib.cache.DEFAULT_CACHE_DIR", os.path.join(self.tmp, "cache"))
+    cache_patch.start()
+    self.addCleanup(cache_patch.stop)
+
+    dat = make_log()
+    self.rlog = os.path.join(self.tmp, "rlog")
+    with open(self.rlog, "wb") as f:
+      f.write(dat)
+
+    # concatenated bz2 streams
+    self.rlog_bz2 = os.path.join(self.tmp, "rlog.bz2")
+    with open(self.rlog_bz2, "wb") as f:
+      f.write(bz2.compress(dat[:len(dat)//2]) + bz2.compress(dat[len(dat)//2:]))
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp)
+
+  def _check_events(self, ents):
+    self.assertEqual([e.logMonoTime for e in ents], list(range(START_TIME, START_TIME + NUM_MSGS)))
+    self.assertEqual([e.which() for e in ents[:len(SERVICES)]], SERVICES)
+
+  def test_stream_matches_eager(self):
+    for fn in (self.rlog, self.rlog_bz2):
+      self._check_events(list(LogReader(fn, cache_index=False)))
+      self._check_events(list(LogReader(fn, stream=True, cache_index=False)))
+
+  def test_index(self):
+    for fn in (self.rlog, self.rlog_bz2):
+      # eager reads only need the index when filtering
+      for lr in (LogReader(fn, stream=True, cache_index=False), LogReader(fn, cache_index=False, services=SERVICES)):
+        list(lr)
+        self.assertEqual(len(lr.index), NUM_MSGS)
+        self.assertEqual(list(lr.index.mono_times), list(range(START_TIME, START_TIME + NUM_MSGS)))
+        self.assertEqual([lr.index.services[w] for w in lr.index.which[:len(SERVICES)]], SERVICES)
+
+  def test_iter_from(self):
+    seek_time = START_TIME + NUM_MSGS // 2
+    for fn in (self.rlog, self.rlog_bz2):
+      # first pass writes the index, the second one seeks with it
+      for _ in range(2):
+        ents = list(LogReader(fn, stream=True, cache_index=True).iter_from(seek_time))
+        self.assertEqual(ents[0].logMonoTime, seek_time)
+        self.assertEqual(len(ents), NUM_MSGS // 2)
+
+  def test_services(self):
+    for fn in (self.rlog, self.rlog_bz2):
+      for stream in (True, False):
+        for cache_index in (True, False):
+          ents = list(LogReader(fn, stream=stream, cache_index=cache_index, services=['carState']))
+          self.assertEqual(len(ents), NUM_MSGS // len(SERVICES))
+          self.assertTrue(all(e.which() == 'carState' for e in ents))
+
+        ents = list(LogReader(fn, stream=stream, services=['controlsState']).iter_from(START_TIME + 100))
+        self.assertEqual(ents[0].logMonoTime, START_TIME + 100)
+        self.assertTrue(all(e.which() == 'controlsState' for e in ents))
+
+    with self.assertRaises(ValueError):
+      LogReader(self.rlog, services=['notAService'])
+
+  def test_cache_index(self):
+    index_path = log_index_path(self.rlog)
+    self.assertTrue(index_path.startswith(self.tmp))
+    for stream in (True, False):
+      list(LogReader(self.rlog, stream=stream, services=['carState']))
+      self.assertFalse(os.path.exists(index_path))
+    list(LogReader(self.rlog, stream=True, cache_index=True))
+    self.assertTrue(os.path.exists(index_path))
+
+  def test_multilog_services(self):
+    lr = MultiLogIterator([self.rlog, None, self.rlog_bz2], wraparound=False, services=['logMessage'])
+    self.assertEqual(lr.start_time, START_TIME)
+    ents = list(lr)
+    self.assertEqual(len(ents), 2 * NUM_MSGS // len(SERVICES))
+    self.assertTrue(all(e.which() == 'logMessage' for e in ents))
+
+  def test_multilog_seek(self):
+    # three one minute segments with a message every 100ms
+    log_paths = []
+    for seg in range(3):
+      log_paths.append(os.path.join(self.tmp, f"rlog_{seg}"))
+      with open(log_paths[-1], "wb") as f:
+        f.write(make_log(600, START_TIME + seg * int(60e9), int(1e8)))
+
+    lr = MultiLogIterator(log_paths, wraparound=False)
+    for ts in (0, 0.05, 59.95, 60., 75.04, 179.9):
+      self.assertTrue(lr.seek(ts))
+      self.assertAlmostEqual(lr.tell(), round(ts + 0.049, 1))
+      self.assertAlmostEqual((next(lr).logMonoTime - START_TIME) * 1e-9, round(ts + 0.049, 1))
+
+    self.assertFalse(lr.seek(180.))
+    self.assertTrue(lr.seek(179.95))
+    with self.assertRaises(StopIteration):
+      next(lr)
+
+  def test_route_logreader(self):
+    log_paths = [self.rlog, None, self.rlog_bz2, self.rlog]
+    for services in (None, ['carState', 'logMessage']):
+      expected = [e.as_builder().to_bytes() for e in MultiLogIterator(log_paths, wraparound=False, services=services)]
+      for in_flight in (1, 3):
+        ents = [e.as_builder().to_bytes() for e in RouteLogReader(log_paths, services, workers=2, in_flight=in_flight)]
+        self.assertEqual(ents, expected)
+
+  def test_columns(self):
+    idxs = np.arange(0, NUM_MSGS, len(SERVICES))
+    fields = ['logMonoTime', 'carState.vEgo', 'carState.steeringAngleDeg', 'carState.cruiseState.speed']
+    for fn in (self.rlog, self.rlog_bz2):
+      for columns in (LogReader(fn).columns(fields), read_columns(fn, fields), read_columns(fn, fields[1:3])):
+        if 'logMonoTime' in columns:
+          self.assertEqual(columns['logMonoTime'].dtype, np.uint64)
+          np.testing.assert_equal(columns['logMonoTime'], idxs + START_TIME)
+        self.assertEqual(columns['carState.vEgo'].dtype, np.float32)
+        np.testing.assert_equal(columns['carState.vEgo'], idxs * 0.5)
+        np.testing.assert_equal(columns['carState.steeringAngleDeg'], -idxs)
+
+    with self.assertRaises(ValueError):
+      read_columns(self.rlog, ['carState.vEgo', 'controlsState.vCruise'])
+    with self.assertRaises(ValueError):
+      read_columns(self.rlog, ['carState.canMonoTimes'])
+
+
+if __name__ == "__main__":
+  unittest.main()
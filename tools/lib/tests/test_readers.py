@@ -1,12 +1,31 @@
 #!/usr/bin/env python
+import subprocess
 import unittest
 import requests
 import tempfile
 
 from collections import defaultdict
 import numpy as np
-from tools.lib.framereader import FrameReader
+from tools.lib.framereader import DataUnreadableError, FrameCache, FrameReader, GOPDecoderPool, \
+                                  decompress_video_data, hevc_picture_count
 from tools.lib.logreader import LogReader
+from tools.lib.video_index import VideoIndex
+
+GOP_SIZE = 5
+
+
+def encode_gops(num_gops, w=64, h=48):
+  """A low delay HEVC stream from ffmpeg's test source, split into GOPs that start with the parameter sets."""
+  dat = subprocess.check_output(
+    ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", f"testsrc=size={w}x{h}:rate=20",
+     "-frames:v", str(num_gops * GOP_SIZE), "-c:v", "libx265",
+     "-x265-params", f"log-level=none:keyint={GOP_SIZE}:min-keyint={GOP_SIZE}:scenecut=0:bframes=0:repeat-headers=1",
+     "-f", "hevc", "pipe:1"])
+
+  # split before each VPS
+  starts = [i for i in range(len(dat) - 3) if dat[i:i+3] == b"\x00\x00\x01" and (dat[i+3] >> 1) & 0x3f == 32]
+  starts = [i - 1 if i > 0 and dat[i-1] == 0 else i for i in starts]
+  return [dat[b:e] for b, e in zip(starts, starts[1:] + [len(dat)])]
 
 
 class TestReaders(unittest.TestCase):
@@ -63,5 +82,68 @@ class TestReaders(unittest.TestCase):
     fr_url = FrameReader("https://github.com/commaai/comma2k19/blob/master/Example_1/b0c9d2329ad1606b%7C2018-08-02--08-34-47/40/video.hevc?raw=true")
     _check_data(fr_url)
 
+  def test_frame_cache(self):
+    def gop(frame_b):
+      return np.full((10, 100), frame_b, dtype=np.uint8)
+
+    cache = FrameCache(3000)
+    for frame_b in (0, 10, 20):
+      self.assertEqual(cache.put(frame_b, "yuv420p", gop(frame_b)), 0)
+    self.assertEqual(cache.get(15, "yuv420p")[0], 10)
+    self.assertIsNone(cache.get(15, "rgb24"))
+
+    # least recently used goes first
+    self.assertEqual(cache.put(30, "yuv420p", gop(30)), 1000)
+    self.assertNotIn((0, "yuv420p"), cache)
+    self.assertIn((15, "yuv420p"), cache)
+
+    # unless it's in the window about to be read
+    cache.get(25, "yuv420p")
+    self.assertEqual(cache.put(40, "yuv420p", gop(40), keep=(10, 30)), 1000)
+    self.assertNotIn((30, "yuv420p"), cache)
+    self.assertIn((10, "yuv420p"), cache)
+    self.assertEqual(cache.nbytes, 3000)
+
+  def test_gop_decoder(self):
+    gops = encode_gops(4)
+    self.assertEqual(len(gops), 4)
+    expected = [decompress_video_data(gop, "hevc", 64, 48, "yuv420p") for gop in gops]
+    for gop, frames in zip(gops, expected):
+      self.assertEqual(hevc_picture_count(gop), GOP_SIZE)
+      self.assertEqual(len(frames), GOP_SIZE)
+
+    pool = GOPDecoderPool(1)
+    # out of order, like seeking around
+    for i in (0, 1, 3, 2, 2, 0):
+      np.testing.assert_equal(pool.decode(gops[i], GOP_SIZE, "hevc", 64, 48, "yuv420p"), expected[i])
+    decoder = pool._idle[0][1]
+
+    # a frame count that doesn't match the GOP replaces the decoder
+    for num_frames in (GOP_SIZE - 1, GOP_SIZE + 1):
+      with self.assertRaises(DataUnreadableError):
+        pool.decode(gops[1], num_frames, "hevc", 64, 48, "yuv420p")
+      self.assertEqual(len(pool._idle), 0)
+      np.testing.assert_equal(pool.decode(gops[1], GOP_SIZE, "hevc", 64, 48, "yuv420p"), expected[1])
+      self.assertIsNot(pool._idle[0][1], decoder)
+      decoder = pool._idle[0][1]
+    decoder.close()
+
+  def test_video_index(self):
+    index = np.array([[2, 0], [1, 100], [1, 150], [0xFFFFFFFF, 180]], dtype=np.uint32)
+    vi = VideoIndex(index, b"prefix", 1164, 874)
+
+    with tempfile.NamedTemporaryFile() as fp:
+      vi.save(fp.name, 180)
+      loaded = VideoIndex.load(fp.name, 180)
+      np.testing.assert_equal(loaded.index, index)
+      self.assertEqual(bytes(loaded.prefix), b"prefix")
+      self.assertEqual((loaded.w, loaded.h), (1164, 874))
+
+      # the video changed since it was indexed
+      self.assertIsNone(VideoIndex.load(fp.name, 181))
+
+    self.assertIsNone(VideoIndex.load("/does/not/exist"))
+    self.assertIsNone(VideoIndex.from_buffer(b"garbage"))
+
 if __name__ == "__main__":
   unittest.main()
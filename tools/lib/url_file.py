@@ -6,6 +6,7 @@ import tempfile
 import threading
 import urllib.parse
 import pycurl
+from concurrent.futures import ThreadPoolExecutor
 from hashlib import sha256
 from io import BytesIO
 from tenacity import retry, wait_random_exponential, stop_after_attempt
@@ -15,6 +16,20 @@ K = 1000
 CHUNK_SIZE = 1000 * K
 
 CACHE_DIR = os.environ.get("COMMA_CACHE", "/tmp/comma_download_cache/")
+#  Least recently used chunks are evicted once the cache grows past this many bytes
+CACHE_MAX_SIZE = int(os.environ.get("COMMA_CACHE_MAX_SIZE", str(10 * 1000 * 1000 * K)))
+#  The cache size is only checked again after this many bytes were downloaded into it
+CACHE_EVICT_INTERVAL = 100 * CHUNK_SIZE
+
+#  Connections shared by all URLFiles for fetching chunks concurrently
+DOWNLOAD_THREADS = int(os.environ.get("COMMA_DOWNLOAD_THREADS", "8"))
+#  Chunks fetched in the background past the end of a sequential read
+READAHEAD_CHUNKS = 4
+
+_download_pool = None
+_downloads = {}  # chunk path -> Future of the chunk being fetched
+_downloads_lock = threading.Lock()
+_cache_written = CACHE_EVICT_INTERVAL
 
 
 def hash_256(link):
@@ -22,6 +37,49 @@ def hash_256(link):
   return hsh
 
 
+def _get_download_pool():
+  global _download_pool
+  with _downloads_lock:
+    if _download_pool is None:
+      _download_pool = ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS)
+    return _download_pool
+
+
+def evict_cache(max_size=None):
+  """Deletes the least recently used files in CACHE_DIR until it holds at most max_size bytes."""
+  if max_size is None:
+    max_size = CACHE_MAX_SIZE
+
+  entries = []
+  for entry in os.scandir(CACHE_DIR):
+    try:
+      if entry.is_file():
+        st = entry.stat()
+        entries.append((st.st_mtime, st.st_size, entry.path))
+    except FileNotFoundError:
+      pass
+
+  total = sum(e[1] for e in entries)
+  for _, size, path in sorted(entries):
+    if total <= max_size:
+      break
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+    total -= size
+
+
+def _cache_write_done(size):
+  global _cache_written
+  with _downloads_lock:
+    _cache_written += size
+    if _cache_written < CACHE_EVICT_INTERVAL:
+      return
+    _cache_written = 0
+  evict_cache()
+
+
 class URLFile(object):
   _tlocal = threading.local()
 
@@ -31,16 +89,22 @@ class URLFile(object):
     self._length = None
     self._local_file = None
     self._debug = debug
+    self._last_read_end = None
     #  True by default, false if FILEREADER_CACHE is defined, but can be overwritten by the cache input
     self._force_download = not int(os.environ.get("FILEREADER_CACHE", "0"))
     if cache is not None:
       self._force_download = not cache
 
+    mkdirs_exists_ok(CACHE_DIR)
+
+  @property
+  def _curl(self):
+    #  One handle per thread, reused across files to keep connections alive
     try:
-      self._curl = self._tlocal.curl
+      return self._tlocal.curl
     except AttributeError:
-      self._curl = self._tlocal.curl = pycurl.Curl()
-    mkdirs_exists_ok(CACHE_DIR)
+      self._tlocal.curl = pycurl.Curl()
+      return self._tlocal.curl
 
   def __enter__(self):
     return self
@@ -81,44 +145,101 @@ class URLFile(object):
         file_length.write(str(self._length))
     return self._length
 
+  def _chunk_path(self, position):
+    chunk_number = position / CHUNK_SIZE
+    return os.path.join(CACHE_DIR, hash_256(self._url) + "_" + str(chunk_number))
+
+  def _fetch_chunk(self, position, path):
+    try:
+      if not os.path.exists(path):
+        data = self._read_range(position, CHUNK_SIZE)
+        with atomic_write_in_dir(path, mode="wb", overwrite=True) as new_cached_file:
+          new_cached_file.write(data)
+        _cache_write_done(len(data))
+    finally:
+      with _downloads_lock:
+        _downloads.pop(path, None)
+
+  def _submit_chunk(self, position):
+    path = self._chunk_path(position)
+    with _downloads_lock:
+      fut = _downloads.get(path)
+    if fut is None:
+      pool = _get_download_pool()
+      with _downloads_lock:
+        fut = _downloads.get(path)
+        if fut is None:
+          fut = _downloads[path] = pool.submit(self._fetch_chunk, position, path)
+    return fut
+
+  def _read_chunk_into(self, position, offset, view):
+    path = self._chunk_path(position)
+    with open(path, "rb") as cached_file:
+      cached_file.seek(offset)
+      n = cached_file.readinto(view)
+    #  mtime is the clock for LRU eviction
+    os.utime(path)
+    return n
+
   def read(self, ll=None):
     if self._force_download:
       return self.read_aux(ll=ll)
 
     file_begin = self._pos
-    file_end = self._pos + ll if ll is not None else self.get_length()
+    file_end = min(self._pos + ll, self.get_length()) if ll is not None else self.get_length()
     #  We have to allign with chunks we store. Position is the begginiing of the latest chunk that starts before or at our file
-    position = (file_begin // CHUNK_SIZE) * CHUNK_SIZE
-    response = b""
-    while True:
-      self._pos = position
-      chunk_number = self._pos / CHUNK_SIZE
-      file_name = hash_256(self._url) + "_" + str(chunk_number)
-      full_path = os.path.join(CACHE_DIR, str(file_name))
-      data = None
-      #  If we don't have a file, download it
-      if not os.path.exists(full_path):
-        data = self.read_aux(ll=CHUNK_SIZE)
-        with atomic_write_in_dir(full_path, mode="wb") as new_cached_file:
-          new_cached_file.write(data)
-      else:
-        with open(full_path, "rb") as cached_file:
-          data = cached_file.read()
-
-      response += data[max(0, file_begin - position): min(CHUNK_SIZE, file_end - position)]
+    positions = range((file_begin // CHUNK_SIZE) * CHUNK_SIZE, file_end, CHUNK_SIZE)
+
+    #  Fetch all missing chunks at once, and keep reading ahead if this read continues the previous one
+    pending = {p: self._submit_chunk(p) for p in positions if not os.path.exists(self._chunk_path(p))}
+    if self._last_read_end == file_begin and len(positions):
+      readahead_end = min(positions[-1] + (READAHEAD_CHUNKS + 1) * CHUNK_SIZE, self.get_length())
+      for p in range(positions[-1] + CHUNK_SIZE, readahead_end, CHUNK_SIZE):
+        if not os.path.exists(self._chunk_path(p)):
+          self._submit_chunk(p)
+
+    response = bytearray(file_end - file_begin)
+    read = 0
+    with memoryview(response) as view:
+      for position in positions:
+        if position in pending:
+          pending[position].result()
+
+        chunk_begin = max(file_begin, position)
+        chunk_end = min(file_end, position + CHUNK_SIZE)
+        with view[chunk_begin - file_begin:chunk_end - file_begin] as dest:
+          try:
+            n = self._read_chunk_into(position, chunk_begin - position, dest)
+          except FileNotFoundError:
+            #  evicted in the meantime
+            self._submit_chunk(position).result()
+            n = self._read_chunk_into(position, chunk_begin - position, dest)
+
+        read += n
+        if n < chunk_end - chunk_begin:
+          #  file shorter than its reported length
+          break
+
+    del response[read:]
+    self._pos = file_begin + read
+    self._last_read_end = self._pos
+    return bytes(response)
 
-      position += CHUNK_SIZE
-      if position >= file_end:
-        self._pos = file_end
-        return response
+  def read_aux(self, ll=None):
+    if self._pos == 0 and ll is None:
+      ret = self._read_range(0, None)
+    else:
+      ret = self._read_range(self._pos, ll if ll is not None else self.get_length() - self._pos)
+    self._pos += len(ret)
+    return ret
 
   @retry(wait=wait_random_exponential(multiplier=1, max=5), stop=stop_after_attempt(3), reraise=True)
-  def read_aux(self, ll=None):
+  def _read_range(self, start, ll=None):
     download_range = False
     headers = ["Connection: keep-alive"]
-    if self._pos != 0 or ll is not None:
-      end = (self._pos + ll if ll is not None else self.get_length()) - 1
-      headers.append(f"Range: bytes={self._pos}-{end}")
+    if ll is not None:
+      end = start + ll - 1
+      headers.append(f"Range: bytes={start}-{end}")
       download_range = True
 
     dats = BytesIO()
@@ -161,9 +282,7 @@ class URLFile(object):
     if (not download_range) and response_code != 200:  # OK
       raise Exception(f"Error {response_code} {headers} ({self._url}): {repr(dats.getvalue())[:500]}")
 
-    ret = dats.getvalue()
-    self._pos += len(ret)
-    return ret
+    return dats.getvalue()
 
   def seek(self, pos):
     self._pos = pos
@@ -0,0 +1,73 @@
+import os
+import struct
+import numpy as np
+
+from tools.lib.cache import cache_path_for_file_path
+from tools.lib.file_helpers import atomic_write_in_dir
+from tools.lib.filereader import map_file
+
+VIDEO_INDEX_MAGIC = b"VIDX"
+VIDEO_INDEX_VERSION = 1
+
+# magic, version, width, height, index rows, prefix size, size of the indexed video
+_HEADER = struct.Struct("<4sIIIIIq")
+
+
+class VideoIndex:
+  """Frame types and byte offsets of a video, with the prefix to decode a GOP on its own.
+
+     index has one (frame type, offset) row per frame plus a (0xFFFFFFFF, file size) terminator.
+     Saved as a fixed header followed by the raw index table and the prefix, so loading is a
+     read-only mmap that any number of processes can share.
+  """
+  def __init__(self, index, prefix, w, h):
+    self.index = index
+    self.prefix = prefix
+    self.w = w
+    self.h = h
+
+  def to_bytes(self, source_size=-1):
+    index = np.ascontiguousarray(self.index, dtype=np.uint32)
+    header = _HEADER.pack(VIDEO_INDEX_MAGIC, VIDEO_INDEX_VERSION, self.w, self.h,
+                          index.shape[0], len(self.prefix), source_size)
+    return b"".join([header, index.tobytes(), bytes(self.prefix)])
+
+  def save(self, path, source_size=-1):
+    with atomic_write_in_dir(path, mode="wb", overwrite=True) as f:
+      f.write(self.to_bytes(source_size))
+
+  @classmethod
+  def from_buffer(cls, buf, source_size=-1):
+    """Returns the index stored in buf without copying it, or None if it is invalid or stale."""
+    if len(buf) < _HEADER.size:
+      return None
+    magic, version, w, h, rows, prefix_size, indexed_size = _HEADER.unpack_from(buf, 0)
+    if magic != VIDEO_INDEX_MAGIC or version != VIDEO_INDEX_VERSION or indexed_size != source_size:
+      return None
+    prefix_offset = _HEADER.size + rows * 8
+    if len(buf) != prefix_offset + prefix_size:
+      return None
+
+    index = np.frombuffer(buf, dtype=np.uint32, count=rows * 2, offset=_HEADER.size).reshape(-1, 2)
+    prefix = memoryview(buf)[prefix_offset:]
+    return cls(index, prefix, w, h)
+
+  @classmethod
+  def load(cls, path, source_size=-1):
+    """Returns the index stored at path, or None if it is missing or stale."""
+    try:
+      buf = map_file(path)
+    except FileNotFoundError:
+      return None
+    return cls.from_buffer(buf, source_size)
+
+
+def video_index_path(fn, cache_prefix=None):
+  return cache_path_for_file_path(fn, cache_prefix) + "_vidindex"
+
+
+def video_source_size(fn):
+  # remote videos are immutable once uploaded, only local ones can change under the index
+  if fn.startswith("http://") or fn.startswith("https://"):
+    return -1
+  return os.path.getsize(fn)
@@ -132,7 +132,7 @@ class UnloggerWorker(object):
     if route is None or (isinstance(cmd, SetRoute) and route.name != cmd.name):
       seek_to = cmd.start_time
       route = Route(cmd.name, cmd.data_dir)
-      self._lr = MultiLogIterator(route.log_paths(), wraparound=True)
+      self._lr = MultiLogIterator(route.log_paths(), wraparound=True, cache_index=True)
       if self._frame_reader is not None:
         self._frame_reader.close()
       if "roadCameraState" in pub_types or "roadEncodeIdx" in pub_types: